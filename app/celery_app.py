@@ -0,0 +1,36 @@
+"""
+Celery application shared by the API (producer) and the worker.
+
+This module only configures the broker; it registers no tasks and imports
+none of the AI or PDF code, so the API can enqueue by task name with
+``send_task`` without loading the worker's dependencies.
+"""
+import os
+from celery import Celery
+from kombu import Queue
+
+from app.dispatch import QUEUE_PREFIX, SIZE_CLASSES
+
+# Celery configuration
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+celery_app = Celery(
+    "essay_polisher",
+    broker=REDIS_URL,
+    backend=REDIS_URL,
+)
+
+celery_app.conf.update(
+    task_serializer="json",
+    accept_content=["json"],
+    result_serializer="json",
+    timezone="UTC",
+    enable_utc=True,
+    # One queue per essay size class (see app/dispatch.py); "celery" keeps
+    # process_batch and anything sent without a queue
+    task_queues=[Queue("celery")] + [Queue(f"{QUEUE_PREFIX}.{c}") for c in SIZE_CLASSES],
+    task_default_queue="celery",
+    # Honour message priority within each queue on the Redis broker
+    broker_transport_options={"priority_steps": list(range(10)), "queue_order_strategy": "priority"},
+    # Do not let a worker hoard long essays it cannot start yet
+    worker_prefetch_multiplier=1,
+)
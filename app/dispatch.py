@@ -0,0 +1,175 @@
+"""
+Task dispatch for the API, independent of the execution backend.
+
+TASK_BACKEND selects where submitted essays are processed:
+
+- ``celery`` (default): messages go to Redis and ``app/worker.py`` runs them.
+- ``embedded``: an in-process asyncio job runner started with the API; no
+  Redis or worker process needed (see app/services/job_runner.py).
+
+Every task is classified at submit time by its estimated token count into a
+size class (``short``, ``standard`` or ``long``). Under Celery each class
+has its own queue (``essays.short`` ...), so workers can be reserved for
+short essays; the embedded runner keeps reserved coroutines for them.
+Queue wait is recorded per class as ``queue.<class>.*`` metrics.
+"""
+import os
+import time
+import logging
+from typing import Dict, List, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+TASK_BACKEND = os.getenv("TASK_BACKEND", "celery")  # celery / embedded
+
+# Size classes by estimated tokens (about 4 characters per token of English)
+SHORT_MAX_TOKENS = int(os.getenv("SHORT_MAX_TOKENS", "800"))
+LONG_MIN_TOKENS = int(os.getenv("LONG_MIN_TOKENS", "3000"))
+SIZE_CLASSES = ("short", "standard", "long")
+QUEUE_PREFIX = os.getenv("QUEUE_PREFIX", "essays")
+
+_job_runner = None
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of an English text."""
+    return max(1, len(text) // 4)
+
+
+def size_class_for(text: str) -> str:
+    """
+    Classify an essay by estimated token count.
+
+    Args:
+        text: Essay text
+
+    Returns:
+        str: "short", "standard" or "long"
+    """
+    return size_class_for_tokens(estimate_tokens(text))
+
+
+def size_class_for_tokens(tokens: int) -> str:
+    """Size class of an essay with the given estimated token count."""
+    if tokens <= SHORT_MAX_TOKENS:
+        return "short"
+    if tokens >= LONG_MIN_TOKENS:
+        return "long"
+    return "standard"
+
+
+def queue_for(size_class: str) -> str:
+    """Celery queue name of a size class."""
+    return f"{QUEUE_PREFIX}.{size_class}"
+
+
+def celery_priority(priority: int) -> int:
+    """Map task priority (0-9, higher first) to Celery's Redis priority (0 first)."""
+    return 9 - max(0, min(9, priority))
+
+
+def record_queue_wait(size_class: str, wait_seconds: float) -> None:
+    """Record how long a task waited in its queue before a worker started it."""
+    from app.services import metrics
+
+    metrics.incr(f"queue.{size_class}.tasks")
+    metrics.incr(f"queue.{size_class}.wait_seconds", max(0.0, wait_seconds))
+
+
+def get_queue_stats() -> Dict[str, dict]:
+    """Tasks started and mean queue wait per size class (for /metrics)."""
+    from app.services import metrics
+
+    counters = metrics.snapshot("queue.")
+    stats = {}
+    for size_class in SIZE_CLASSES:
+        tasks = counters.get(f"queue.{size_class}.tasks", 0)
+        wait = counters.get(f"queue.{size_class}.wait_seconds", 0)
+        stats[size_class] = {
+            "tasks": tasks,
+            "mean_wait_seconds": round(wait / tasks, 3) if tasks else None,
+        }
+    return stats
+
+
+def get_job_runner():
+    """Return the embedded job runner (None unless TASK_BACKEND=embedded and started)."""
+    return _job_runner
+
+
+async def start() -> None:
+    """Start the execution backend (API startup hook)."""
+    global _job_runner
+    if TASK_BACKEND == "embedded":
+        from app.database import AsyncSessionLocal
+        from app.services.job_runner import EmbeddedJobRunner
+
+        _job_runner = EmbeddedJobRunner(AsyncSessionLocal)
+        await _job_runner.start()
+    elif TASK_BACKEND == "celery":
+        # Producer-only client: loads Celery and kombu, not the worker's AI/PDF stack
+        import app.celery_app  # noqa: F401
+    else:
+        raise ValueError(f"Unknown TASK_BACKEND: {TASK_BACKEND}")
+    logger.info(f"Task backend: {TASK_BACKEND}")
+
+
+async def stop() -> None:
+    """Stop the execution backend (API shutdown hook)."""
+    if _job_runner is not None:
+        await _job_runner.stop()
+
+
+async def enqueue_task(task_id: int, priority: int = 0, size_class: str = "standard") -> None:
+    """
+    Dispatch one committed task for processing.
+
+    Args:
+        task_id: Task ID
+        priority: Higher runs first
+        size_class: Size class from size_class_for()
+    """
+    if TASK_BACKEND == "embedded":
+        _job_runner.enqueue(task_id, priority, size_class)
+        return
+
+    from app.celery_app import celery_app
+
+    # The task row is committed before dispatch, so no countdown is needed
+    celery_app.send_task(
+        "process_submission",
+        args=[task_id],
+        kwargs={"size_class": size_class, "enqueued_at": time.time()},
+        queue=queue_for(size_class),
+        priority=celery_priority(priority),
+    )
+
+
+async def enqueue_batch(
+    task_ids: List[int],
+    priorities: Optional[List[int]] = None,
+    size_classes: Optional[List[str]] = None,
+) -> None:
+    """
+    Dispatch many committed tasks at once.
+
+    Args:
+        task_ids: Task IDs
+        priorities: Per-task priorities, defaults to 0
+        size_classes: Per-task size classes, defaults to "standard"
+    """
+    priorities = priorities or [0] * len(task_ids)
+    size_classes = size_classes or ["standard"] * len(task_ids)
+    if TASK_BACKEND == "embedded":
+        for task_id, priority, size_class in zip(task_ids, priorities, size_classes):
+            _job_runner.enqueue(task_id, priority, size_class)
+        return
+
+    from app.celery_app import celery_app
+
+    celery_app.send_task(
+        "process_batch",
+        args=[task_ids],
+        kwargs={"priorities": priorities, "size_classes": size_classes, "enqueued_at": time.time()},
+    )
@@ -2,16 +2,28 @@
 FastAPI application entry point.
 """
 import os
+import uuid
+import asyncio
 import logging
-from pathlib import Path
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.responses import FileResponse
+from typing import Optional, Tuple
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Response, status
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from app.database import get_db, init_db
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import load_only
+from app.database import AsyncSessionLocal, get_db, init_db
 from app.models import Task
-from app.schemas import TaskCreate, TaskResponse
-from app.worker import celery_app
+from app.schemas import BatchCreate, BatchCreateResponse, BatchStatusResponse, TaskCreate, TaskResponse
+from app import dispatch
+from app.services import metrics
+from app.services.cache_service import get_cache_stats
+from app.services.dead_letter import dead_letter_count, list_dead_letters
+from app.services.hedging import get_hedge_stats
+from app.services.llm_router import LLM_PROVIDERS, get_llm_stats
+from app.services.notifier import get_event_hub
+from app.services.pdf_cache import PDF_PRERENDER, ensure_task_pdf, prerender_loop
+from app.services.rate_limit import get_provider_stats
 
 # Configure logging
 logging.basicConfig(
@@ -20,6 +32,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+TERMINAL_STATUSES = ("completed", "failed")
+MAX_STATUS_WAIT = 60
+SSE_HEARTBEAT_SECONDS = 15
+
 # Initialize FastAPI app
 app = FastAPI(
     title="AI English Essay Polisher",
@@ -27,6 +43,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Compress larger responses (status responses that include the report)
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
 
 @app.on_event("startup")
 async def startup_event() -> None:
@@ -34,12 +53,26 @@ async def startup_event() -> None:
     logger.info("Initializing database...")
     await init_db()
     logger.info("Database initialized")
+    
+    if PDF_PRERENDER:
+        app.state.prerender_task = asyncio.create_task(prerender_loop(AsyncSessionLocal))
+    
+    # Subscribe to worker task events for long-polling and SSE
+    get_event_hub().start()
+    
+    # Start the embedded job runner when TASK_BACKEND=embedded
+    await dispatch.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event() -> None:
     """Cleanup on shutdown."""
     logger.info("Shutting down...")
+    prerender_task = getattr(app.state, "prerender_task", None)
+    if prerender_task:
+        prerender_task.cancel()
+    await get_event_hub().stop()
+    await dispatch.stop()
 
 
 @app.post("/submit", response_model=TaskResponse, status_code=status.HTTP_201_CREATED)
@@ -60,10 +93,20 @@ async def submit_essay(
     try:
         logger.info(f"Received essay submission, text length: {len(task_data.original_text)}")
         
+        if task_data.parent_task_id is not None:
+            parent = await db.get(Task, task_data.parent_task_id)
+            if not parent:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Parent task {task_data.parent_task_id} not found"
+                )
+        
         # Create task in database
         task = Task(
             original_text=task_data.original_text,
             context=task_data.context,
+            parent_task_id=task_data.parent_task_id,
+            priority=task_data.priority,
             status="processing"
         )
         
@@ -73,24 +116,24 @@ async def submit_essay(
         
         logger.info(f"Created task {task.id}")
         
-        # Trigger Celery task
-        celery_app.send_task(
-            "process_submission",
-            args=[task.id],
-            countdown=1  # Start after 1 second
-        )
+        # Hand the task to the configured backend (Celery or embedded),
+        # routed by estimated length
+        await dispatch.enqueue_task(task.id, task.priority, dispatch.size_class_for(task.original_text))
         
-        logger.info(f"Triggered Celery task for task {task.id}")
+        logger.info(f"Dispatched task {task.id} to {dispatch.TASK_BACKEND} backend")
         
         return TaskResponse(
             id=task.id,
             original_text=task.original_text,
             context=task.context,
             status=task.status,
+            parent_task_id=task.parent_task_id,
             report_json=None,
             pdf_path=None
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error submitting essay: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -99,44 +142,222 @@ async def submit_essay(
         )
 
 
-@app.get("/status/{task_id}", response_model=TaskResponse)
+@app.post("/submit/batch", response_model=BatchCreateResponse, status_code=status.HTTP_201_CREATED)
+async def submit_batch(
+    batch_data: BatchCreate,
+    db: AsyncSession = Depends(get_db)
+) -> BatchCreateResponse:
+    """
+    Submit many essays in one request.
+    
+    All tasks are inserted in a single transaction with one bulk INSERT and
+    enqueued with a single broker message (expanded into a Celery group by
+    the worker).
+    
+    Args:
+        batch_data: Essays to analyze
+        db: Database session
+    
+    Returns:
+        BatchCreateResponse: Batch ID and the created task IDs, in input order
+    """
+    try:
+        items = batch_data.items
+        logger.info(f"Received batch submission with {len(items)} essays")
+        
+        parent_ids = {item.parent_task_id for item in items if item.parent_task_id is not None}
+        if parent_ids:
+            result = await db.execute(select(Task.id).where(Task.id.in_(parent_ids)))
+            missing = parent_ids - set(result.scalars().all())
+            if missing:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Parent tasks not found: {sorted(missing)}"
+                )
+        
+        batch_id = uuid.uuid4().hex
+        result = await db.execute(
+            insert(Task).returning(Task.id, sort_by_parameter_order=True),
+            [
+                {
+                    "original_text": item.original_text,
+                    "context": item.context,
+                    "parent_task_id": item.parent_task_id,
+                    "batch_id": batch_id,
+                    "priority": item.priority,
+                    "status": "processing",
+                }
+                for item in items
+            ],
+        )
+        task_ids = list(result.scalars().all())
+        await db.commit()
+        
+        logger.info(f"Created batch {batch_id} with {len(task_ids)} tasks")
+        
+        await dispatch.enqueue_batch(
+            task_ids,
+            [item.priority for item in items],
+            [dispatch.size_class_for(item.original_text) for item in items],
+        )
+        
+        return BatchCreateResponse(batch_id=batch_id, task_ids=task_ids)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error submitting batch: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to submit batch: {str(e)}"
+        )
+
+
+@app.get("/batch/{batch_id}", response_model=BatchStatusResponse)
+async def get_batch_status(batch_id: str, db: AsyncSession = Depends(get_db)) -> BatchStatusResponse:
+    """
+    Get aggregate progress of a batch.
+    
+    Args:
+        batch_id: Batch ID returned by /submit/batch
+        db: Database session
+    
+    Returns:
+        BatchStatusResponse: Task counts per status
+    """
+    result = await db.execute(
+        select(Task.status, func.count()).where(Task.batch_id == batch_id).group_by(Task.status)
+    )
+    counts = {task_status: count for task_status, count in result.all()}
+    if not counts:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Batch {batch_id} not found"
+        )
+    
+    total = sum(counts.values())
+    finished = sum(counts.get(s, 0) for s in TERMINAL_STATUSES)
+    return BatchStatusResponse(batch_id=batch_id, total=total, counts=counts, done=finished == total)
+
+
+# Columns selectable through ?fields=; everything else is always returned
+HEAVY_FIELDS = ("original_text", "context", "report_json")
+_SLIM_COLUMNS = (Task.id, Task.status, Task.updated_at, Task.pdf_path, Task.parent_task_id)
+
+
+def _parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    """Validate a comma-separated ``fields`` selection (None means all heavy fields)."""
+    if fields is None:
+        return HEAVY_FIELDS
+    selected = tuple(f.strip() for f in fields.split(",") if f.strip())
+    unknown = [f for f in selected if f not in HEAVY_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(HEAVY_FIELDS)}"
+        )
+    return selected
+
+
+async def _load_task(db: AsyncSession, task_id: int, fields: Tuple[str, ...] = HEAVY_FIELDS) -> Task:
+    """
+    Load a task with only the slim columns plus the selected heavy fields.
+    
+    Always re-reads the row (bypasses the identity map) so repeated loads in
+    one session see the worker's updates.
+    """
+    result = await db.execute(
+        select(Task)
+        .where(Task.id == task_id)
+        .options(load_only(*_SLIM_COLUMNS, *(getattr(Task, f) for f in fields)))
+        .execution_options(populate_existing=True)
+    )
+    task = result.scalar_one_or_none()
+    if not task:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Task {task_id} not found"
+        )
+    return task
+
+
+def _task_response(task: Task, fields: Tuple[str, ...] = HEAVY_FIELDS) -> TaskResponse:
+    # Completed tasks always have a report, so the PDF is ready or can be
+    # rendered on demand
+    pdf_path = None
+    if task.status == "completed":
+        pdf_path = f"/download/{task.id}"
+    
+    return TaskResponse(
+        id=task.id,
+        status=task.status,
+        parent_task_id=task.parent_task_id,
+        pdf_path=pdf_path,
+        updated_at=task.updated_at,
+        **{f: getattr(task, f) for f in fields}
+    )
+
+
+def _task_etag(task: Task, fields: Tuple[str, ...]) -> str:
+    updated = task.updated_at.timestamp() if task.updated_at else 0
+    selection = "+".join(fields) or "slim"
+    return f'W/"{task.id}-{task.status}-{updated}-{selection}"'
+
+
+@app.get("/status/{task_id}", response_model=TaskResponse, response_model_exclude_unset=True)
 async def get_task_status(
     task_id: int,
+    wait: float = Query(0, ge=0, le=MAX_STATUS_WAIT, description="Long-poll: seconds to wait for completion"),
+    fields: Optional[str] = Query(
+        None,
+        description="Comma-separated heavy fields to include (original_text, context, report_json); "
+                    "empty for a slim id/status view. Defaults to all."
+    ),
+    if_none_match: Optional[str] = Header(None),
     db: AsyncSession = Depends(get_db)
-) -> TaskResponse:
+) -> Response:
     """
     Get task status and download link.
     
+    With ``wait`` > 0 the request is held until the task completes or fails
+    (woken by the worker's notification) or until ``wait`` seconds pass.
+    Responses carry an ETag; a matching ``If-None-Match`` gets 304 with no body.
+    
     Args:
         task_id: Task ID
+        wait: Maximum seconds to wait for a terminal status
+        fields: Heavy fields to include
+        if_none_match: ETag from a previous response
         db: Database session
     
     Returns:
-        TaskResponse: Task information with status and download link
+        Response: Task information with status and download link, or 304
     """
     try:
-        result = await db.execute(select(Task).where(Task.id == task_id))
-        task = result.scalar_one_or_none()
+        selected = _parse_fields(fields)
+        task = await _load_task(db, task_id, ())
         
-        if not task:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Task {task_id} not found"
-            )
+        if wait > 0 and task.status not in TERMINAL_STATUSES:
+            hub = get_event_hub()
+            deadline = asyncio.get_running_loop().time() + wait
+            async with hub.subscribe(task_id) as events:
+                # Re-check after subscribing so a change in between is not missed
+                task = await _load_task(db, task_id, ())
+                while task.status not in TERMINAL_STATUSES:
+                    remaining = deadline - asyncio.get_running_loop().time()
+                    if remaining <= 0:
+                        break
+                    await hub.next_event(events, remaining)
+                    task = await _load_task(db, task_id, ())
         
-        # Build download URL if PDF is ready
-        pdf_path = None
-        if task.status == "completed" and task.pdf_path:
-            pdf_path = f"/download/{task_id}"
+        etag = _task_etag(task, selected)
+        if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
         
-        return TaskResponse(
-            id=task.id,
-            original_text=task.original_text,
-            context=task.context,
-            status=task.status,
-            report_json=task.report_json,
-            pdf_path=pdf_path
-        )
+        if selected:
+            task = await _load_task(db, task_id, selected)
+        body = _task_response(task, selected).model_dump(mode="json", exclude_unset=True)
+        return JSONResponse(content=body, headers={"ETag": etag})
     
     except HTTPException:
         raise
@@ -148,6 +369,50 @@ async def get_task_status(
         )
 
 
+@app.get("/status/{task_id}/stream")
+async def stream_task_status(task_id: int, db: AsyncSession = Depends(get_db)) -> StreamingResponse:
+    """
+    Stream task status changes as Server-Sent Events.
+    
+    Sends a ``status`` event immediately and on every change, then closes
+    once the task completes or fails. Intermediate events carry the slim
+    status fields only; the final event includes the report.
+    
+    Args:
+        task_id: Task ID
+        db: Database session
+    
+    Returns:
+        StreamingResponse: ``text/event-stream`` of status events
+    """
+    await _load_task(db, task_id, ())
+    
+    async def event_stream():
+        hub = get_event_hub()
+        async with AsyncSessionLocal() as session, hub.subscribe(task_id) as events:
+            last_status = None
+            while True:
+                # Status columns only; the heavy fields are read once at the end
+                task = await _load_task(session, task_id, ())
+                if task.status in TERMINAL_STATUSES:
+                    task = await _load_task(session, task_id)
+                    payload = _task_response(task).model_dump_json(exclude_unset=True)
+                    yield f"event: status\ndata: {payload}\n\n"
+                    return
+                if task.status != last_status:
+                    last_status = task.status
+                    payload = _task_response(task, ()).model_dump_json(exclude_unset=True)
+                    yield f"event: status\ndata: {payload}\n\n"
+                if await hub.next_event(events, SSE_HEARTBEAT_SECONDS) is None:
+                    yield ": keep-alive\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/download/{task_id}")
 async def download_pdf(task_id: int, db: AsyncSession = Depends(get_db)) -> FileResponse:
     """
@@ -176,19 +441,14 @@ async def download_pdf(task_id: int, db: AsyncSession = Depends(get_db)) -> File
                 detail=f"Task {task_id} is not completed yet. Status: {task.status}"
             )
         
-        if not task.pdf_path:
+        # Renders on first download in lazy mode (or if the file was removed)
+        pdf_path = await ensure_task_pdf(db, task)
+        if not pdf_path:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"PDF not found for task {task_id}"
             )
         
-        pdf_path = Path(task.pdf_path)
-        if not pdf_path.exists():
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"PDF file not found at {pdf_path}"
-            )
-        
         return FileResponse(
             path=pdf_path,
             filename=f"essay_report_{task_id}.pdf",
@@ -205,6 +465,62 @@ async def download_pdf(task_id: int, db: AsyncSession = Depends(get_db)) -> File
         )
 
 
+def _backend_stats() -> dict:
+    runner = dispatch.get_job_runner()
+    stats = {"backend": dispatch.TASK_BACKEND}
+    if runner is not None:
+        stats.update(
+            pending=runner.pending,
+            running=runner.running,
+            concurrency=runner.concurrency,
+            short_workers=runner.short_workers,
+        )
+    return stats
+
+
+async def _llm_stats() -> dict:
+    calls = get_llm_stats()
+    return {
+        name: {**calls[name], **await get_provider_stats(name), "hedge": get_hedge_stats(name)}
+        for name in LLM_PROVIDERS
+    }
+
+
+@app.get("/metrics")
+async def get_metrics() -> dict:
+    """
+    Report service metrics aggregated across API and worker processes.
+    
+    Returns:
+        dict: Metrics grouped by subsystem
+    """
+    return {
+        "analysis_cache": get_cache_stats(),
+        "pdf_render": metrics.snapshot("pdf_render."),
+        "pdf_cache": metrics.snapshot("pdf_cache."),
+        "output_repair": metrics.snapshot("output_repair."),
+        "worker": metrics.snapshot("worker."),
+        "llm": await _llm_stats(),
+        "task_backend": _backend_stats(),
+        "queues": dispatch.get_queue_stats(),
+        "dead_letter": {"count": dead_letter_count()},
+    }
+
+
+@app.get("/dead-letter")
+async def get_dead_letters(limit: int = Query(50, ge=1, le=1000)) -> dict:
+    """
+    List tasks that failed permanently, newest first.
+    
+    Args:
+        limit: Maximum number of records to return
+    
+    Returns:
+        dict: Total count and the most recent records
+    """
+    return {"count": dead_letter_count(), "items": list_dead_letters(limit)}
+
+
 @app.get("/")
 async def root() -> dict:
     """Root endpoint."""
@@ -213,8 +529,13 @@ async def root() -> dict:
         "version": "1.0.0",
         "endpoints": {
             "submit": "POST /submit",
-            "status": "GET /status/{task_id}",
-            "download": "GET /download/{task_id}"
+            "submit_batch": "POST /submit/batch",
+            "batch": "GET /batch/{batch_id}",
+            "status": "GET /status/{task_id}?wait=N",
+            "status_stream": "GET /status/{task_id}/stream",
+            "download": "GET /download/{task_id}",
+            "metrics": "GET /metrics",
+            "dead_letter": "GET /dead-letter"
         }
     }
 
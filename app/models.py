@@ -3,7 +3,7 @@ SQLAlchemy ORM models for database tables.
 """
 from datetime import datetime
 from typing import Optional
-from sqlalchemy import Column, Integer, String, Text, JSON, DateTime
+from sqlalchemy import Column, Integer, String, Text, JSON, DateTime, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 
@@ -17,15 +17,27 @@ class Task(Base):
     id = Column(Integer, primary_key=True, index=True)
     original_text = Column(Text, nullable=False, comment="原始英文文本")
     context = Column(Text, nullable=True, comment="上下文信息")
+    parent_task_id = Column(
+        Integer,
+        ForeignKey("tasks.id"),
+        nullable=True,
+        index=True,
+        comment="上一版草稿的任务ID"
+    )
+    batch_id = Column(String(32), nullable=True, index=True, comment="批量提交ID")
     status = Column(
         String(20),
         nullable=False,
         default="processing",
+        index=True,
         comment="任务状态: processing/completed/failed"
     )
+    priority = Column(Integer, nullable=False, default=0, server_default="0", comment="优先级（越大越先处理）")
+    attempts = Column(Integer, nullable=False, default=0, server_default="0", comment="已尝试处理次数")
+    last_error = Column(Text, nullable=True, comment="最近一次失败的错误信息")
     report_json = Column(JSON, nullable=True, comment="完整的分析报告（JSON格式）")
     pdf_path = Column(String(500), nullable=True, comment="生成的PDF文件路径")
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True, comment="创建时间")
     updated_at = Column(
         DateTime(timezone=True),
         server_default=func.now(),
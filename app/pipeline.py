@@ -0,0 +1,109 @@
+"""
+Essay processing pipeline shared by all execution backends.
+
+Both the Celery worker (app/worker.py) and the embedded job runner
+(app/services/job_runner.py) call ``process_task`` with their own session
+factory; failure bookkeeping is left to the caller so each backend can apply
+its own retry policy.
+"""
+import logging
+from typing import Optional
+
+from sqlalchemy import select
+
+from app.models import Task
+from app.schemas import FullReport
+from app.services.ai_service import MAX_RETRIES, analyze_essay
+from app.services.notifier import publish_task_event
+from app.services.pdf_cache import PDF_RENDER_MODE, get_or_render_pdf
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+async def process_task(task_id: int, session_factory, max_retries: int = MAX_RETRIES) -> None:
+    """
+    Analyze a task's essay, render its PDF and store the results.
+
+    Args:
+        task_id: The task ID to process
+        session_factory: Async session factory for the tasks database
+        max_retries: Attempts per model call (1 when the backend retries the task)
+
+    Raises:
+        Exception: Any analysis or rendering error (the task is left as is)
+    """
+    async with session_factory() as session:
+        # Read task from database
+        result = await session.execute(select(Task).where(Task.id == task_id))
+        task = result.scalar_one_or_none()
+
+        if not task:
+            logger.error(f"Task {task_id} not found")
+            return
+
+        logger.info(f"Processing task {task_id}")
+
+        # Update status to processing
+        task.status = "processing"
+        await session.commit()
+        publish_task_event(task_id, task.status)
+
+        # Reuse the previous draft's analysis when this is a revision
+        parent_text = None
+        parent_report = None
+        if task.parent_task_id:
+            parent_result = await session.execute(select(Task).where(Task.id == task.parent_task_id))
+            parent = parent_result.scalar_one_or_none()
+            if parent and parent.status == "completed" and parent.report_json and parent.context == task.context:
+                parent_text = parent.original_text
+                parent_report = FullReport.model_validate(parent.report_json)
+                logger.info(f"Task {task_id} is a revision of task {parent.id}")
+
+        # Call AI service (async function in async context)
+        logger.info(f"Calling AI service for task {task_id}")
+        report: FullReport = await analyze_essay(
+            text=task.original_text,
+            context=task.context,
+            parent_text=parent_text,
+            parent_report=parent_report,
+            max_retries=max_retries
+        )
+
+        # Generate PDF in the render pool (keeps the event loop free);
+        # in lazy mode it is rendered on the first download instead
+        pdf_path = None
+        if PDF_RENDER_MODE != "lazy":
+            logger.info(f"Generating PDF for task {task_id}")
+            pdf_path = await get_or_render_pdf(report, task.original_text)
+            logger.info(f"PDF saved to {pdf_path}")
+
+        # Update task in database
+        task.status = "completed"
+        task.report_json = report.model_dump()
+        task.pdf_path = str(pdf_path) if pdf_path else None
+        task.last_error = None
+        await session.commit()
+        publish_task_event(task_id, task.status)
+
+        logger.info(f"Task {task_id} completed successfully")
+
+
+async def mark_task_failed(task_id: int, session_factory, error: Optional[str] = None) -> None:
+    """
+    Set a task's status to failed and record the error.
+
+    Args:
+        task_id: The task ID
+        session_factory: Async session factory for the tasks database
+        error: Error message to store in ``last_error``
+    """
+    async with session_factory() as session:
+        result = await session.execute(select(Task).where(Task.id == task_id))
+        task = result.scalar_one_or_none()
+        if task:
+            task.status = "failed"
+            if error is not None:
+                task.last_error = error[:2000]
+            await session.commit()
+            publish_task_event(task_id, task.status)
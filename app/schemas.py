@@ -1,7 +1,8 @@
 """
 Pydantic schemas for request/response validation and AI output parsing.
 """
-from typing import List, Optional
+from datetime import datetime
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field
 
 
@@ -20,20 +21,64 @@ class FullReport(BaseModel):
     polished_version: str = Field(..., description="润色后的完整文本")
 
 
+class ChunkReport(BaseModel):
+    """Analysis of one paragraph chunk of a long text."""
+    sentence_analysis: List[SentenceAnalysis] = Field(default_factory=list, description="该片段的句子级别分析列表")
+    polished_version: str = Field(..., description="润色后的片段文本")
+
+
+class GoalAnalysis(BaseModel):
+    """Whole-document writing goal analysis used by chunked mode."""
+    writing_goal_analysis: str = Field(..., description="写作目标分析")
+
+
+class SentenceBatch(BaseModel):
+    """Analysis of selected sentences, used when re-analyzing a revised draft."""
+    sentence_analysis: List[SentenceAnalysis] = Field(default_factory=list, description="句子级别分析列表")
+
+
+class PolishedText(BaseModel):
+    """Polished version only, used when re-analyzing a revised draft."""
+    polished_version: str = Field(..., description="润色后的完整文本")
+
+
 class TaskCreate(BaseModel):
     """Request schema for creating a new task."""
     original_text: str = Field(..., min_length=1, description="原始英文文本")
     context: Optional[str] = Field(None, description="上下文信息（如写作目标、受众等）")
+    parent_task_id: Optional[int] = Field(None, description="上一版草稿的任务ID（用于增量分析）")
+    priority: int = Field(0, ge=0, le=9, description="优先级 0-9，越大越先处理")
+
+
+class BatchCreate(BaseModel):
+    """Request schema for submitting many essays at once."""
+    items: List[TaskCreate] = Field(..., min_length=1, max_length=1000, description="待分析的作文列表")
+
+
+class BatchCreateResponse(BaseModel):
+    """Response schema for a batch submission."""
+    batch_id: str
+    task_ids: List[int]
+
+
+class BatchStatusResponse(BaseModel):
+    """Aggregate progress of a batch."""
+    batch_id: str
+    total: int
+    counts: Dict[str, int] = Field(default_factory=dict, description="各状态的任务数")
+    done: bool = Field(..., description="是否全部完成（成功或失败）")
 
 
 class TaskResponse(BaseModel):
-    """Response schema for task information."""
+    """Response schema for task information (heavy fields may be omitted)."""
     id: int
-    original_text: str
-    context: Optional[str]
+    original_text: Optional[str] = None
+    context: Optional[str] = None
     status: str
+    parent_task_id: Optional[int] = None
     report_json: Optional[dict] = None
     pdf_path: Optional[str] = None
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -1,29 +1,37 @@
 """
-AI service for essay analysis using LangChain and ZhipuAI.
+AI service for essay analysis using LangChain.
+
+Model calls go through the LLM router (app/services/llm_router.py), which
+picks ZhipuAI, DashScope, DeepSeek or a local stub per call.
 """
 import os
+import re
+import time
+import random
+import asyncio
+import difflib
 import logging
-from typing import Optional
+import contextvars
+from functools import lru_cache
+from typing import List, Optional, Tuple
 
 try:
     from langchain.prompts import ChatPromptTemplate
     from langchain.output_parsers import PydanticOutputParser
     from langchain_core.exceptions import OutputParserException
-    # Try different import paths for ChatZhipuAI
-    try:
-        from langchain.chat_models import ChatZhipuAI
-    except ImportError:
-        try:
-            from langchain_community.chat_models import ChatZhipuAI
-        except ImportError:
-            from langchain_zhipuai import ChatZhipuAI
 except ImportError as e:
     raise ImportError(
         "LangChain dependencies not installed. "
         "Please install: pip install langchain langchain-zhipuai"
     ) from e
 
-from app.schemas import FullReport
+from app.schemas import ChunkReport, FullReport, GoalAnalysis, PolishedText, SentenceAnalysis, SentenceBatch
+from app.services import metrics
+from app.services.cache_service import get_analysis_cache, make_cache_key
+from app.services.hedging import get_hedge_policy
+from app.services.llm_router import LLMProvider, get_router
+from app.services.output_repair import fields_schema, repair_json, validate_fields
+from app.services.rate_limit import ProviderUnavailableError, get_circuit_breaker, get_rate_limiter
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -33,38 +41,42 @@ class AIAnalysisFailedException(Exception):
     """Custom exception for AI analysis failures after retries."""
     pass
 
-# Initialize ZhipuAI model
-# Get API key from environment variable
-ZHIPU_API_KEY = os.getenv("ZHIPU_API_KEY", "")
-if not ZHIPU_API_KEY:
-    logger.warning("ZHIPU_API_KEY not found in environment variables")
 
-# Initialize ChatZhipuAI
-def _get_chat_model():
-    """Initialize ChatZhipuAI model with proper parameters."""
-    if not ZHIPU_API_KEY:
-        return None
-    
-    try:
-        # Try with zhipuai_api_key parameter
-        return ChatZhipuAI(
-            zhipuai_api_key=ZHIPU_API_KEY,
-            model="glm-4",  # Using GLM-4 model
-            temperature=0.7,
-        )
-    except TypeError:
-        # Fallback: try with api_key parameter
-        return ChatZhipuAI(
-            api_key=ZHIPU_API_KEY,
-            model="glm-4",
-            temperature=0.7,
-        )
+class ProviderCallError(Exception):
+    """A call to one provider failed; carries the provider so the retry can fail over."""
 
-chat_model = _get_chat_model()
+    def __init__(self, provider: str, error: Exception):
+        super().__init__(f"{provider}: {error}")
+        self.provider = provider
+        self.error = error
 
+# Bump whenever PROMPT_TEMPLATE or the FullReport schema changes so that
+# cached analyses produced by the old prompt are no longer served.
+PROMPT_VERSION = "1"
 
-# Create Pydantic Output Parser
+
+# Create Pydantic Output Parsers
 output_parser = PydanticOutputParser(pydantic_object=FullReport)
+chunk_output_parser = PydanticOutputParser(pydantic_object=ChunkReport)
+goal_output_parser = PydanticOutputParser(pydantic_object=GoalAnalysis)
+sentence_output_parser = PydanticOutputParser(pydantic_object=SentenceBatch)
+polish_output_parser = PydanticOutputParser(pydantic_object=PolishedText)
+
+# Long texts are split into paragraph chunks analyzed concurrently
+CHUNKING_THRESHOLD_CHARS = int(os.getenv("CHUNKING_THRESHOLD_CHARS", "3000"))
+CHUNK_TARGET_CHARS = int(os.getenv("CHUNK_TARGET_CHARS", "1500"))
+CHUNK_CONCURRENCY = int(os.getenv("CHUNK_CONCURRENCY", "4"))
+
+# Revised drafts reuse the parent's sentence analyses unless too much changed
+REVISION_MAX_CHANGED_RATIO = float(os.getenv("REVISION_MAX_CHANGED_RATIO", "0.5"))
+
+MAX_RETRIES = 3
+# Exponential backoff with full jitter between attempts
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "20"))
+
+# Recover unparseable output with a follow-up for just the broken fields
+OUTPUT_REPAIR_REASK = os.getenv("OUTPUT_REPAIR_REASK", "1") == "1"
 
 # Create Prompt Template
 PROMPT_TEMPLATE = """你是一位顶级的英文编辑专家，拥有丰富的英语写作和编辑经验。
@@ -84,13 +96,109 @@ PROMPT_TEMPLATE = """你是一位顶级的英文编辑专家，拥有丰富的
 {format_instructions}
 """
 
+CHUNK_PROMPT_TEMPLATE = """你是一位顶级的英文编辑专家，拥有丰富的英语写作和编辑经验。
+下面是一篇较长英文文本中的一个片段（第 {chunk_index}/{chunk_count} 段）。
+
+请仔细分析这个片段，并提供：
+1. 句子级别分析：逐句分析每句话的问题、修正建议和改进方向
+2. 润色版本：只润色这个片段，保持段落划分不变
+
+文本片段：
+{original_text}
+
+{context_section}
+
+请严格按照以下JSON格式输出分析结果：
+{format_instructions}
+"""
+
+GOAL_PROMPT_TEMPLATE = """你是一位顶级的英文编辑专家，拥有丰富的英语写作和编辑经验。
+请阅读以下英文文本，简要分析其写作目的、目标受众和整体结构（不需要逐句分析，也不需要润色）。
+
+原始文本：
+{original_text}
+
+{context_section}
+
+请严格按照以下JSON格式输出分析结果：
+{format_instructions}
+"""
+
+SENTENCE_PROMPT_TEMPLATE = """你是一位顶级的英文编辑专家，拥有丰富的英语写作和编辑经验。
+学生修改了一篇英文作文，下面列出的是新版本中改动过的句子（每行一句）。
+
+请对这些句子逐句分析，指出问题、给出修正建议和改进方向。
+每个句子都要输出一条分析，original 字段必须与给出的句子完全一致，顺序保持不变。
+
+改动的句子：
+{sentences}
+
+{context_section}
+
+请严格按照以下JSON格式输出分析结果：
+{format_instructions}
+"""
+
+POLISH_PROMPT_TEMPLATE = """你是一位顶级的英文编辑专家。
+请直接润色以下英文文本，输出完整的润色版本，不需要逐句分析。
+
+原始文本：
+{original_text}
+
+{context_section}
+
+请严格按照以下JSON格式输出分析结果：
+{format_instructions}
+"""
+
+REPAIR_PROMPT_TEMPLATE = """你是一位顶级的英文编辑专家。
+你之前针对下面这段英文文本输出的JSON结果中，以下字段缺失或格式不正确：
+{field_errors}
+
+原始文本：
+{source_text}
+
+{context_section}
+
+请只输出这些字段组成的一个JSON对象，不要输出其他字段或任何解释。字段的JSON Schema如下：
+{field_schema}
+"""
+
+
+# Prompt kinds: template text and the parser providing format instructions
+_PROMPTS = {
+    "full": (PROMPT_TEMPLATE, output_parser),
+    "chunk": (CHUNK_PROMPT_TEMPLATE, chunk_output_parser),
+    "goal": (GOAL_PROMPT_TEMPLATE, goal_output_parser),
+    "sentence": (SENTENCE_PROMPT_TEMPLATE, sentence_output_parser),
+    "polish": (POLISH_PROMPT_TEMPLATE, polish_output_parser),
+    "repair": (REPAIR_PROMPT_TEMPLATE, None),
+}
+
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "256"))
 
-def _build_prompt(context: Optional[str] = None) -> ChatPromptTemplate:
+
+@lru_cache(maxsize=None)
+def _base_prompt(kind: str) -> ChatPromptTemplate:
+    """Parse a prompt template and fill in its format instructions (once per kind)."""
+    template, parser = _PROMPTS[kind]
+    prompt = ChatPromptTemplate.from_template(template)
+    if parser is None:
+        return prompt
+    return prompt.partial(format_instructions=parser.get_format_instructions())
+
+
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def _build_prompt(context: Optional[str] = None, kind: str = "full") -> ChatPromptTemplate:
     """
     Build the prompt template with context.
     
+    Prompts are cached per (context, kind), so repeated contexts (the same
+    assignment brief for a whole class) reuse the built template.
+    
     Args:
         context: Optional context information about writing goals, audience, etc.
+        kind: Prompt kind, one of "full", "chunk", "goal", "sentence", "polish"
     
     Returns:
         ChatPromptTemplate: Configured prompt template
@@ -99,111 +207,331 @@ def _build_prompt(context: Optional[str] = None) -> ChatPromptTemplate:
     if context:
         context_section = f"\n上下文信息：\n{context}\n"
     
-    prompt = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
-    prompt = prompt.partial(
-        format_instructions=output_parser.get_format_instructions(),
-        context_section=context_section,
-    )
-    return prompt
+    return _base_prompt(kind).partial(context_section=context_section)
+
 
+def warm_up() -> None:
+    """Build every prompt kind, its format instructions and the provider clients ahead of the first task."""
+    for kind in _PROMPTS:
+        _build_prompt(None, kind)
+    providers = get_router().providers
+    for provider in providers:
+        provider.chat_model
+    names = ", ".join(f"{p.name} ({p.model})" for p in providers) or "no providers"
+    logger.info(f"AI service warmed up ({len(_PROMPTS)} prompt kinds, {names})")
 
-async def analyze_essay(text: str, context: Optional[str] = None) -> FullReport:
+
+def split_into_chunks(text: str, target_chars: int = CHUNK_TARGET_CHARS) -> List[str]:
     """
-    Analyze English essay using AI and return structured report.
+    Split text into chunks along paragraph boundaries.
+    
+    Consecutive paragraphs are packed together until a chunk reaches
+    ``target_chars``; a single paragraph longer than that forms its own chunk.
     
     Args:
-        text: The original English text to analyze
-        context: Optional context information (writing goals, audience, etc.)
+        text: Full essay text
+        target_chars: Preferred maximum chunk size in characters
     
     Returns:
-        FullReport: Structured analysis report
+        List[str]: Non-empty chunks, in document order
+    """
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    if len(paragraphs) <= 1:
+        # No blank-line separators: fall back to single line breaks
+        paragraphs = [p.strip() for p in text.splitlines() if p.strip()]
+    
+    chunks: List[str] = []
+    current: List[str] = []
+    current_len = 0
+    for paragraph in paragraphs:
+        if current and current_len + len(paragraph) > target_chars:
+            chunks.append("\n\n".join(current))
+            current, current_len = [], 0
+        current.append(paragraph)
+        current_len += len(paragraph) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff before retry number ``attempt``."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+
+
+async def _acquire_provider(exclude=()) -> LLMProvider:
+    """
+    Pick the best provider that may be called now and take a rate limit token for it.
+    
+    Providers are tried in the router's order, skipping those with an open
+    circuit; the first with a free token wins, otherwise the call waits for
+    a token from the best one.
+    
+    Args:
+        exclude: Names of providers that already failed this call
+    
+    Returns:
+        LLMProvider: The provider to call
     
     Raises:
-        ValueError: If API key is missing or text is empty
-        AIAnalysisFailedException: If AI analysis fails after max retries
+        ProviderUnavailableError: If every provider's circuit is open or no
+            token became available in time
     """
-    if not ZHIPU_API_KEY or not chat_model:
-        error_msg = "ZHIPU_API_KEY is not configured"
-        logger.error(error_msg)
-        raise ValueError(error_msg)
+    router = get_router()
+    candidates = await router.candidates(exclude) or await router.candidates()
+    available = []
+    refused = []
+    for provider in candidates:
+        breaker = get_circuit_breaker(provider.name)
+        try:
+            probing = await breaker.before_call()
+        except ProviderUnavailableError as e:
+            refused.append(e)
+            continue
+        limiter = get_rate_limiter(provider.name)
+        if not limiter.enabled or await limiter.try_acquire() <= 0:
+            return provider
+        if probing:
+            # Not calling it now: let another caller take the half-open probe
+            await breaker.release_probe()
+        available.append(provider)
+    if not available:
+        raise min(refused, key=lambda e: e.retry_after)
+    provider = available[0]
+    await get_rate_limiter(provider.name).acquire()
+    # The circuit may have changed (or the probe been released) while waiting
+    await get_circuit_breaker(provider.name).before_call()
+    return provider
+
+
+# Providers that answered while building the current report, so it is cached
+# under the provider and model that produced it
+_answered_by: contextvars.ContextVar[Optional[set]] = contextvars.ContextVar("answered_by", default=None)
+
+
+async def _invoke_model(provider: LLMProvider, prompt: ChatPromptTemplate, inputs: dict) -> str:
+    """Invoke a prompt on a provider once, reporting the outcome to its breaker and the router."""
+    breaker = get_circuit_breaker(provider.name)
+    start = time.perf_counter()
+    try:
+        response = await (prompt | provider.chat_model).ainvoke(inputs)
+    except Exception:
+        await breaker.record_failure()
+        get_router().record(provider.name, time.perf_counter() - start, ok=False)
+        raise
+    await breaker.record_success()
+    get_router().record(provider.name, time.perf_counter() - start, ok=True)
+    answered = _answered_by.get()
+    if answered is not None:
+        answered.add(provider.name)
+    # Get content from response (handle different response types)
+    return response.content if hasattr(response, 'content') else str(response)
+
+
+async def _call_model(prompt: ChatPromptTemplate, inputs: dict) -> str:
+    """
+    Invoke a prompt once on the best available provider.
     
-    if not text or not text.strip():
-        error_msg = "Text cannot be empty"
-        logger.error(error_msg)
-        raise ValueError(error_msg)
+    Returns:
+        str: The response text
     
-    max_retries = 3
-    last_error = None
+    Raises:
+        ProviderUnavailableError: If no provider can be called now
+        Exception: Any invocation error (counted as a breaker failure)
+    """
+    provider = await _acquire_provider()
+    return await _invoke_model(provider, prompt, inputs)
+
+
+def _hedge_token_for(provider: LLMProvider):
+    """Return a coroutine function taking a hedge token for ``provider`` only if one is free right now."""
+    async def acquire() -> bool:
+        if await get_circuit_breaker(provider.name).state() != "closed":
+            return False
+        limiter = get_rate_limiter(provider.name)
+        return not limiter.enabled or await limiter.try_acquire() <= 0
+    return acquire
+
+
+async def _call_and_parse(
+    prompt: ChatPromptTemplate,
+    inputs: dict,
+    parser: PydanticOutputParser,
+    label: str,
+    exclude=(),
+):
+    """
+    Call the model (hedged when slow) and parse the response.
     
-    logger.info(f"Starting essay analysis for text length: {len(text)}")
+    A response that parses wins over one that does not; see HedgePolicy.
     
-    # Build prompt (only need to build once)
-    prompt = _build_prompt(context)
-    chain = prompt | chat_model
+    Returns:
+        Tuple of (provider, content, parsed result or None, parse error or None)
+    
+    Raises:
+        ProviderCallError: If the call itself failed
+    """
+    provider = await _acquire_provider(exclude)
+    
+    async def once():
+        content = await _invoke_model(provider, prompt, inputs)
+        try:
+            return content, parser.parse(content), None
+        except Exception as e:
+            return content, None, e
+    
+    try:
+        outcome = await get_hedge_policy(provider.name).run(
+            once,
+            is_valid=lambda outcome: outcome[2] is None,
+            acquire_hedge=_hedge_token_for(provider),
+            label=f"{label} via {provider.name}",
+        )
+    except ProviderUnavailableError:
+        raise
+    except Exception as e:
+        raise ProviderCallError(provider.name, e) from e
+    return (provider,) + outcome
+
+
+async def _recover_output(
+    content: str,
+    parser: PydanticOutputParser,
+    inputs: dict,
+    context: Optional[str],
+    label: str,
+):
+    """
+    Recover a response that failed to parse without a full regeneration.
+    
+    Repairs the JSON locally and validates it field by field; if fields are
+    still missing or invalid, asks the model for just those fields and
+    merges them in.
+    
+    Args:
+        content: Raw model response
+        parser: Parser for the expected output schema
+        inputs: Template variables of the original call
+        context: Optional context information
+        label: Name used in log messages
+    
+    Returns:
+        The parsed Pydantic object, or None if recovery failed
+    """
+    model_cls = parser.pydantic_object
+    metrics.incr("output_repair.parse_failures")
+    
+    valid, errors, dropped = validate_fields(model_cls, repair_json(content))
+    if dropped:
+        metrics.incr("output_repair.items_dropped", dropped)
+        logger.warning(f"[{label}] Dropped {dropped} invalid list items from AI response")
+    if not errors:
+        metrics.incr("output_repair.recovered_local")
+        logger.info(f"[{label}] Recovered AI response by local JSON repair")
+        return model_cls.model_validate(valid)
+    if not valid or not OUTPUT_REPAIR_REASK:
+        # Nothing worth keeping: a full retry costs the same as a re-ask
+        return None
+    
+    fields = sorted(errors)
+    logger.info(f"[{label}] Asking the model again for fields: {', '.join(fields)}")
+    prompt = _build_prompt(context, "repair")
+    try:
+        reply = await _call_model(prompt, {
+            "source_text": inputs.get("original_text") or inputs.get("sentences", ""),
+            "field_errors": "\n".join(f"- {name}: {errors[name]}" for name in fields),
+            "field_schema": fields_schema(model_cls, fields),
+        })
+    except ProviderUnavailableError:
+        raise
+    except Exception as e:
+        logger.warning(f"[{label}] Follow-up request for missing fields failed: {e}")
+        return None
+    
+    patch = repair_json(reply)
+    if isinstance(patch, dict):
+        valid.update({name: patch[name] for name in fields if name in patch})
+    valid, errors, dropped = validate_fields(model_cls, valid)
+    if dropped:
+        metrics.incr("output_repair.items_dropped", dropped)
+    if errors:
+        logger.warning(f"[{label}] Follow-up response still invalid: {errors}")
+        return None
+    metrics.incr("output_repair.recovered_reask")
+    logger.info(f"[{label}] Recovered AI response with a follow-up for {len(fields)} fields")
+    return model_cls.model_validate(valid)
+
+
+async def _invoke_with_retries(
+    prompt: ChatPromptTemplate,
+    inputs: dict,
+    parser: PydanticOutputParser,
+    label: str = "analysis",
+    max_retries: int = MAX_RETRIES,
+    context: Optional[str] = None,
+):
+    """
+    Invoke a prompt chain and parse its output, retrying on any failure.
+    
+    Every attempt goes to the provider the router ranks best, taking a token
+    from that provider's shared rate limiter and skipping it while its
+    circuit breaker is open. A failed provider is excluded from the next
+    attempt, so the call fails over; once every provider has failed,
+    attempts are separated by exponential backoff with jitter. A slow call is hedged
+    with a second identical request (see app/services/hedging.py). Output
+    that fails to parse is first recovered locally or with a short follow-up
+    for the broken fields (see _recover_output); only then is the whole call
+    retried.
+    
+    Args:
+        prompt: Prompt template
+        inputs: Template variables for the prompt
+        parser: Parser for the expected output schema
+        label: Name used in log messages
+        max_retries: Maximum number of attempts
+        context: Context used to build the prompt (for follow-up prompts)
+    
+    Returns:
+        The parsed Pydantic object
+    
+    Raises:
+        AIAnalysisFailedException: If all attempts fail
+        ProviderUnavailableError: If every provider's circuit is open or no
+            rate limit token became available; the caller should requeue the work
+    """
+    last_error = None
+    failed = set()
     
     for attempt in range(1, max_retries + 1):
+        if attempt > 1 and not await get_router().candidates(exclude=failed):
+            failed.clear()
+            delay = _backoff_delay(attempt - 1)
+            logger.info(f"[{label}] Backing off {delay:.1f}s before attempt {attempt}")
+            await asyncio.sleep(delay)
+        
         try:
-            logger.info(f"Attempt {attempt}/{max_retries}: Invoking AI model")
-            
-            # Invoke chain asynchronously
-            response = await chain.ainvoke({
-                "original_text": text,
-            })
-            
-            logger.info(f"Attempt {attempt}: Received response from AI model")
+            logger.info(f"[{label}] Attempt {attempt}/{max_retries}: Invoking AI model")
             
-            # Parse output
-            try:
-                # Get content from response (handle different response types)
-                content = response.content if hasattr(response, 'content') else str(response)
-                report = output_parser.parse(content)
-                logger.info(f"Attempt {attempt}: Successfully parsed AI response into FullReport")
-                return report
+            # Invoke the best provider asynchronously
+            provider, content, result, parse_error = await _call_and_parse(
+                prompt, inputs, parser, label, exclude=failed
+            )
             
-            except OutputParserException as e:
-                content = response.content if hasattr(response, 'content') else str(response)
-                logger.warning(f"Attempt {attempt}: Failed to parse AI output: {e}")
-                logger.warning(f"Attempt {attempt}: Raw AI response: {content}")
-                last_error = e
-                
-                # If this is the last attempt, don't retry
-                if attempt == max_retries:
-                    logger.error(f"All {max_retries} attempts failed. Last error: {e}")
-                    raise AIAnalysisFailedException(
-                        f"AI analysis failed after {max_retries} attempts. "
-                        f"Last parsing error: {str(e)}. "
-                        f"Raw response: {content[:500]}..."  # Truncate long responses
-                    ) from e
-                
-                # Continue to next retry
-                continue
-            
-            except Exception as e:
-                content = response.content if hasattr(response, 'content') else str(response)
-                logger.warning(f"Attempt {attempt}: Unexpected error during parsing: {e}")
-                logger.warning(f"Attempt {attempt}: Raw AI response: {content}")
-                last_error = e
-                
-                # If this is the last attempt, don't retry
-                if attempt == max_retries:
-                    logger.error(f"All {max_retries} attempts failed. Last error: {e}")
-                    raise AIAnalysisFailedException(
-                        f"AI analysis failed after {max_retries} attempts. "
-                        f"Last parsing error: {str(e)}. "
-                        f"Raw response: {content[:500]}..."
-                    ) from e
-                
-                # Continue to next retry
-                continue
+            logger.info(f"[{label}] Attempt {attempt}: Received response from {provider.name}")
         
+        except ProviderUnavailableError:
+            raise
         except Exception as e:
-            # Handle errors during chain invocation (not parsing errors)
-            logger.warning(f"Attempt {attempt}: Error during AI model invocation: {e}")
+            # Handle errors during model invocation (not parsing errors)
+            if isinstance(e, ProviderCallError):
+                failed.add(e.provider)
+                e = e.error
+            logger.warning(f"[{label}] Attempt {attempt}: Error during AI model invocation: {e}")
             last_error = e
             
             # If this is the last attempt, don't retry
             if attempt == max_retries:
-                logger.error(f"All {max_retries} attempts failed. Last error: {e}")
+                logger.error(f"[{label}] All {max_retries} attempts failed. Last error: {e}")
                 raise AIAnalysisFailedException(
                     f"AI analysis failed after {max_retries} attempts. "
                     f"Last error: {str(e)}"
@@ -211,6 +539,34 @@ async def analyze_essay(text: str, context: Optional[str] = None) -> FullReport:
             
             # Continue to next retry
             continue
+        
+        if parse_error is None:
+            logger.info(f"[{label}] Attempt {attempt}: Successfully parsed AI response")
+            return result
+        
+        e = parse_error
+        if isinstance(e, OutputParserException):
+            logger.warning(f"[{label}] Attempt {attempt}: Failed to parse AI output: {e}")
+        else:
+            logger.warning(f"[{label}] Attempt {attempt}: Unexpected error during parsing: {e}")
+        logger.warning(f"[{label}] Attempt {attempt}: Raw AI response: {content}")
+        last_error = e
+        
+        recovered = await _recover_output(content, parser, inputs, context, label)
+        if recovered is not None:
+            return recovered
+        
+        # If this is the last attempt, don't retry
+        if attempt == max_retries:
+            logger.error(f"[{label}] All {max_retries} attempts failed. Last error: {e}")
+            raise AIAnalysisFailedException(
+                f"AI analysis failed after {max_retries} attempts. "
+                f"Last parsing error: {str(e)}. "
+                f"Raw response: {content[:500]}..."  # Truncate long responses
+            ) from e
+        
+        # Continue to next retry
+        metrics.incr("output_repair.full_retries")
     
     # This should never be reached, but just in case
     raise AIAnalysisFailedException(
@@ -218,3 +574,257 @@ async def analyze_essay(text: str, context: Optional[str] = None) -> FullReport:
         f"Last error: {str(last_error) if last_error else 'Unknown error'}"
     )
 
+
+async def _analyze_whole(text: str, context: Optional[str], max_retries: int = MAX_RETRIES) -> FullReport:
+    """Analyze the full text in a single model call."""
+    return await _invoke_with_retries(
+        _build_prompt(context), {"original_text": text}, output_parser, max_retries=max_retries, context=context
+    )
+
+
+async def _analyze_chunked(text: str, context: Optional[str], max_retries: int = MAX_RETRIES) -> FullReport:
+    """
+    Analyze a long text as concurrent paragraph chunks.
+    
+    Each chunk returns its own sentence analysis and polished text; a separate
+    short pass over the whole document produces the writing goal analysis.
+    All calls share a semaphore bounding concurrency against the API.
+    """
+    chunks = split_into_chunks(text)
+    logger.info(f"Chunked analysis: {len(text)} chars split into {len(chunks)} chunks")
+    
+    semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+    chunk_prompt = _build_prompt(context, "chunk")
+    goal_prompt = _build_prompt(context, "goal")
+    
+    async def run_chunk(index: int, chunk: str) -> ChunkReport:
+        async with semaphore:
+            return await _invoke_with_retries(
+                chunk_prompt,
+                {"original_text": chunk, "chunk_index": index, "chunk_count": len(chunks)},
+                chunk_output_parser,
+                label=f"chunk {index}/{len(chunks)}",
+                max_retries=max_retries,
+                context=context,
+            )
+    
+    async def run_goal() -> GoalAnalysis:
+        async with semaphore:
+            return await _invoke_with_retries(
+                goal_prompt, {"original_text": text}, goal_output_parser, label="goal",
+                max_retries=max_retries, context=context
+            )
+    
+    goal, *chunk_reports = await asyncio.gather(
+        run_goal(),
+        *(run_chunk(i, chunk) for i, chunk in enumerate(chunks, start=1)),
+    )
+    
+    return FullReport(
+        writing_goal_analysis=goal.writing_goal_analysis,
+        sentence_analysis=[s for report in chunk_reports for s in report.sentence_analysis],
+        polished_version="\n\n".join(report.polished_version.strip() for report in chunk_reports),
+    )
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Split text into sentences on terminal punctuation.
+    
+    Whitespace inside each sentence is collapsed so that re-wrapped lines
+    still compare equal between drafts.
+    
+    Args:
+        text: Essay text
+    
+    Returns:
+        List[str]: Sentences in document order
+    """
+    sentences = re.split(r"(?<=[.!?])\s+|(?<=[.!?][\"')\]])\s+", text.strip())
+    return [" ".join(s.split()) for s in sentences if s.strip()]
+
+
+def _sentence_key(sentence: str) -> str:
+    return " ".join(sentence.split()).lower()
+
+
+def plan_revision(text: str, parent_text: str, parent_report: FullReport) -> List[Tuple[str, Optional[SentenceAnalysis]]]:
+    """
+    Diff a revised draft against its parent, sentence by sentence.
+    
+    Sentences in unchanged diff blocks are paired with the parent's analysis
+    of the same sentence; changed or inserted sentences (and unchanged ones
+    the parent report did not cover) are paired with None.
+    
+    Args:
+        text: Revised draft
+        parent_text: Parent draft's original text
+        parent_report: Parent draft's analysis report
+    
+    Returns:
+        List of (sentence, reused analysis or None) in the revised draft's order
+    """
+    parent_analyses = {}
+    for item in parent_report.sentence_analysis:
+        parent_analyses.setdefault(_sentence_key(item.original), item)
+    
+    old_sentences = split_sentences(parent_text)
+    new_sentences = split_sentences(text)
+    matcher = difflib.SequenceMatcher(
+        a=[_sentence_key(s) for s in old_sentences],
+        b=[_sentence_key(s) for s in new_sentences],
+        autojunk=False,
+    )
+    
+    plan: List[Tuple[str, Optional[SentenceAnalysis]]] = []
+    for tag, _, _, j1, j2 in matcher.get_opcodes():
+        for sentence in new_sentences[j1:j2]:
+            reused = parent_analyses.get(_sentence_key(sentence)) if tag == "equal" else None
+            plan.append((sentence, reused))
+    return plan
+
+
+async def _analyze_revision(
+    text: str,
+    context: Optional[str],
+    plan: List[Tuple[str, Optional[SentenceAnalysis]]],
+    parent_report: FullReport,
+    max_retries: int = MAX_RETRIES,
+) -> FullReport:
+    """
+    Analyze only the changed sentences of a revised draft.
+    
+    The changed sentences and a polish-only pass over the full text run
+    concurrently; writing goal analysis is carried over from the parent.
+    """
+    changed = [sentence for sentence, reused in plan if reused is None]
+    metrics.incr("revision.sentences.reused", len(plan) - len(changed))
+    metrics.incr("revision.sentences.analyzed", len(changed))
+    logger.info(f"Revision analysis: {len(changed)}/{len(plan)} sentences changed")
+    
+    async def run_sentences() -> SentenceBatch:
+        if not changed:
+            return SentenceBatch()
+        return await _invoke_with_retries(
+            _build_prompt(context, "sentence"), {"sentences": "\n".join(changed)}, sentence_output_parser, label="revision",
+            max_retries=max_retries, context=context
+        )
+    
+    async def run_polish() -> PolishedText:
+        return await _invoke_with_retries(
+            _build_prompt(context, "polish"), {"original_text": text}, polish_output_parser, label="polish",
+            max_retries=max_retries, context=context
+        )
+    
+    batch, polished = await asyncio.gather(run_sentences(), run_polish())
+    
+    # Prefer an exact match on "original"; sentences whose analysis came back
+    # with a rewritten "original" take the unmatched items in order
+    fresh = {}
+    for index, item in enumerate(batch.sentence_analysis):
+        fresh.setdefault(_sentence_key(item.original), []).append(index)
+    assigned = {}
+    consumed = set()
+    for position, (sentence, reused) in enumerate(plan):
+        if reused is None and fresh.get(_sentence_key(sentence)):
+            index = fresh[_sentence_key(sentence)].pop(0)
+            assigned[position] = batch.sentence_analysis[index]
+            consumed.add(index)
+    remaining = iter(item for index, item in enumerate(batch.sentence_analysis) if index not in consumed)
+    
+    sentence_analysis: List[SentenceAnalysis] = []
+    for position, (sentence, reused) in enumerate(plan):
+        if reused is None:
+            reused = assigned.get(position) or next(remaining, None)
+            if reused is None:
+                continue
+        sentence_analysis.append(reused)
+    
+    return FullReport(
+        writing_goal_analysis=parent_report.writing_goal_analysis,
+        sentence_analysis=sentence_analysis,
+        polished_version=polished.polished_version,
+    )
+
+
+async def analyze_essay(
+    text: str,
+    context: Optional[str] = None,
+    parent_text: Optional[str] = None,
+    parent_report: Optional[FullReport] = None,
+    max_retries: int = MAX_RETRIES,
+) -> FullReport:
+    """
+    Analyze English essay using AI and return structured report.
+    
+    Results are cached by content (text, context, provider and model, prompt
+    version), so resubmitting identical text returns without calling the
+    model. The cache is checked for each configured provider, best first,
+    and a report is stored under the provider that produced it. Texts
+    longer than CHUNKING_THRESHOLD_CHARS are analyzed as concurrent paragraph
+    chunks and merged into one report. When a parent draft and its report
+    are given, only sentences that changed since the parent are re-analyzed.
+    
+    Args:
+        text: The original English text to analyze
+        context: Optional context information (writing goals, audience, etc.)
+        parent_text: Original text of the previous draft, if any
+        parent_report: Analysis report of the previous draft, if any
+        max_retries: Attempts per model call (1 when the caller retries the
+            whole task itself, e.g. through Celery)
+    
+    Returns:
+        FullReport: Structured analysis report
+    
+    Raises:
+        ValueError: If no provider is configured or text is empty
+        AIAnalysisFailedException: If AI analysis fails after max retries
+    """
+    if not text or not text.strip():
+        error_msg = "Text cannot be empty"
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+    
+    cache = get_analysis_cache()
+    router = get_router()
+    for provider in await router.candidates():
+        cache_key = make_cache_key(text, context, provider.cache_tag, PROMPT_VERSION)
+        cached = await cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Analysis cache hit for key {cache_key[:12]} ({provider.name})")
+            return FullReport.model_validate(cached)
+    
+    if not router.providers:
+        error_msg = "No LLM provider is configured (set ZHIPU_API_KEY, DASHSCOPE_API_KEY or DEEPSEEK_API_KEY)"
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+    
+    logger.info(f"Starting essay analysis for text length: {len(text)}")
+    
+    plan = None
+    if parent_text and parent_report is not None:
+        plan = plan_revision(text, parent_text, parent_report)
+        changed = sum(1 for _, reused in plan if reused is None)
+        if not plan or changed / len(plan) > REVISION_MAX_CHANGED_RATIO:
+            logger.info(f"Revision changed {changed}/{len(plan)} sentences, running full analysis")
+            plan = None
+    
+    answered = set()
+    token = _answered_by.set(answered)
+    try:
+        if plan is not None:
+            report = await _analyze_revision(text, context, plan, parent_report, max_retries)
+        elif CHUNKING_THRESHOLD_CHARS > 0 and len(text) > CHUNKING_THRESHOLD_CHARS:
+            report = await _analyze_chunked(text, context, max_retries)
+        else:
+            report = await _analyze_whole(text, context, max_retries)
+    finally:
+        _answered_by.reset(token)
+    
+    if len(answered) == 1:
+        provider = next(p for p in router.providers if p.name in answered)
+        await cache.set(make_cache_key(text, context, provider.cache_tag, PROMPT_VERSION), report.model_dump())
+    else:
+        # Parts came from different providers (failover): no single key fits
+        logger.info(f"Not caching report produced by {sorted(answered) or 'no provider'}")
+    return report
@@ -0,0 +1,166 @@
+"""
+Linear-time error annotation for the report's original text.
+
+All analyzed sentences are located in the original text in a single pass
+with an Aho-Corasick automaton over their leading characters (each hit is
+verified against the full sentence); error phrases are then searched only inside
+their own sentence. Spans are resolved against offsets in the untouched
+original text (never against partially annotated HTML) and the final HTML is
+assembled in one join, so cost grows linearly with essay length plus the
+number of findings.
+"""
+import re
+import html
+import logging
+from collections import defaultdict, deque
+from typing import Dict, Iterable, List, Tuple
+
+from app.schemas import SentenceAnalysis
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+Span = Tuple[int, int]
+
+# Sentences are matched on this many leading characters and then verified in
+# full, which keeps the automaton small for long sentences
+ANCHOR_CHARS = 16
+
+
+class AhoCorasick:
+    """Multi-pattern exact string matcher over a fixed set of patterns."""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        for pattern in patterns:
+            if pattern:
+                self._add(pattern)
+        self._build()
+
+    def _add(self, pattern: str) -> None:
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = next_node
+        self._out[node].append(len(self.patterns))
+        self.patterns.append(pattern)
+
+    def _build(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child].extend(self._out[self._fail[child]])
+
+    def finditer(self, text: str):
+        """
+        Yield ``(pattern_index, start, end)`` for every (possibly overlapping) match.
+
+        Args:
+            text: Text to scan
+        """
+        goto, fail, out, patterns = self._goto, self._fail, self._out, self.patterns
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for index in out[node]:
+                end = position + 1
+                yield index, end - len(patterns[index]), end
+
+
+def locate_error_spans(original_text: str, analysis_list: List[SentenceAnalysis]) -> List[Span]:
+    """
+    Find the character span of every annotatable error in the original text.
+
+    Each analysis whose ``error`` text occurs (case-insensitively) inside its
+    ``original`` sentence yields one span. The n-th analysis of a repeated
+    sentence is placed on the n-th occurrence of that sentence. Overlapping
+    spans are resolved by keeping the earliest (then longest) one.
+
+    Args:
+        original_text: The original English text
+        analysis_list: List of sentence analysis results
+
+    Returns:
+        List[Span]: Non-overlapping ``(start, end)`` offsets, sorted by start
+    """
+    wanted = []
+    for analysis in analysis_list:
+        sentence = (analysis.original or "").strip()
+        if analysis.error and sentence:
+            wanted.append((sentence, analysis.error))
+    if not wanted:
+        return []
+
+    by_anchor: Dict[str, List[str]] = defaultdict(list)
+    for sentence in dict.fromkeys(sentence for sentence, _ in wanted):
+        by_anchor[sentence[:ANCHOR_CHARS]].append(sentence)
+
+    matcher = AhoCorasick(by_anchor)
+    occurrences: Dict[str, List[Span]] = defaultdict(list)
+    for index, start, _ in matcher.finditer(original_text):
+        for sentence in by_anchor[matcher.patterns[index]]:
+            if original_text.startswith(sentence, start):
+                occurrences[sentence].append((start, start + len(sentence)))
+
+    used: Dict[str, int] = defaultdict(int)
+    spans: List[Span] = []
+    for sentence, error_text in wanted:
+        sentence_spans = occurrences.get(sentence)
+        if not sentence_spans or used[sentence] >= len(sentence_spans):
+            continue
+        start, end = sentence_spans[used[sentence]]
+        used[sentence] += 1
+
+        error_match = re.search(re.escape(error_text), original_text[start:end], re.IGNORECASE)
+        if not error_match:
+            logger.debug(f"Error text '{error_text}' not found in sentence '{sentence[:50]}...'")
+            continue
+        spans.append((start + error_match.start(), start + error_match.end()))
+
+    resolved: List[Span] = []
+    for start, end in sorted(spans, key=lambda span: (span[0], -span[1])):
+        if resolved and start < resolved[-1][1]:
+            continue
+        resolved.append((start, end))
+    return resolved
+
+
+def render_annotated_html(original_text: str, spans: List[Span]) -> str:
+    """
+    Assemble escaped HTML with ``<span class='error'>`` around each span.
+
+    Args:
+        original_text: The original English text
+        spans: Non-overlapping spans sorted by start
+
+    Returns:
+        str: HTML paragraph
+    """
+    parts = ["<p>"]
+    cursor = 0
+    for start, end in spans:
+        parts.append(html.escape(original_text[cursor:start]))
+        parts.append("<span class='error'>")
+        parts.append(html.escape(original_text[start:end]))
+        parts.append("</span>")
+        cursor = end
+    parts.append(html.escape(original_text[cursor:]))
+    parts.append("</p>")
+    return "".join(parts)
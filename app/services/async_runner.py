@@ -0,0 +1,150 @@
+"""
+Persistent event loop for running coroutines from synchronous Celery tasks.
+
+``async_to_sync`` gives every task its own short-lived loop, so connection
+pools, HTTP clients and the database engine cannot be shared and one worker
+process handles a single essay at a time. AsyncRunner instead owns one event
+loop in a background thread for the lifetime of the process. Celery tasks
+(run with ``-P threads -c <N>``) submit their coroutine and block on the
+result, so dozens of LLM calls wait concurrently on the same loop, bounded by
+WORKER_MAX_INFLIGHT.
+
+``drain()`` stops accepting work, waits for in-flight coroutines up to a
+timeout and then closes the loop; it is wired to Celery's shutdown signals.
+"""
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, List, Optional, TypeVar
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+WORKER_MAX_INFLIGHT = int(os.getenv("WORKER_MAX_INFLIGHT", "32"))
+WORKER_DRAIN_TIMEOUT = float(os.getenv("WORKER_DRAIN_TIMEOUT", "120"))
+
+T = TypeVar("T")
+
+
+class AsyncRunner:
+    """One event loop thread per process with bounded concurrency."""
+
+    def __init__(self, max_inflight: int = WORKER_MAX_INFLIGHT):
+        self.max_inflight = max_inflight
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+        self._accepting = True
+        self._inflight = 0
+        self._on_close: List[Callable[[], Awaitable[None]]] = []
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run() -> None:
+                    asyncio.set_event_loop(loop)
+                    self._semaphore = asyncio.Semaphore(self.max_inflight)
+                    ready.set()
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name="async-runner", daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+                logger.info(f"Started worker event loop (max in-flight: {self.max_inflight})")
+            return self._loop
+
+    def on_close(self, callback: Callable[[], Awaitable[None]]) -> None:
+        """Register a coroutine function to run on the loop before it closes (e.g. engine.dispose)."""
+        self._on_close.append(callback)
+
+    async def _run(self, coro_factory: Callable[[], Awaitable[T]]) -> T:
+        async with self._semaphore:
+            self._inflight += 1
+            try:
+                return await coro_factory()
+            finally:
+                self._inflight -= 1
+
+    def submit(self, coro_factory: Callable[[], Awaitable[T]]) -> Future:
+        """
+        Schedule a coroutine on the shared loop.
+
+        Args:
+            coro_factory: Zero-argument callable returning the coroutine
+
+        Returns:
+            Future: concurrent.futures.Future with the coroutine's result
+
+        Raises:
+            RuntimeError: If the runner is draining
+        """
+        if not self._accepting:
+            raise RuntimeError("Worker is shutting down, not accepting new tasks")
+        loop = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(self._run(coro_factory), loop)
+
+    def run(self, coro_factory: Callable[[], Awaitable[T]]) -> T:
+        """Submit a coroutine and block the calling thread until it finishes."""
+        return self.submit(coro_factory).result()
+
+    def drain(self, timeout: float = WORKER_DRAIN_TIMEOUT) -> None:
+        """
+        Stop accepting work, wait for in-flight coroutines and close the loop.
+
+        Args:
+            timeout: Seconds to wait for in-flight work before cancelling it
+        """
+        self._accepting = False
+        loop = self._loop
+        if loop is None or not loop.is_running():
+            return
+        logger.info(f"Draining worker event loop ({self._inflight} in flight, timeout {timeout}s)")
+
+        async def shutdown() -> None:
+            current = asyncio.current_task()
+            pending = [t for t in asyncio.all_tasks() if t is not current]
+            if pending:
+                _, still_running = await asyncio.wait(pending, timeout=timeout)
+                for task in still_running:
+                    task.cancel()
+                if still_running:
+                    logger.warning(f"Cancelled {len(still_running)} tasks still running after drain timeout")
+                    await asyncio.gather(*still_running, return_exceptions=True)
+            for callback in self._on_close:
+                try:
+                    await callback()
+                except Exception as e:
+                    logger.warning(f"Error during worker loop shutdown: {e}")
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=timeout + 30)
+        except Exception as e:
+            logger.warning(f"Worker loop drain did not complete cleanly: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        logger.info("Worker event loop stopped")
+
+
+_runner: Optional[AsyncRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_async_runner() -> AsyncRunner:
+    """Return the process-wide runner."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = AsyncRunner()
+        return _runner
@@ -0,0 +1,264 @@
+"""
+Content-addressed cache for AI analysis results.
+
+Two tiers sit in front of the model call:
+
+1. An in-process LRU with TTL (per worker process, microsecond lookups).
+2. A persistent tier shared by all workers: SQLite (default) or Redis.
+
+Keys are SHA-256 digests of the normalized text, the context, the model name
+and the prompt version, so any prompt change naturally invalidates old entries.
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Optional
+
+from app.services import metrics
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - only needed for the redis backend
+    redis = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CACHE_BACKEND = os.getenv("ANALYSIS_CACHE_BACKEND", "sqlite")  # sqlite / redis / none
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", str(7 * 24 * 3600)))
+ANALYSIS_CACHE_MEMORY_SIZE = int(os.getenv("ANALYSIS_CACHE_MEMORY_SIZE", "256"))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "10000"))
+ANALYSIS_CACHE_DB_PATH = os.getenv("ANALYSIS_CACHE_DB_PATH", "./analysis_cache.db")
+ANALYSIS_CACHE_REDIS_URL = os.getenv("ANALYSIS_CACHE_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """
+    Normalize text so that trivially different submissions share a cache key.
+
+    Applies NFC normalization, unifies line endings and strips trailing
+    whitespace; paragraph structure is preserved because it affects analysis.
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(line.rstrip() for line in text.strip().split("\n"))
+
+
+def make_cache_key(text: str, context: Optional[str], model: str, prompt_version: str) -> str:
+    """
+    Build the content address for an analysis request.
+
+    Args:
+        text: Essay text
+        context: Optional context information
+        model: Model name
+        prompt_version: Version tag of the prompt template
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    payload = json.dumps(
+        {
+            "text": normalize_text(text),
+            "context": normalize_text(context),
+            "model": model,
+            "prompt_version": prompt_version,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _MemoryTier:
+    """In-process LRU with per-entry expiry."""
+
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                metrics.incr("analysis_cache.evictions.memory")
+
+
+class _SQLiteTier:
+    """Persistent tier in a local SQLite file, evicting least recently used rows."""
+
+    def __init__(self, path: str, ttl: int, max_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_cache_accessed ON analysis_cache(accessed_at)")
+
+    def _get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock, self._conn as conn:
+            row = conn.execute("SELECT value, expires_at FROM analysis_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                conn.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE analysis_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+
+    def _set(self, key: str, value: Any) -> None:
+        now = time.time()
+        with self._lock, self._conn as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now + self.ttl, now),
+            )
+            conn.execute("DELETE FROM analysis_cache WHERE expires_at < ?", (now,))
+            overflow = conn.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM analysis_cache WHERE key IN "
+                    "(SELECT key FROM analysis_cache ORDER BY accessed_at LIMIT ?)",
+                    (overflow,),
+                )
+                metrics.incr("analysis_cache.evictions.persistent", overflow)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: Any) -> None:
+        await asyncio.to_thread(self._set, key, value)
+
+
+class _RedisTier:
+    """
+    Persistent tier in Redis.
+
+    Entries expire via TTL; size-based eviction is delegated to the server's
+    ``maxmemory-policy`` (use ``allkeys-lru`` or ``volatile-lru``).
+    """
+
+    def __init__(self, url: str, ttl: int):
+        if redis is None:
+            raise ImportError("redis is not installed. Please install: pip install redis")
+        self.ttl = ttl
+        # Synchronous client used from a thread: it is not bound to an event
+        # loop, so it survives the per-task loops created by async_to_sync.
+        self._client = redis.Redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await asyncio.to_thread(self._client.get, f"analysis_cache:{key}")
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any) -> None:
+        payload = json.dumps(value, ensure_ascii=False)
+        await asyncio.to_thread(self._client.set, f"analysis_cache:{key}", payload, ex=self.ttl)
+
+
+class AnalysisCache:
+    """Two-tier cache for analysis reports (stored as plain dicts)."""
+
+    def __init__(self, backend: str = ANALYSIS_CACHE_BACKEND):
+        self.memory = _MemoryTier(ANALYSIS_CACHE_MEMORY_SIZE, ANALYSIS_CACHE_TTL)
+        self.persistent = None
+        if backend == "sqlite":
+            self.persistent = _SQLiteTier(ANALYSIS_CACHE_DB_PATH, ANALYSIS_CACHE_TTL, ANALYSIS_CACHE_MAX_ENTRIES)
+        elif backend == "redis":
+            self.persistent = _RedisTier(ANALYSIS_CACHE_REDIS_URL, ANALYSIS_CACHE_TTL)
+        elif backend != "none":
+            raise ValueError(f"Unknown ANALYSIS_CACHE_BACKEND: {backend}")
+
+    async def get(self, key: str) -> Optional[Any]:
+        """
+        Look up a cached report, promoting persistent hits into memory.
+
+        Errors in the persistent tier are logged and treated as misses.
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            metrics.incr("analysis_cache.hits.memory")
+            return value
+        if self.persistent is not None:
+            try:
+                value = await self.persistent.get(key)
+            except Exception as e:
+                logger.warning(f"Analysis cache lookup failed: {e}")
+                value = None
+            if value is not None:
+                self.memory.set(key, value)
+                metrics.incr("analysis_cache.hits.persistent")
+                return value
+        metrics.incr("analysis_cache.misses")
+        return None
+
+    async def set(self, key: str, value: Any) -> None:
+        """Store a report in both tiers (persistent errors are logged, not raised)."""
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            try:
+                await self.persistent.set(key, value)
+            except Exception as e:
+                logger.warning(f"Analysis cache store failed: {e}")
+        metrics.incr("analysis_cache.stores")
+
+
+_cache: Optional[AnalysisCache] = None
+
+
+def get_analysis_cache() -> AnalysisCache:
+    """Return the process-wide analysis cache."""
+    global _cache
+    if _cache is None:
+        _cache = AnalysisCache()
+    return _cache
+
+
+def get_cache_stats() -> dict:
+    """
+    Summarize cache hit/miss counters across processes.
+
+    Returns:
+        dict: Raw counters plus the overall hit ratio
+    """
+    counters = metrics.snapshot("analysis_cache.")
+    hits = counters.get("analysis_cache.hits.memory", 0) + counters.get("analysis_cache.hits.persistent", 0)
+    lookups = hits + counters.get("analysis_cache.misses", 0)
+    return {
+        "backend": ANALYSIS_CACHE_BACKEND,
+        "counters": counters,
+        "hit_ratio": round(hits / lookups, 4) if lookups else None,
+    }
@@ -0,0 +1,92 @@
+"""
+Dead-letter queue for tasks that failed permanently.
+
+When a task runs out of retries (or fails with a non-retryable error) its
+status becomes ``failed`` and a record with the task ID, attempt count, last
+error and backend is pushed onto a capped Redis list, newest first, so
+operators can inspect failures via ``GET /dead-letter`` without digging
+through worker logs. Without Redis the record is only logged; the task row
+still carries ``attempts`` and ``last_error``.
+"""
+import os
+import json
+import time
+import logging
+from typing import List
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis is optional for embedded deployments
+    redis = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DEAD_LETTER_REDIS_URL = os.getenv("DEAD_LETTER_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+DEAD_LETTER_KEY = os.getenv("DEAD_LETTER_KEY", "essay_polisher:dead_letter")
+DEAD_LETTER_MAX_LENGTH = int(os.getenv("DEAD_LETTER_MAX_LENGTH", "10000"))
+
+_client = None
+
+
+def _get_redis():
+    global _client
+    if redis is None or not DEAD_LETTER_REDIS_URL:
+        return None
+    if _client is None:
+        _client = redis.Redis.from_url(DEAD_LETTER_REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+    return _client
+
+
+def record_dead_letter(task_id: int, error: str, attempts: int, backend: str) -> None:
+    """
+    Record a permanently failed task (best effort, never raises).
+
+    Args:
+        task_id: Task ID
+        error: Last error message
+        attempts: Number of attempts made
+        backend: Execution backend that gave up ("celery" or "embedded")
+    """
+    entry = {
+        "task_id": task_id,
+        "attempts": attempts,
+        "error": error[:2000],
+        "backend": backend,
+        "failed_at": time.time(),
+    }
+    logger.error(f"Task {task_id} dead-lettered after {attempts} attempts: {error}")
+    client = _get_redis()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline()
+        pipe.lpush(DEAD_LETTER_KEY, json.dumps(entry))
+        pipe.ltrim(DEAD_LETTER_KEY, 0, DEAD_LETTER_MAX_LENGTH - 1)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to record dead letter for task {task_id}: {e}")
+
+
+def list_dead_letters(limit: int = 50) -> List[dict]:
+    """Return the most recent dead-letter records, newest first."""
+    client = _get_redis()
+    if client is None:
+        return []
+    try:
+        return [json.loads(raw) for raw in client.lrange(DEAD_LETTER_KEY, 0, limit - 1)]
+    except Exception as e:
+        logger.warning(f"Failed to read dead letters: {e}")
+        return []
+
+
+def dead_letter_count() -> int:
+    """Number of records in the dead-letter queue (0 if Redis is unavailable)."""
+    client = _get_redis()
+    if client is None:
+        return 0
+    try:
+        return client.llen(DEAD_LETTER_KEY)
+    except Exception as e:
+        logger.warning(f"Failed to read dead letter count: {e}")
+        return 0
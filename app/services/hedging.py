@@ -0,0 +1,209 @@
+"""
+Hedged requests against slow LLM responses.
+
+Most GLM calls answer close to the median, but a few take many times longer
+and dominate p99 essay latency. A hedge policy starts a second identical
+request when the first has not answered within the HEDGE_PERCENTILE of
+recently observed latencies (HEDGE_DEFAULT_DELAY until HEDGE_MIN_SAMPLES
+calls have been seen). The first valid result wins and the other request is
+cancelled. A cancelled slow request is recorded with its elapsed time as a
+lower bound, so the percentile does not drift down as hedges win.
+
+Hedges are extra provider load, so they are only sent when the caller can
+take a rate limit token immediately and while hedges stay below
+HEDGE_MAX_RATIO of recent calls. Latency windows are per process.
+"""
+import os
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from app.services import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "1") == "1"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "2"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "20"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", "0.1"))
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Sliding window of call latencies in seconds."""
+
+    def __init__(self, window: int = HEDGE_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Return the ``p``-th percentile (nearest rank), or None without samples."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(p / 100 * len(samples))) - 1))
+        return samples[index]
+
+    def tail_mean(self, threshold: float) -> Optional[float]:
+        """Mean of the samples at or above ``threshold``, or None if there are none."""
+        with self._lock:
+            tail = [s for s in self._samples if s >= threshold]
+        return sum(tail) / len(tail) if tail else None
+
+
+class HedgePolicy:
+    """Adaptive hedging for one provider."""
+
+    def __init__(
+        self,
+        name: str,
+        enabled: bool = HEDGE_ENABLED,
+        percentile: float = HEDGE_PERCENTILE,
+        max_ratio: float = HEDGE_MAX_RATIO,
+    ):
+        self.name = name
+        self.enabled = enabled
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.latency = LatencyTracker()
+        self._decisions = deque(maxlen=HEDGE_WINDOW)
+        self._decisions_lock = threading.Lock()
+
+    def delay(self) -> float:
+        """Seconds to wait for the first request before hedging."""
+        if len(self.latency) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, self.latency.percentile(self.percentile))
+
+    def _within_budget(self) -> bool:
+        with self._decisions_lock:
+            if not self._decisions:
+                return True
+            return sum(self._decisions) / len(self._decisions) < self.max_ratio
+
+    def _record_decision(self, hedged: bool) -> None:
+        with self._decisions_lock:
+            self._decisions.append(hedged)
+
+    def _count(self, counter: str, amount: float = 1) -> None:
+        metrics.incr(f"hedge.{self.name}.{counter}", amount)
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[T]],
+        is_valid: Callable[[T], bool],
+        acquire_hedge: Callable[[], Awaitable[bool]],
+        label: str = "call",
+    ) -> T:
+        """
+        Run ``call``, hedging it with a second identical call if it is slow.
+
+        Args:
+            call: Zero-argument coroutine function making one request
+            is_valid: Whether a result is usable (e.g. it parsed)
+            acquire_hedge: Coroutine function taking a rate limit token without waiting; False skips the hedge
+            label: Name used in log messages
+
+        Returns:
+            The first valid result, else the first request's result
+
+        Raises:
+            Exception: The first request's error if no request produced a result
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        async def timed(hedge: bool):
+            sent = loop.time()
+            value = await call()
+            return hedge, value, loop.time() - sent
+
+        primary = asyncio.ensure_future(timed(False))
+        primary_sent = loop.time()
+        pending = {primary}
+        fallback = None
+        error = None
+        try:
+            self._count("calls")
+            delay = self.delay()
+            hedged = False
+            if self.enabled:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done:
+                    if self._within_budget() and await acquire_hedge():
+                        hedged = True
+                        self._count("hedged")
+                        logger.info(f"[{label}] No response after {delay:.1f}s, sending hedge request")
+                        pending.add(asyncio.ensure_future(timed(True)))
+                    else:
+                        self._count("skipped")
+            self._record_decision(hedged)
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=lambda t: t is not primary):
+                    if task.exception() is not None:
+                        if task is primary or error is None:
+                            error = task.exception()
+                        continue
+                    is_hedge, value, latency = task.result()
+                    self.latency.record(latency)
+                    if is_valid(value):
+                        if is_hedge:
+                            elapsed = loop.time() - start
+                            self._count("wins")
+                            tail = self.latency.tail_mean(delay)
+                            if tail is not None and tail > elapsed:
+                                self._count("estimated_saved_seconds", tail - elapsed)
+                            logger.info(f"[{label}] Hedge request won after {elapsed:.1f}s")
+                        return value
+                    if fallback is None or not is_hedge:
+                        fallback = (value,)
+        finally:
+            if primary in pending:
+                # The primary lost to the hedge: it took at least this long
+                self.latency.record(loop.time() - primary_sent)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        if fallback is not None:
+            return fallback[0]
+        raise error
+
+
+_policies: Dict[str, HedgePolicy] = {}
+_policies_lock = threading.Lock()
+
+
+def get_hedge_policy(name: str) -> HedgePolicy:
+    """Return the process-wide hedge policy for a provider."""
+    with _policies_lock:
+        if name not in _policies:
+            _policies[name] = HedgePolicy(name)
+        return _policies[name]
+
+
+def get_hedge_stats(name: str) -> dict:
+    """Hedge counters and hedge rate for a provider (for /metrics)."""
+    prefix = f"hedge.{name}."
+    stats = {k[len(prefix):]: v for k, v in metrics.snapshot(prefix).items()}
+    calls = stats.get("calls", 0)
+    stats["hedge_rate"] = round(stats.get("hedged", 0) / calls, 4) if calls else 0.0
+    return stats
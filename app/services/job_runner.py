@@ -0,0 +1,208 @@
+"""
+Embedded asyncio job runner (TASK_BACKEND=embedded).
+
+Runs the essay pipeline inside the FastAPI process, so a single-node
+deployment needs neither Redis nor a Celery worker. Jobs are the rows of the
+existing ``tasks`` table: a task whose status is still ``processing`` is
+pending work, which makes crash recovery a query at startup. Higher
+``priority`` runs first; failures are retried with exponential backoff up to
+JOB_MAX_ATTEMPTS, with ``attempts`` and ``last_error`` persisted on the row.
+
+Within a priority, shorter size classes run first (see app/dispatch.py), and
+JOB_SHORT_WORKERS of the coroutines serve only short essays, so a burst of
+long essays cannot hold every slot. Short essays are also offered to the
+general workers; whichever takes the entry first runs it.
+"""
+import os
+import time
+import asyncio
+import itertools
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select, update
+
+from app.dispatch import SIZE_CLASSES, record_queue_wait, size_class_for_tokens
+from app.models import Task
+from app.pipeline import mark_task_failed, process_task
+from app.services.dead_letter import record_dead_letter
+from app.services.rate_limit import ProviderUnavailableError
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "8"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "5"))
+JOB_DRAIN_TIMEOUT = float(os.getenv("JOB_DRAIN_TIMEOUT", "30"))
+# Model call attempts inside one runner attempt; retries beyond that go
+# through the runner's backoff (like TASK_INLINE_ATTEMPTS for Celery)
+JOB_INLINE_ATTEMPTS = int(os.getenv("JOB_INLINE_ATTEMPTS", "1"))
+# Coroutines reserved for short essays, on top of JOB_CONCURRENCY
+JOB_SHORT_WORKERS = int(os.getenv("JOB_SHORT_WORKERS", "2"))
+
+_CLASS_RANK = {size_class: rank for rank, size_class in enumerate(SIZE_CLASSES)}
+
+
+class EmbeddedJobRunner:
+    """In-process priority queues of task IDs processed by N coroutines."""
+
+    def __init__(
+        self,
+        session_factory,
+        concurrency: int = JOB_CONCURRENCY,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        retry_backoff: float = JOB_RETRY_BACKOFF,
+        short_workers: int = JOB_SHORT_WORKERS,
+    ):
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.short_workers = short_workers
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._short_queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+        self._retry_handles: Dict[int, asyncio.TimerHandle] = {}
+        self._stopping = False
+        self._seq = itertools.count()
+        # task ID -> sequence number of its live queue entry
+        self._queued: Dict[int, int] = {}
+        self._running = set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._queued)
+
+    @property
+    def running(self) -> int:
+        return len(self._running)
+
+    async def start(self) -> None:
+        """Re-queue unfinished tasks from the database and start the workers."""
+        self._queue = asyncio.PriorityQueue()
+        self._short_queue = asyncio.PriorityQueue()
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(Task.id, Task.priority, func.length(Task.original_text))
+                .where(Task.status == "processing")
+                .order_by(Task.id)
+            )
+            recovered = result.all()
+        for task_id, priority, length in recovered:
+            self.enqueue(task_id, priority or 0, size_class_for_tokens((length or 0) // 4))
+        if recovered:
+            logger.info(f"Recovered {len(recovered)} unfinished tasks")
+
+        self._workers = [asyncio.create_task(self._work(self._queue)) for _ in range(self.concurrency)]
+        self._workers += [asyncio.create_task(self._work(self._short_queue)) for _ in range(self.short_workers)]
+        logger.info(
+            f"Embedded job runner started with concurrency {self.concurrency} "
+            f"(+{self.short_workers} reserved for short essays)"
+        )
+
+    def enqueue(self, task_id: int, priority: int = 0, size_class: str = "standard") -> None:
+        """
+        Queue a task for processing (ignored if it is already queued or running).
+
+        Args:
+            task_id: Task ID
+            priority: Higher runs first
+            size_class: Size class; shorter classes run first within a priority
+        """
+        self._retry_handles.pop(task_id, None)
+        if self._stopping or task_id in self._queued or task_id in self._running:
+            return
+        seq = next(self._seq)
+        self._queued[task_id] = seq
+        entry = (-priority, _CLASS_RANK.get(size_class, 1), seq, task_id, size_class, time.time())
+        self._queue.put_nowait(entry)
+        if size_class == "short" and self.short_workers > 0:
+            self._short_queue.put_nowait(entry)
+
+    async def _work(self, queue: asyncio.PriorityQueue) -> None:
+        while True:
+            neg_priority, _, seq, task_id, size_class, enqueued_at = await queue.get()
+            # Skip copies already taken from the other queue
+            if self._queued.get(task_id) != seq:
+                queue.task_done()
+                continue
+            del self._queued[task_id]
+            if self._stopping:
+                queue.task_done()
+                continue
+            record_queue_wait(size_class, time.time() - enqueued_at)
+            self._running.add(task_id)
+            try:
+                await self._run_once(task_id, -neg_priority, size_class)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job runner error for task {task_id}: {e}", exc_info=True)
+            finally:
+                self._running.discard(task_id)
+                queue.task_done()
+
+    async def _run_once(self, task_id: int, priority: int, size_class: str) -> None:
+        async with self.session_factory() as session:
+            await session.execute(
+                update(Task).where(Task.id == task_id).values(attempts=Task.attempts + 1)
+            )
+            await session.commit()
+            attempts = (await session.execute(select(Task.attempts).where(Task.id == task_id))).scalar_one_or_none()
+        if attempts is None:
+            return
+
+        try:
+            await process_task(task_id, self.session_factory, max_retries=JOB_INLINE_ATTEMPTS)
+        except asyncio.CancelledError:
+            # Shutdown: the row stays "processing" and is recovered on restart
+            raise
+        except ProviderUnavailableError as e:
+            # Provider unhealthy or over quota: requeue without using up an attempt
+            logger.warning(f"Requeuing task {task_id} in {e.retry_after:.0f}s: {e}")
+            async with self.session_factory() as session:
+                await session.execute(update(Task).where(Task.id == task_id).values(attempts=Task.attempts - 1))
+                await session.commit()
+            self._retry_handles[task_id] = asyncio.get_running_loop().call_later(
+                max(1.0, e.retry_after), self.enqueue, task_id, priority, size_class
+            )
+        except Exception as e:
+            error = str(e)
+            if attempts < self.max_attempts:
+                delay = self.retry_backoff * (2 ** (attempts - 1))
+                logger.warning(
+                    f"Task {task_id} failed (attempt {attempts}/{self.max_attempts}), retrying in {delay:.0f}s: {error}"
+                )
+                async with self.session_factory() as session:
+                    await session.execute(update(Task).where(Task.id == task_id).values(last_error=error[:2000]))
+                    await session.commit()
+                self._retry_handles[task_id] = asyncio.get_running_loop().call_later(
+                    delay, self.enqueue, task_id, priority, size_class
+                )
+            else:
+                logger.error(f"Task {task_id} failed after {attempts} attempts: {error}")
+                await mark_task_failed(task_id, self.session_factory, error)
+                record_dead_letter(task_id, error, attempts, backend="embedded")
+
+    async def stop(self, timeout: float = JOB_DRAIN_TIMEOUT) -> None:
+        """
+        Stop taking new jobs and give running ones up to ``timeout`` seconds.
+
+        Unfinished tasks keep status ``processing`` and are recovered on the
+        next start.
+        """
+        self._stopping = True
+        for handle in self._retry_handles.values():
+            handle.cancel()
+        self._retry_handles.clear()
+        if self._running:
+            logger.info(f"Waiting for {len(self._running)} running jobs")
+            deadline = asyncio.get_running_loop().time() + timeout
+            while self._running and asyncio.get_running_loop().time() < deadline:
+                await asyncio.sleep(0.1)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Embedded job runner stopped")
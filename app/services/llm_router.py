@@ -0,0 +1,272 @@
+"""
+LLM providers and a latency-aware router for text-only essay analysis.
+
+Each provider wraps one chat API behind a LangChain runnable, so the AI
+service can build ``prompt | provider.chat_model`` regardless of vendor:
+
+- ``zhipu``: ChatZhipuAI (ZHIPU_API_KEY, ZHIPU_MODEL)
+- ``dashscope``: Qwen through DashScope's OpenAI-compatible mode
+  (DASHSCOPE_API_KEY, DASHSCOPE_MODEL, DASHSCOPE_BASE_URL), as in zuowen/
+- ``deepseek``: DeepSeek's OpenAI-compatible API (DEEPSEEK_API_KEY,
+  DEEPSEEK_MODEL, DEEPSEEK_BASE_URL), as in deepseek/backend/
+- ``stub``: any local OpenAI-compatible server (LLM_STUB_BASE_URL), e.g.
+  ``python zuowen/mock_dashscope.py --reply echo`` for tests and load runs
+
+LLM_PROVIDERS lists the providers to use in order of preference; those
+without credentials are skipped. The router keeps a sliding window of
+latency and errors per provider and orders candidates for every call:
+providers with an open circuit or an error rate above ROUTER_MAX_ERROR_RATE
+go last, and among healthy ones the fastest (median latency, within
+ROUTER_LATENCY_TOLERANCE) wins, ties going to the configured order. The AI
+service fails over to the next candidate when a call fails.
+
+Provider configuration and statistics import no LLM client code, so the API
+can report them in GET /metrics.
+"""
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+from app.services import metrics
+from app.services.rate_limit import get_circuit_breaker
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+LLM_PROVIDERS = [name.strip() for name in os.getenv("LLM_PROVIDERS", "zhipu").split(",") if name.strip()]
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+
+ROUTER_POLICY = os.getenv("ROUTER_POLICY", "latency")  # latency / priority
+ROUTER_WINDOW_SECONDS = float(os.getenv("ROUTER_WINDOW_SECONDS", "300"))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "5"))
+ROUTER_MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5"))
+ROUTER_LATENCY_TOLERANCE = float(os.getenv("ROUTER_LATENCY_TOLERANCE", "1.2"))
+# Share of calls sent to a random healthy provider to keep its stats fresh
+ROUTER_EXPLORE = float(os.getenv("ROUTER_EXPLORE", "0.05"))
+
+# name -> (API key env, model env, default model, base URL env, default base URL)
+PROVIDER_SPECS = {
+    "zhipu": ("ZHIPU_API_KEY", "ZHIPU_MODEL", "glm-4", None, None),
+    "dashscope": (
+        "DASHSCOPE_API_KEY", "DASHSCOPE_MODEL", "qwen-plus",
+        "DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1",
+    ),
+    "deepseek": ("DEEPSEEK_API_KEY", "DEEPSEEK_MODEL", "deepseek-chat", "DEEPSEEK_BASE_URL", "https://api.deepseek.com"),
+    "stub": ("LLM_STUB_API_KEY", "LLM_STUB_MODEL", "stub", "LLM_STUB_BASE_URL", None),
+}
+
+_ROLES = {"human": "user", "ai": "assistant", "system": "system"}
+
+
+class LLMProvider:
+    """One configured chat API; ``chat_model`` is built on first use."""
+
+    def __init__(self, name: str, model: str, api_key: str, base_url: Optional[str] = None):
+        self.name = name
+        self.model = model
+        self.api_key = api_key
+        self.base_url = base_url
+        self._chat_model = None
+        self._lock = threading.Lock()
+
+    @property
+    def cache_tag(self) -> str:
+        """Identifies this provider and model in analysis cache keys."""
+        if self.name == "zhipu":
+            # Same key as before routing existed
+            return self.model
+        return f"{self.name}:{self.model}"
+
+    @property
+    def chat_model(self):
+        with self._lock:
+            if self._chat_model is None:
+                self._chat_model = self._build_zhipu() if self.name == "zhipu" else self._build_openai_compatible()
+            return self._chat_model
+
+    def _build_zhipu(self):
+        # Try different import paths for ChatZhipuAI
+        try:
+            from langchain.chat_models import ChatZhipuAI
+        except ImportError:
+            try:
+                from langchain_community.chat_models import ChatZhipuAI
+            except ImportError:
+                from langchain_zhipuai import ChatZhipuAI
+        try:
+            # Try with zhipuai_api_key parameter
+            return ChatZhipuAI(zhipuai_api_key=self.api_key, model=self.model, temperature=0.7)
+        except TypeError:
+            # Fallback: try with api_key parameter
+            return ChatZhipuAI(api_key=self.api_key, model=self.model, temperature=0.7)
+
+    def _build_openai_compatible(self):
+        try:
+            from openai import AsyncOpenAI
+            from langchain_core.messages import AIMessage
+            from langchain_core.runnables import RunnableLambda
+        except ImportError as e:
+            raise ImportError(
+                f"Provider {self.name} needs the OpenAI client. Please install: pip install openai"
+            ) from e
+
+        client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, timeout=LLM_TIMEOUT, max_retries=0)
+
+        async def invoke(prompt_value) -> AIMessage:
+            messages = [
+                {"role": _ROLES.get(message.type, "user"), "content": message.content}
+                for message in prompt_value.to_messages()
+            ]
+            response = await client.chat.completions.create(
+                model=self.model, messages=messages, temperature=0.7
+            )
+            return AIMessage(content=response.choices[0].message.content or "")
+
+        return RunnableLambda(invoke, name=f"{self.name}:{self.model}")
+
+
+class ProviderHealth:
+    """Sliding time window of call outcomes for one provider."""
+
+    def __init__(self, window_seconds: float = ROUTER_WINDOW_SECONDS, max_samples: int = 1000):
+        self.window_seconds = window_seconds
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float) -> None:
+        while self._samples and self._samples[0][0] < now - self.window_seconds:
+            self._samples.popleft()
+
+    def record(self, latency: float, ok: bool) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._samples.append((now, latency, ok))
+            self._trim(now)
+
+    def snapshot(self) -> dict:
+        """Sample count, error rate and median latency of successful calls."""
+        with self._lock:
+            self._trim(time.monotonic())
+            samples = list(self._samples)
+        latencies = sorted(latency for _, latency, ok in samples if ok)
+        errors = sum(1 for _, _, ok in samples if not ok)
+        return {
+            "samples": len(samples),
+            "error_rate": errors / len(samples) if samples else 0.0,
+            "p50_latency": latencies[len(latencies) // 2] if latencies else None,
+        }
+
+
+class LLMRouter:
+    """Orders providers by health and latency for each call."""
+
+    def __init__(self, providers: List[LLMProvider], policy: str = ROUTER_POLICY):
+        self.providers = providers
+        self.policy = policy
+        self._health: Dict[str, ProviderHealth] = {p.name: ProviderHealth() for p in providers}
+
+    def _degraded(self, name: str) -> bool:
+        health = self._health[name].snapshot()
+        return health["samples"] >= ROUTER_MIN_SAMPLES and health["error_rate"] > ROUTER_MAX_ERROR_RATE
+
+    async def candidates(self, exclude=()) -> List[LLMProvider]:
+        """
+        Providers to try for a call, best first.
+
+        Args:
+            exclude: Names of providers that already failed this call
+
+        Returns:
+            List of providers (possibly empty)
+        """
+        providers = [p for p in self.providers if p.name not in exclude]
+        if len(providers) <= 1:
+            return providers
+        order = {p.name: i for i, p in enumerate(self.providers)}
+        unhealthy = set()
+        for p in providers:
+            if self._degraded(p.name) or await get_circuit_breaker(p.name).state() == "open":
+                unhealthy.add(p.name)
+        healthy = [p for p in providers if p.name not in unhealthy]
+
+        if self.policy == "latency" and len(healthy) > 1:
+            if ROUTER_EXPLORE > 0 and random.random() < ROUTER_EXPLORE:
+                random.shuffle(healthy)
+            else:
+                latencies = {p.name: self._health[p.name].snapshot()["p50_latency"] for p in healthy}
+                known = [v for v in latencies.values() if v is not None]
+                fastest = min(known) if known else 0.0
+
+                def latency_key(p: LLMProvider):
+                    latency = latencies[p.name]
+                    # Unmeasured providers and those close to the fastest tie
+                    if latency is None or latency <= fastest * ROUTER_LATENCY_TOLERANCE:
+                        return (0.0, order[p.name])
+                    return (latency, order[p.name])
+
+                healthy.sort(key=latency_key)
+        rest = sorted((p for p in providers if p.name in unhealthy), key=lambda p: order[p.name])
+        return healthy + rest
+
+    def record(self, name: str, latency: float, ok: bool) -> None:
+        """Record the outcome of one call."""
+        self._health[name].record(latency, ok)
+        metrics.incr(f"llm.{name}.calls")
+        if ok:
+            metrics.incr(f"llm.{name}.latency_seconds", latency)
+        else:
+            metrics.incr(f"llm.{name}.errors")
+
+    def stats(self) -> Dict[str, dict]:
+        return {p.name: {"model": p.model, **self._health[p.name].snapshot()} for p in self.providers}
+
+
+def configured_providers() -> List[LLMProvider]:
+    """Providers from LLM_PROVIDERS that have credentials (or a base URL for the stub)."""
+    providers = []
+    for name in LLM_PROVIDERS:
+        if name not in PROVIDER_SPECS:
+            logger.warning(f"Unknown LLM provider in LLM_PROVIDERS: {name}")
+            continue
+        key_env, model_env, default_model, url_env, default_url = PROVIDER_SPECS[name]
+        api_key = os.getenv(key_env, "stub" if name == "stub" else "")
+        base_url = os.getenv(url_env, default_url) if url_env else None
+        if not api_key or (name == "stub" and not base_url):
+            logger.warning(f"LLM provider {name} is not configured ({key_env} not set), skipping")
+            continue
+        providers.append(LLMProvider(name, os.getenv(model_env, default_model), api_key, base_url))
+    return providers
+
+
+_router: Optional[LLMRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> LLMRouter:
+    """Return the process-wide router."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = LLMRouter(configured_providers())
+            names = ", ".join(f"{p.name} ({p.model})" for p in _router.providers) or "none"
+            logger.info(f"LLM providers: {names}; routing policy {_router.policy}")
+        return _router
+
+
+def get_llm_stats() -> Dict[str, dict]:
+    """Cross-process call counters per configured provider (for /metrics)."""
+    stats = {}
+    for name in LLM_PROVIDERS:
+        prefix = f"llm.{name}."
+        counters = {k[len(prefix):]: v for k, v in metrics.snapshot(prefix).items()}
+        calls = counters.get("calls", 0)
+        errors = counters.get("errors", 0)
+        ok = calls - errors
+        counters["error_rate"] = round(errors / calls, 4) if calls else 0.0
+        counters["mean_latency"] = round(counters.get("latency_seconds", 0) / ok, 3) if ok else None
+        stats[name] = counters
+    return stats
@@ -0,0 +1,164 @@
+"""
+Lightweight counters shared between the API and worker processes.
+
+Counters are kept in-process and, when Redis is reachable, mirrored into a
+single Redis hash so that ``GET /metrics`` on the API can report what the
+Celery workers observed.
+
+``incr`` only touches memory: increments are buffered and a background thread
+sends them to Redis in one pipeline every METRICS_FLUSH_INTERVAL seconds.
+If Redis fails, the buffered increments are kept and the mirror is retried
+after METRICS_RETRY_INTERVAL seconds.
+"""
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, Optional
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis is optional for embedded deployments
+    redis = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+METRICS_REDIS_URL = os.getenv("METRICS_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+METRICS_REDIS_KEY = os.getenv("METRICS_REDIS_KEY", "essay_polisher:metrics")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1"))
+# Seconds before retrying Redis after an error
+METRICS_RETRY_INTERVAL = float(os.getenv("METRICS_RETRY_INTERVAL", "30"))
+
+_lock = threading.Lock()
+_local_counters: Dict[str, float] = defaultdict(float)
+# Increments not yet sent to Redis
+_pending: Dict[str, float] = defaultdict(float)
+_flusher: Optional[threading.Thread] = None
+_redis_client = None
+_redis_enabled = bool(METRICS_REDIS_URL) and redis is not None
+_retry_at = 0.0
+
+
+def _get_redis():
+    """Return the shared Redis client, or None while Redis is unavailable."""
+    global _redis_client
+    if not _redis_enabled or time.monotonic() < _retry_at:
+        return None
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(
+            METRICS_REDIS_URL,
+            socket_timeout=0.2,
+            socket_connect_timeout=0.2,
+        )
+    return _redis_client
+
+
+def _redis_failed(error: Exception) -> None:
+    global _retry_at
+    if _retry_at <= time.monotonic():
+        logger.warning(
+            f"Metrics Redis mirror unavailable, using in-process counters for {METRICS_RETRY_INTERVAL:.0f}s: {error}"
+        )
+    _retry_at = time.monotonic() + METRICS_RETRY_INTERVAL
+
+
+def flush() -> None:
+    """Send buffered increments to Redis (kept for the next flush on failure)."""
+    client = _get_redis()
+    if client is None:
+        return
+    with _lock:
+        if not _pending:
+            return
+        deltas = dict(_pending)
+        _pending.clear()
+    try:
+        pipe = client.pipeline(transaction=False)
+        for name, amount in deltas.items():
+            pipe.hincrbyfloat(METRICS_REDIS_KEY, name, amount)
+        pipe.execute()
+    except Exception as e:
+        _redis_failed(e)
+        with _lock:
+            for name, amount in deltas.items():
+                _pending[name] += amount
+
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        flush()
+
+
+def _start_flusher() -> None:
+    global _flusher
+    with _lock:
+        if _flusher is not None:
+            return
+        _flusher = threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True)
+        _flusher.start()
+
+
+def _reset_after_fork() -> None:
+    # Prefork Celery children inherit the counters but not the flush thread
+    global _lock, _flusher, _redis_client
+    _lock = threading.Lock()
+    _flusher = None
+    _redis_client = None
+    _local_counters.clear()
+    _pending.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(flush)
+
+
+def incr(name: str, amount: float = 1) -> None:
+    """
+    Increment a counter.
+
+    Args:
+        name: Dotted counter name, e.g. ``analysis_cache.hits``
+        amount: Increment (may be fractional, e.g. seconds)
+    """
+    with _lock:
+        _local_counters[name] += amount
+        if _redis_enabled:
+            _pending[name] += amount
+    if _redis_enabled and _flusher is None:
+        _start_flusher()
+
+
+def snapshot(prefix: Optional[str] = None) -> Dict[str, float]:
+    """
+    Read all counters, preferring the cross-process Redis view.
+
+    Increments of this process not yet flushed are added to the Redis view.
+
+    Args:
+        prefix: Only return counters whose name starts with this prefix
+
+    Returns:
+        dict: Counter name to value
+    """
+    values: Dict[str, float] = {}
+    client = _get_redis()
+    if client is not None:
+        try:
+            raw = client.hgetall(METRICS_REDIS_KEY)
+            values = {k.decode(): float(v) for k, v in raw.items()}
+        except Exception as e:
+            _redis_failed(e)
+    with _lock:
+        if values:
+            for name, amount in _pending.items():
+                values[name] = values.get(name, 0.0) + amount
+        else:
+            values = dict(_local_counters)
+    if prefix:
+        values = {k: v for k, v in values.items() if k.startswith(prefix)}
+    return values
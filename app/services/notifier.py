@@ -0,0 +1,205 @@
+"""
+Task state change notifications over Redis pub/sub.
+
+The worker publishes ``{"task_id": ..., "status": ...}`` on a single channel
+whenever a task changes state. Each API process keeps one subscription and
+fans events out to in-process waiters, so long-polling and SSE clients are
+woken immediately instead of re-querying the database.
+
+Events published in the API process itself (the embedded job runner) go
+straight to the local waiters. The Redis publish runs on a background thread
+so a slow or unreachable Redis never blocks the event loop; after a failure
+publishing pauses for NOTIFY_RETRY_INTERVAL seconds.
+
+If Redis is unreachable, other processes' waiters simply time out after
+NOTIFY_FALLBACK_POLL seconds and the caller re-checks the database, so
+clients still see completion (just later).
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Set
+
+try:
+    import redis
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - redis is optional for embedded deployments
+    redis = None
+    aioredis = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+NOTIFY_REDIS_URL = os.getenv("NOTIFY_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+NOTIFY_CHANNEL = os.getenv("NOTIFY_CHANNEL", "essay_polisher:task_events")
+NOTIFY_FALLBACK_POLL = float(os.getenv("NOTIFY_FALLBACK_POLL", "2"))
+# Seconds to stop publishing to Redis after an error
+NOTIFY_RETRY_INTERVAL = float(os.getenv("NOTIFY_RETRY_INTERVAL", "30"))
+
+# Tags this process's events so its own subscription skips them
+_ORIGIN = uuid.uuid4().hex
+
+_publisher = None
+_publish_executor: Optional[ThreadPoolExecutor] = None
+_retry_at = 0.0
+
+
+def _publish_redis(message: str) -> None:
+    global _publisher, _retry_at
+    if time.monotonic() < _retry_at:
+        return
+    try:
+        if _publisher is None:
+            _publisher = redis.Redis.from_url(NOTIFY_REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+        _publisher.publish(NOTIFY_CHANNEL, message)
+    except Exception as e:
+        logger.warning(f"Task event Redis unavailable, pausing publishes for {NOTIFY_RETRY_INTERVAL:.0f}s: {e}")
+        _retry_at = time.monotonic() + NOTIFY_RETRY_INTERVAL
+
+
+def publish_task_event(task_id: int, status: str) -> None:
+    """
+    Publish a task state change (best effort, never raises or blocks).
+
+    Args:
+        task_id: Task ID
+        status: New task status
+    """
+    global _publish_executor
+    event = {"task_id": task_id, "status": status, "origin": _ORIGIN}
+    if _hub is not None:
+        _hub.deliver(event)
+    if redis is None or not NOTIFY_REDIS_URL or time.monotonic() < _retry_at:
+        return
+    if _publish_executor is None:
+        # One thread keeps events in order
+        _publish_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task-events")
+    _publish_executor.submit(_publish_redis, json.dumps(event))
+
+
+class TaskEventHub:
+    """Single Redis subscription per process, fanned out to per-task queues."""
+
+    def __init__(self, url: str = NOTIFY_REDIS_URL, channel: str = NOTIFY_CHANNEL):
+        self.url = url
+        self.channel = channel
+        self.connected = False
+        self._waiters: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        self._listener: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        if self._listener is None and aioredis is not None and self.url:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                client = aioredis.Redis.from_url(self.url)
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    self.connected = True
+                    backoff = 1.0
+                    logger.info(f"Subscribed to task events on {self.channel}")
+                    async for message in pubsub.listen():
+                        if message.get("type") == "message":
+                            self._dispatch(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.connected:
+                    logger.warning(f"Task event subscription lost: {e}")
+                self.connected = False
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    def _dispatch(self, data) -> None:
+        try:
+            event = json.loads(data)
+            task_id = int(event["task_id"])
+        except (ValueError, KeyError, TypeError):
+            return
+        if event.get("origin") == _ORIGIN:
+            # Already delivered locally by publish_task_event
+            return
+        self._fan_out(task_id, event)
+
+    def _fan_out(self, task_id: int, event: dict) -> None:
+        for queue in list(self._waiters.get(task_id, ())):
+            queue.put_nowait(event)
+
+    def deliver(self, event: dict) -> None:
+        """Hand an event published in this process to the local waiters."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._fan_out(event["task_id"], event)
+        else:
+            loop.call_soon_threadsafe(self._fan_out, event["task_id"], event)
+
+    @asynccontextmanager
+    async def subscribe(self, task_id: int) -> AsyncIterator[asyncio.Queue]:
+        """
+        Receive events for one task while the context is open.
+
+        Subscribe *before* re-reading the task from the database so that a
+        change landing in between is not missed.
+        """
+        self.start()
+        queue: asyncio.Queue = asyncio.Queue()
+        self._waiters[task_id].add(queue)
+        try:
+            yield queue
+        finally:
+            waiters = self._waiters.get(task_id)
+            if waiters is not None:
+                waiters.discard(queue)
+                if not waiters:
+                    del self._waiters[task_id]
+
+    async def next_event(self, queue: asyncio.Queue, timeout: float) -> Optional[dict]:
+        """
+        Wait for the next event, at most ``timeout`` seconds.
+
+        Without a live subscription the wait is capped at NOTIFY_FALLBACK_POLL
+        so callers fall back to re-checking the database.
+        """
+        if not self.connected:
+            timeout = min(timeout, NOTIFY_FALLBACK_POLL)
+        try:
+            return await asyncio.wait_for(queue.get(), timeout=max(0.0, timeout))
+        except asyncio.TimeoutError:
+            return None
+
+
+_hub: Optional[TaskEventHub] = None
+
+
+def get_event_hub() -> TaskEventHub:
+    """Return the process-wide event hub."""
+    global _hub
+    if _hub is None:
+        _hub = TaskEventHub()
+    return _hub
@@ -0,0 +1,176 @@
+"""
+Recovery of malformed structured output from the model.
+
+GLM responses that fail ``PydanticOutputParser.parse`` are usually almost
+right: wrapped in a code fence or prose, cut off before the closing braces,
+carrying a trailing comma, or with one field missing or of the wrong type.
+Instead of paying for a full new generation, the AI service:
+
+1. repairs the JSON text locally (``repair_json``),
+2. validates it field by field (``validate_fields``), keeping every valid
+   top-level field and dropping invalid list items, and
+3. asks the model only for the fields still missing or invalid, merging the
+   answer back in (see ``ai_service._recover_output``).
+"""
+import re
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+_FENCE_RE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.DOTALL)
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _strip_to_json(text: str) -> str:
+    """Drop code fences and any prose before the first ``{`` or ``[``."""
+    fenced = _FENCE_RE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    return text[min(starts):] if starts else text
+
+
+def _close(body: str, stack: List[str]) -> str:
+    body = body.rstrip()
+    if body.endswith(","):
+        body = body[:-1]
+    elif body.endswith(":"):
+        # Dangling key without a value: drop the key as well
+        body = re.sub(r',?\s*"(?:[^"\\]|\\.)*"\s*:$', "", body)
+    return body + "".join(_CLOSERS[c] for c in reversed(stack))
+
+
+def repair_json(text: str) -> Optional[Any]:
+    """
+    Parse JSON from model output, fixing common defects locally.
+
+    Handles code fences and surrounding prose, trailing commas, text after the
+    top-level value, truncation (unterminated strings and unclosed objects or
+    arrays) and a dangling last member.
+
+    Args:
+        text: Raw model output
+
+    Returns:
+        The parsed value, or None if the text could not be repaired
+    """
+    candidate = _strip_to_json(text).strip()
+    try:
+        return json.loads(candidate)
+    except ValueError:
+        pass
+
+    out: List[str] = []
+    stack: List[str] = []
+    # Output length at the last comma of each open container
+    commas: List[Optional[int]] = []
+    in_string = escaped = False
+    for ch in candidate:
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+            commas.append(None)
+        elif ch in "}]":
+            # Trailing comma before a closer
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if not stack or _CLOSERS[stack[-1]] != ch:
+                break
+            stack.pop()
+            commas.pop()
+            out.append(ch)
+            if not stack:
+                break
+            continue
+        elif ch == "," and commas:
+            commas[-1] = len(out)
+        out.append(ch)
+
+    body = "".join(out)
+    if in_string:
+        body += '"'
+    attempts = [_close(body, stack)]
+    # Truncated inside the last member: retry without it
+    if commas and commas[-1] is not None:
+        attempts.append(_close("".join(out[:commas[-1]]), stack))
+    for attempt in attempts:
+        try:
+            return json.loads(attempt)
+        except ValueError:
+            continue
+    return None
+
+
+def validate_fields(model_cls: Type[BaseModel], data: Any) -> Tuple[Dict[str, Any], Dict[str, str], int]:
+    """
+    Validate data against a model field by field.
+
+    Invalid items of list fields are dropped; any other invalid or missing
+    required field is reported.
+
+    Args:
+        model_cls: Pydantic model class
+        data: Parsed JSON (anything; non-objects are treated as empty)
+
+    Returns:
+        Tuple of (valid field values, {field: error} for fields still
+        needed, number of list items dropped)
+    """
+    data = dict(data) if isinstance(data, dict) else {}
+    data = {k: v for k, v in data.items() if k in model_cls.model_fields}
+    dropped = 0
+    try:
+        model_cls.model_validate(data)
+        return data, {}, 0
+    except ValidationError as e:
+        errors = e.errors()
+
+    bad_items: Dict[str, set] = {}
+    field_errors: Dict[str, str] = {}
+    for error in errors:
+        loc = error["loc"]
+        field = str(loc[0]) if loc else "__root__"
+        if len(loc) > 1 and isinstance(loc[1], int) and isinstance(data.get(field), list):
+            bad_items.setdefault(field, set()).add(loc[1])
+        else:
+            field_errors.setdefault(field, error["msg"])
+
+    for field, indexes in bad_items.items():
+        if field in field_errors:
+            continue
+        data[field] = [item for i, item in enumerate(data[field]) if i not in indexes]
+        dropped += len(indexes)
+    for field in field_errors:
+        data.pop(field, None)
+    return data, field_errors, dropped
+
+
+def fields_schema(model_cls: Type[BaseModel], fields: List[str]) -> str:
+    """JSON schema restricted to the given top-level fields (for a follow-up prompt)."""
+    schema = model_cls.model_json_schema()
+    properties = schema.get("properties", {})
+    subset = {
+        "type": "object",
+        "properties": {name: properties[name] for name in fields if name in properties},
+        "required": [name for name in fields if name in properties],
+    }
+    if "$defs" in schema:
+        subset["$defs"] = schema["$defs"]
+    return json.dumps(subset, ensure_ascii=False)
@@ -0,0 +1,206 @@
+"""
+Content-addressed on-disk cache of rendered PDF reports.
+
+PDFs are stored under PDF_CACHE_DIR as ``<sha256>.pdf`` where the hash covers
+the report JSON, the original text and the template version (a digest of
+report.html and report.css), so identical reports are rendered once and any
+template change produces fresh files.
+
+With ``PDF_RENDER_MODE=lazy`` the worker only stores ``report_json``; the PDF
+is rendered on the first ``/download/{task_id}``. Concurrent requests for the
+same PDF in one process share a single render. With ``PDF_PRERENDER=1`` the
+API also renders pending PDFs in the background while the render pool is idle;
+a task whose render fails is retried with backoff and skipped after
+PDF_PRERENDER_MAX_FAILURES failures.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select
+
+from app.models import Task
+from app.schemas import FullReport
+from app.services import metrics
+from app.services.render_pool import get_render_pool
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+PDF_RENDER_MODE = os.getenv("PDF_RENDER_MODE", "eager")  # eager / lazy
+PDF_CACHE_DIR = Path(os.getenv("PDF_CACHE_DIR", "pdfs"))
+PDF_PRERENDER = os.getenv("PDF_PRERENDER", "0") == "1"
+PDF_PRERENDER_INTERVAL = float(os.getenv("PDF_PRERENDER_INTERVAL", "5"))
+PDF_PRERENDER_MAX_FAILURES = int(os.getenv("PDF_PRERENDER_MAX_FAILURES", "3"))
+
+_TEMPLATE_DIR = Path(__file__).parent.parent.parent / "templates"
+_TEMPLATE_FILES = ("report.html", "report.css")
+
+_inflight: Dict[str, asyncio.Future] = {}
+# task ID -> (failed pre-renders, monotonic time of the next attempt)
+_prerender_failures: Dict[int, Tuple[int, float]] = {}
+
+
+def _template_version() -> str:
+    digest = hashlib.sha256()
+    for name in _TEMPLATE_FILES:
+        digest.update((_TEMPLATE_DIR / name).read_bytes())
+    return digest.hexdigest()[:16]
+
+
+TEMPLATE_VERSION = _template_version()
+
+
+def pdf_cache_key(report: FullReport, original_text: str) -> str:
+    """
+    Hash a report, its original text and the template version.
+
+    Args:
+        report: Analysis report
+        original_text: The original English text
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    payload = json.dumps(
+        {
+            "report": report.model_dump(),
+            "original_text": original_text,
+            "template_version": TEMPLATE_VERSION,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def _render(report: FullReport, original_text: str, path: Path) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Unique per render: threads or loops in one process may render the same digest
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+    try:
+        await get_render_pool().render(report, original_text, str(tmp_path))
+        # Atomic publish: readers never see a partially written PDF
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return path
+
+
+async def get_or_render_pdf(report: FullReport, original_text: str) -> Path:
+    """
+    Return the cached PDF for a report, rendering it if needed.
+
+    Args:
+        report: Analysis report
+        original_text: The original English text
+
+    Returns:
+        Path: Location of the PDF file
+    """
+    key = pdf_cache_key(report, original_text)
+    path = PDF_CACHE_DIR / f"{key}.pdf"
+    if path.exists():
+        metrics.incr("pdf_cache.hits")
+        return path
+
+    loop = asyncio.get_running_loop()
+    future = _inflight.get(key)
+    if future is not None and future.get_loop() is loop:
+        metrics.incr("pdf_cache.coalesced")
+    else:
+        metrics.incr("pdf_cache.misses")
+        future = loop.create_task(_render(report, original_text, path))
+        _inflight[key] = future
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+    # Shield so one cancelled request does not cancel the shared render
+    return await asyncio.shield(future)
+
+
+async def ensure_task_pdf(session, task: Task) -> Optional[Path]:
+    """
+    Make sure a completed task has a rendered PDF and record its path.
+
+    Args:
+        session: Database session the task belongs to
+        task: Completed task with ``report_json``
+
+    Returns:
+        Optional[Path]: PDF location, or None if the task has no report
+    """
+    if task.pdf_path and Path(task.pdf_path).exists():
+        return Path(task.pdf_path)
+    if not task.report_json:
+        return None
+    path = await get_or_render_pdf(FullReport.model_validate(task.report_json), task.original_text)
+    task.pdf_path = str(path)
+    await session.commit()
+    return path
+
+
+async def prerender_loop(session_factory) -> None:
+    """
+    Render PDFs for completed tasks that have none while the pool is idle.
+
+    Args:
+        session_factory: Async session factory for the tasks database
+    """
+    pool = get_render_pool()
+    logger.info("PDF pre-rendering enabled")
+    while True:
+        await asyncio.sleep(PDF_PRERENDER_INTERVAL)
+        if not pool.idle:
+            continue
+        now = time.monotonic()
+        skipped = [
+            task_id for task_id, (failures, retry_at) in _prerender_failures.items()
+            if failures >= PDF_PRERENDER_MAX_FAILURES or retry_at > now
+        ]
+        try:
+            async with session_factory() as session:
+                query = select(Task.id).where(Task.status == "completed", Task.pdf_path.is_(None))
+                if skipped:
+                    query = query.where(Task.id.notin_(skipped))
+                result = await session.execute(query.order_by(Task.id.desc()).limit(max(1, pool.size)))
+                task_ids = result.scalars().all()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"PDF pre-rendering failed: {e}")
+            continue
+
+        for task_id in task_ids:
+            if not pool.idle:
+                break
+            # One session per task, so a failure cannot affect the rest of the batch
+            try:
+                async with session_factory() as session:
+                    task = await session.get(Task, task_id)
+                    if task is None:
+                        continue
+                    await ensure_task_pdf(session, task)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                _record_prerender_failure(task_id, e)
+                continue
+            _prerender_failures.pop(task_id, None)
+            metrics.incr("pdf_cache.prerendered")
+
+
+def _record_prerender_failure(task_id: int, error: Exception) -> None:
+    """Back off exponentially from a task whose PDF failed to render."""
+    failures = _prerender_failures.get(task_id, (0, 0.0))[0] + 1
+    _prerender_failures[task_id] = (failures, time.monotonic() + PDF_PRERENDER_INTERVAL * 2 ** failures)
+    metrics.incr("pdf_cache.prerender_failures")
+    if failures >= PDF_PRERENDER_MAX_FAILURES:
+        logger.error(f"Giving up pre-rendering the PDF of task {task_id} after {failures} failures: {error}")
+    else:
+        logger.warning(f"Pre-rendering the PDF of task {task_id} failed ({failures}/{PDF_PRERENDER_MAX_FAILURES}): {error}")
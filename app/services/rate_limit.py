@@ -0,0 +1,410 @@
+"""
+Cross-process rate limiting and circuit breaking for LLM provider calls.
+
+All worker processes share one token bucket per provider, sized to the
+provider quota (``<NAME>_RATE_LIMIT`` requests per second with a burst of
+``<NAME>_RATE_BURST``), so adding workers does not multiply the request rate.
+Refill and take happen atomically in a Redis Lua script using the Redis
+server clock.
+
+The circuit breaker opens for BREAKER_COOLDOWN seconds after
+BREAKER_FAILURE_THRESHOLD failed calls within BREAKER_WINDOW seconds. While
+it is open, calls fail fast with CircuitOpenError so callers can requeue the
+work instead of piling onto an unhealthy provider. After the cooldown a
+single probe call is let through (half-open); its outcome closes or reopens
+the circuit.
+
+Without Redis both fall back to per-process state. Redis commands use the
+synchronous client on a worker thread (``asyncio.to_thread``), so a slow
+Redis never blocks the event loop; the same client then works from the API
+loop and from each ``asyncio.run`` in the Celery worker.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis is optional for embedded deployments
+    redis = None
+
+from app.services import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+RATE_LIMIT_PREFIX = os.getenv("RATE_LIMIT_PREFIX", "essay_polisher:provider")
+# Longest a call waits for a token before giving up
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "60"))
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "60"))
+BREAKER_COOLDOWN = int(os.getenv("BREAKER_COOLDOWN", "30"))
+
+# Seconds before retrying Redis after an error
+_REDIS_RETRY_INTERVAL = 30.0
+
+# KEYS[1]: bucket hash; ARGV: rate (tokens/s), burst. Returns the wait in
+# seconds as a string ("0" when a token was taken).
+_TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or burst
+local ts = tonumber(data[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class ProviderUnavailableError(Exception):
+    """The provider cannot be called right now; requeue the work after ``retry_after`` seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(ProviderUnavailableError):
+    """Raised instead of calling a provider whose circuit is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit for {name} is open, retry in {retry_after:.0f}s", retry_after)
+        self.name = name
+
+
+class RateLimitTimeout(ProviderUnavailableError):
+    """Raised when no token became available within the maximum wait."""
+    pass
+
+
+class _RedisClient:
+    """Shared Redis client that backs off to local state while Redis is down."""
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL):
+        self.url = url
+        self._client = None
+        self._retry_at = 0.0
+
+    def get(self):
+        if redis is None or not self.url or time.monotonic() < self._retry_at:
+            return None
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        return self._client
+
+    def failed(self, error: Exception) -> None:
+        if self._retry_at <= time.monotonic():
+            logger.warning(f"Rate limit Redis unavailable, using per-process state: {error}")
+        self._retry_at = time.monotonic() + _REDIS_RETRY_INTERVAL
+
+
+_redis = _RedisClient()
+
+
+class TokenBucket:
+    """Token bucket shared across processes through Redis."""
+
+    def __init__(self, name: str, rate: float, burst: float):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.key = f"{RATE_LIMIT_PREFIX}:{name}:bucket"
+        self._script = None
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._ts = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _take_local(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._ts) * self.rate)
+            self._ts = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    async def try_acquire(self) -> float:
+        """
+        Take a token if one is available.
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until one is
+        """
+        client = _redis.get()
+        if client is not None:
+            try:
+                if self._script is None:
+                    self._script = client.register_script(_TOKEN_BUCKET_LUA)
+                return float(await asyncio.to_thread(self._script, keys=[self.key], args=[self.rate, self.burst]))
+            except Exception as e:
+                _redis.failed(e)
+        return self._take_local()
+
+    async def acquire(self, max_wait: float = RATE_LIMIT_MAX_WAIT) -> None:
+        """
+        Wait until a token is available.
+
+        Args:
+            max_wait: Maximum seconds to wait
+
+        Raises:
+            RateLimitTimeout: If no token became available in time
+        """
+        if not self.enabled:
+            return
+        start = time.monotonic()
+        waited = False
+        while True:
+            wait = await self.try_acquire()
+            if wait <= 0:
+                metrics.incr(f"rate_limit.{self.name}.acquired")
+                if waited:
+                    metrics.incr(f"rate_limit.{self.name}.waited")
+                    metrics.incr(f"rate_limit.{self.name}.wait_seconds", time.monotonic() - start)
+                return
+            if time.monotonic() - start + wait > max_wait:
+                metrics.incr(f"rate_limit.{self.name}.timeouts")
+                raise RateLimitTimeout(f"No {self.name} rate limit token within {max_wait:.0f}s", retry_after=wait)
+            waited = True
+            await asyncio.sleep(wait)
+
+    async def stats(self) -> dict:
+        """Current configuration and (approximate) available tokens."""
+        tokens = None
+        client = _redis.get()
+        if client is not None:
+            try:
+                raw = await asyncio.to_thread(client.hget, self.key, "tokens")
+                tokens = float(raw) if raw is not None else self.burst
+            except Exception as e:
+                _redis.failed(e)
+        if tokens is None:
+            tokens = self._tokens
+        return {"rate": self.rate, "burst": self.burst, "tokens": round(tokens, 2)}
+
+
+class _LocalState:
+    """In-process stand-in for the handful of Redis commands the breaker uses."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[str, int] = {}
+        self._expires: Dict[str, float] = {}
+
+    def _live(self, key: str) -> bool:
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._values.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._values
+
+    def exists(self, key: str) -> int:
+        with self._lock:
+            return int(self._live(key))
+
+    def ttl(self, key: str) -> int:
+        with self._lock:
+            if not self._live(key):
+                return -2
+            expires = self._expires.get(key)
+            return -1 if expires is None else max(0, int(expires - time.monotonic()))
+
+    def get(self, key: str) -> Optional[int]:
+        with self._lock:
+            return self._values.get(key) if self._live(key) else None
+
+    def set(self, key: str, value: int, ex: Optional[int] = None, nx: bool = False) -> bool:
+        with self._lock:
+            if nx and self._live(key):
+                return False
+            self._values[key] = value
+            if ex is not None:
+                self._expires[key] = time.monotonic() + ex
+            else:
+                self._expires.pop(key, None)
+            return True
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = (self._values.get(key, 0) if self._live(key) else 0) + 1
+            self._values[key] = value
+            return value
+
+    def expire(self, key: str, seconds: int) -> None:
+        with self._lock:
+            if self._live(key):
+                self._expires[key] = time.monotonic() + seconds
+
+    def delete(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._values.pop(key, None)
+                self._expires.pop(key, None)
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker with state shared through Redis."""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        window: int = BREAKER_WINDOW,
+        cooldown: int = BREAKER_COOLDOWN,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.cooldown = cooldown
+        prefix = f"{RATE_LIMIT_PREFIX}:{name}:breaker"
+        self._failures_key = f"{prefix}:failures"
+        self._open_key = f"{prefix}:open"
+        self._tripped_key = f"{prefix}:tripped"
+        self._probe_key = f"{prefix}:probe"
+        self._local = _LocalState()
+
+    async def _call(self, method: str, *args, **kwargs):
+        client = _redis.get()
+        if client is not None:
+            try:
+                return await asyncio.to_thread(getattr(client, method), *args, **kwargs)
+            except Exception as e:
+                _redis.failed(e)
+        return getattr(self._local, method)(*args, **kwargs)
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_threshold > 0
+
+    async def state(self) -> str:
+        """Return "closed", "open" or "half_open"."""
+        if await self._call("exists", self._open_key):
+            return "open"
+        if await self._call("exists", self._tripped_key):
+            return "half_open"
+        return "closed"
+
+    async def before_call(self) -> bool:
+        """
+        Check that a call may go ahead.
+
+        Returns:
+            bool: True if this call holds the half-open probe slot; a caller
+            that then does not make the call must release_probe()
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with a probe already running
+        """
+        if not self.enabled:
+            return False
+        state = await self.state()
+        if state == "closed":
+            return False
+        if state == "half_open" and await self._call("set", self._probe_key, 1, ex=self.cooldown, nx=True):
+            logger.info(f"Circuit for {self.name} half-open, letting a probe call through")
+            return True
+        ttl = await self._call("ttl", self._open_key)
+        metrics.incr(f"circuit_breaker.{self.name}.rejected")
+        raise CircuitOpenError(self.name, float(ttl) if ttl and ttl > 0 else float(self.cooldown))
+
+    async def release_probe(self) -> None:
+        """Give back a probe slot claimed by before_call() without making the call."""
+        if self.enabled:
+            await self._call("delete", self._probe_key)
+
+    async def record_success(self) -> None:
+        """Close the circuit after a successful call."""
+        if not self.enabled:
+            return
+        if await self._call("exists", self._tripped_key):
+            logger.info(f"Circuit for {self.name} closed")
+            metrics.incr(f"circuit_breaker.{self.name}.closed")
+        await self._call("delete", self._failures_key, self._tripped_key, self._probe_key)
+
+    async def record_failure(self) -> None:
+        """Count a failed call and open the circuit if the threshold is reached."""
+        if not self.enabled:
+            return
+        metrics.incr(f"circuit_breaker.{self.name}.failures")
+        failures = await self._call("incr", self._failures_key)
+        if failures == 1:
+            await self._call("expire", self._failures_key, self.window)
+        half_open = await self._call("exists", self._tripped_key) and not await self._call("exists", self._open_key)
+        if half_open or failures >= self.failure_threshold:
+            await self._call("set", self._open_key, 1, ex=self.cooldown)
+            await self._call("set", self._tripped_key, 1)
+            await self._call("delete", self._failures_key, self._probe_key)
+            metrics.incr(f"circuit_breaker.{self.name}.opened")
+            logger.warning(f"Circuit for {self.name} opened for {self.cooldown}s after {failures} failures")
+
+    async def stats(self) -> dict:
+        failures = await self._call("get", self._failures_key)
+        return {
+            "state": await self.state(),
+            "recent_failures": int(failures or 0),
+            "failure_threshold": self.failure_threshold,
+            "cooldown": self.cooldown,
+        }
+
+
+_limiters: Dict[str, TokenBucket] = {}
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str) -> TokenBucket:
+    """
+    Return the process-wide token bucket for a provider.
+
+    Configured by ``<NAME>_RATE_LIMIT`` (requests per second, 0 disables) and
+    ``<NAME>_RATE_BURST``.
+    """
+    with _registry_lock:
+        if name not in _limiters:
+            prefix = name.upper()
+            _limiters[name] = TokenBucket(
+                name,
+                rate=float(os.getenv(f"{prefix}_RATE_LIMIT", "5")),
+                burst=float(os.getenv(f"{prefix}_RATE_BURST", "10")),
+            )
+        return _limiters[name]
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Return the process-wide circuit breaker for a provider."""
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def _counters(prefix: str) -> Dict[str, float]:
+    return {k[len(prefix):]: v for k, v in metrics.snapshot(prefix).items()}
+
+
+async def get_provider_stats(name: str) -> dict:
+    """Limiter and breaker state plus counters for a provider (for /metrics)."""
+    return {
+        "rate_limit": {**await get_rate_limiter(name).stats(), **_counters(f"rate_limit.{name}.")},
+        "circuit_breaker": {**await get_circuit_breaker(name).stats(), **_counters(f"circuit_breaker.{name}.")},
+    }
@@ -0,0 +1,225 @@
+"""
+Persistent process pool for CPU-bound PDF rendering.
+
+WeasyPrint layout is CPU heavy and would otherwise block the worker's event
+loop while an LLM call could be in flight. Renders are shipped to a pool of
+long-lived processes, each of which imports WeasyPrint, compiles the Jinja
+template and parses the stylesheet once in its initializer. Submissions are
+bounded per worker process (callers wait once RENDER_MAX_PENDING renders are
+queued or running) and every render reports its queue wait and render time.
+
+Run the Celery worker with a thread pool (``-P threads``) so that many
+LLM-bound tasks share one render pool sized to the CPU count. Inside a
+daemonic prefork child, where processes cannot be spawned, renders fall back
+to a thread.
+"""
+import os
+import time
+import atexit
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from app.schemas import FullReport
+from app.services import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+RENDER_POOL_SIZE = int(os.getenv("RENDER_POOL_SIZE", str(os.cpu_count() or 1)))
+RENDER_MAX_PENDING = int(os.getenv("RENDER_MAX_PENDING", str(RENDER_POOL_SIZE * 2)))
+RENDER_POOL_START_METHOD = os.getenv("RENDER_POOL_START_METHOD", "spawn")
+# Render a tiny report when a render process starts (loads fonts before the first task)
+RENDER_WARMUP_DUMMY = os.getenv("RENDER_WARMUP_DUMMY", "1") == "1"
+
+
+def _init_render_process() -> None:
+    """Pool initializer: import WeasyPrint and parse template and stylesheet once."""
+    from app.services import pdf_service
+
+    start = time.perf_counter()
+    pdf_service.get_template()
+    pdf_service.get_stylesheet()
+    if RENDER_WARMUP_DUMMY:
+        try:
+            _dummy_render()
+        except Exception as e:
+            logger.warning(f"Warm-up render failed in process {os.getpid()}: {e}")
+    logger.info(f"Render process {os.getpid()} warmed up in {time.perf_counter() - start:.2f}s")
+
+
+def _dummy_render() -> None:
+    """Render a one-sentence report in memory so fonts and layout code are loaded."""
+    from weasyprint import HTML
+    from app.services import pdf_service
+
+    report = FullReport(
+        writing_goal_analysis="Warm-up",
+        sentence_analysis=[{"original": "This are a test.", "error": "are", "correction": "This is a test."}],
+        polished_version="This is a test.",
+    )
+    html_content = pdf_service.render_report_html(report, "This are a test.")
+    HTML(string=html_content).write_pdf(stylesheets=[pdf_service.get_stylesheet()])
+
+
+def _render_to_file(report_data: dict, original_text: str, output_path: str, submitted_at: float) -> dict:
+    """
+    Render one report to a PDF file (runs inside a pool process).
+
+    Args:
+        report_data: FullReport as a plain dict
+        original_text: The original English text
+        output_path: Where to write the PDF
+        submitted_at: time.time() when the render was submitted
+
+    Returns:
+        dict: Timing and size information for the render
+    """
+    from weasyprint import HTML
+    from app.services import pdf_service
+
+    started_at = time.time()
+    start = time.perf_counter()
+    html_content = pdf_service.render_report_html(FullReport.model_validate(report_data), original_text)
+    html_done = time.perf_counter()
+    pdf_bytes = HTML(string=html_content).write_pdf(stylesheets=[pdf_service.get_stylesheet()])
+    with open(output_path, "wb") as f:
+        f.write(pdf_bytes)
+    end = time.perf_counter()
+    return {
+        "queue_wait_s": max(0.0, started_at - submitted_at),
+        "html_s": html_done - start,
+        "pdf_s": end - html_done,
+        "render_s": end - start,
+        "size_bytes": len(pdf_bytes),
+        "pid": os.getpid(),
+    }
+
+
+class RenderPool:
+    """Bounded, warmed process pool rendering reports to PDF files."""
+
+    def __init__(self, size: int = RENDER_POOL_SIZE, max_pending: int = RENDER_MAX_PENDING):
+        self.size = size
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._use_threads = size <= 0
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Number of renders currently queued or running in this process."""
+        return self._in_flight
+
+    @property
+    def idle(self) -> bool:
+        return self._in_flight == 0
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self._use_threads:
+            return None
+        with self._lock:
+            if self._executor is None:
+                try:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.size,
+                        mp_context=multiprocessing.get_context(RENDER_POOL_START_METHOD),
+                        initializer=_init_render_process,
+                    )
+                except Exception as e:
+                    self._fall_back_to_threads(e)
+            return self._executor
+
+    def _fall_back_to_threads(self, error: Exception) -> None:
+        logger.warning(f"Render process pool unavailable, rendering in threads: {error}")
+        self._use_threads = True
+        self._executor = None
+
+    def warm_up(self) -> None:
+        """Start every pool process now instead of on the first renders."""
+        executor = self._get_executor()
+        if executor is None:
+            _init_render_process()
+            return
+        try:
+            for future in [executor.submit(os.getpid) for _ in range(self.size)]:
+                future.result()
+        except (AssertionError, BrokenProcessPool) as e:
+            # e.g. "daemonic processes are not allowed to have children"
+            self._fall_back_to_threads(e)
+
+    async def render(self, report: FullReport, original_text: str, output_path: str) -> dict:
+        """
+        Render a report to ``output_path`` without blocking the event loop.
+
+        Args:
+            report: Analysis report
+            original_text: The original English text
+            output_path: Where to write the PDF
+
+        Returns:
+            dict: Timing and size information for the render
+        """
+        if not self._slots.acquire(blocking=False):
+            # Poll on the loop rather than block a thread in acquire(): a
+            # cancelled wait then never takes a slot it cannot release. The
+            # semaphore is shared by every thread and loop using the pool.
+            wait_start = time.perf_counter()
+            delay = 0.005
+            while not self._slots.acquire(blocking=False):
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.05)
+            metrics.incr("pdf_render.backpressure_seconds", time.perf_counter() - wait_start)
+        with self._lock:
+            self._in_flight += 1
+        try:
+            args = (report.model_dump(), original_text, str(output_path), time.time())
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            try:
+                if executor is None:
+                    timing = await asyncio.to_thread(_render_to_file, *args)
+                else:
+                    timing = await loop.run_in_executor(executor, _render_to_file, *args)
+            except (AssertionError, BrokenProcessPool) as e:
+                self._fall_back_to_threads(e)
+                timing = await asyncio.to_thread(_render_to_file, *args)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+        metrics.incr("pdf_render.renders")
+        metrics.incr("pdf_render.render_seconds", timing["render_s"])
+        metrics.incr("pdf_render.queue_wait_seconds", timing["queue_wait_s"])
+        logger.info(
+            f"Rendered {output_path} in {timing['render_s']:.2f}s "
+            f"(html {timing['html_s']:.2f}s, pdf {timing['pdf_s']:.2f}s, "
+            f"queued {timing['queue_wait_s']:.2f}s, pid {timing['pid']})"
+        )
+        return timing
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+_pool: Optional[RenderPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_render_pool() -> RenderPool:
+    """Return the process-wide render pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RenderPool()
+            atexit.register(_pool.shutdown)
+        return _pool
@@ -1,137 +1,321 @@
 """
 Celery worker for processing essay analysis tasks.
+
+Start with: celery -A app.worker worker -P threads -c 32 -Q essays.short,essays.standard,essays.long,celery
+
+Essays are routed into size-class queues at submit time (see app/dispatch.py).
+To reserve capacity for short essays so they are never stuck behind long ones,
+run a second worker that consumes only the short queue and ``celery``:
+
+    celery -A app.worker worker -P threads -c 8 -Q essays.short,celery -n short@%h
+
+Batch submissions arrive as one ``process_batch`` message on the default
+``celery`` queue and are fanned out into the size-class queues from there, so
+at least one running worker must consume ``celery``; the fan-out is cheap and
+does not take essay capacity.
 """
 import os
+import time
+import random
 import logging
-from pathlib import Path
-from celery import Celery
+import threading
+from typing import Optional
+from celery import group
+from celery.signals import worker_process_init, worker_process_shutdown, worker_ready, worker_shutdown
 from asgiref.sync import async_to_sync
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy import select
+from sqlalchemy import update
+from app.celery_app import celery_app
+from app.database import build_engine, build_session_factory
+from app.dispatch import celery_priority, queue_for, record_queue_wait
 from app.models import Task
-from app.services.ai_service import analyze_essay
-from app.services.pdf_service import generate_pdf
-from app.schemas import FullReport
+from app.pipeline import mark_task_failed, process_task
+from app.services import metrics
+from app.services.async_runner import get_async_runner
+from app.services.dead_letter import record_dead_letter
+from app.services.rate_limit import ProviderUnavailableError
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Celery configuration
-REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-celery_app = Celery(
-    "essay_polisher",
-    broker=REDIS_URL,
-    backend=REDIS_URL,
-)
-
-celery_app.conf.update(
-    task_serializer="json",
-    accept_content=["json"],
-    result_serializer="json",
-    timezone="UTC",
-    enable_utc=True,
-)
-
-# Database configuration for Celery worker
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./essay_polisher.db")
-engine = create_async_engine(DATABASE_URL, echo=False, future=True)
-AsyncSessionLocal = async_sessionmaker(
-    engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
-    autocommit=False,
-    autoflush=False,
-)
-
-# PDF storage directory
-PDF_STORAGE_DIR = Path("pdfs")
-PDF_STORAGE_DIR.mkdir(exist_ok=True)
+# Execution mode: "loop" runs every task on one persistent event loop per
+# process (start the worker with -P threads -c <N> for concurrency);
+# "per_task" wraps each task in async_to_sync as before
+WORKER_ASYNC_MODE = os.getenv("WORKER_ASYNC_MODE", "loop")
+
+# Database configuration for Celery worker (same profiles as the API, see
+# app/database.py). In "loop" mode the engine and its connection pool live on
+# the shared loop
+engine = build_engine()
+AsyncSessionLocal = build_session_factory(engine)
+get_async_runner().on_close(engine.dispose)
+
+# Retry policy: failed tasks are rescheduled through Celery with exponential
+# backoff (TASK_RETRY_BACKOFF * 2^n seconds, capped at TASK_RETRY_MAX_DELAY)
+# instead of looping inside the task, so the slot serves other essays while
+# a failing one waits. After TASK_MAX_RETRIES retries the task is dead-lettered.
+TASK_MAX_RETRIES = int(os.getenv("TASK_MAX_RETRIES", "4"))
+TASK_RETRY_BACKOFF = float(os.getenv("TASK_RETRY_BACKOFF", "10"))
+TASK_RETRY_MAX_DELAY = float(os.getenv("TASK_RETRY_MAX_DELAY", "300"))
+TASK_INLINE_ATTEMPTS = int(os.getenv("TASK_INLINE_ATTEMPTS", "1"))
+
+# Errors a retry cannot fix (empty text, missing API key, invalid data)
+PERMANENT_ERRORS = (ValueError,)
+
+# Warm up LLM prompts, the render pool and the database pool when a worker
+# process starts instead of on its first essay. Prefork children run the
+# warm-up inside worker_process_init, so the parent waits up to
+# WORKER_PROC_ALIVE_TIMEOUT seconds for them (Celery's default is 4).
+WORKER_WARMUP = os.getenv("WORKER_WARMUP", "1") == "1"
+celery_app.conf.worker_proc_alive_timeout = float(os.getenv("WORKER_PROC_ALIVE_TIMEOUT", "60"))
+
+_warmed_pid = None
+_first_task_pid = None
+_first_task_lock = threading.Lock()
+
+
+async def _warm_up_database() -> None:
+    """Open a pooled connection so the first task does not pay for the connect."""
+    from sqlalchemy import text
+
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+def _warm_up() -> None:
+    """
+    Prepare this worker process for its first task.
+    
+    Builds the prompt templates and format instructions, starts the render
+    pool (each render process loads the template, stylesheet and fonts with
+    a dummy render) and opens a database connection on the shared loop.
+    Failures are logged; the task will then pay the cost itself.
+    """
+    global _warmed_pid
+    if _warmed_pid == os.getpid():
+        return
+    start = time.perf_counter()
+    
+    steps = [("ai_service", _warm_up_ai_service), ("render_pool", _warm_up_render_pool)]
+    if WORKER_ASYNC_MODE == "loop":
+        steps.append(("database", lambda: get_async_runner().run(_warm_up_database)))
+    for name, step in steps:
+        step_start = time.perf_counter()
+        try:
+            step()
+            logger.info(f"Warm-up {name} took {time.perf_counter() - step_start:.2f}s")
+        except Exception as e:
+            logger.warning(f"Warm-up {name} failed: {e}")
+    
+    elapsed = time.perf_counter() - start
+    _warmed_pid = os.getpid()
+    metrics.incr("worker.warmups")
+    metrics.incr("worker.warmup_seconds", elapsed)
+    logger.info(f"Worker process {_warmed_pid} warmed up in {elapsed:.2f}s")
+
+
+def _warm_up_ai_service() -> None:
+    from app.services import ai_service
+    
+    ai_service.warm_up()
+
+
+def _warm_up_render_pool() -> None:
+    from app.services.render_pool import get_render_pool
+    
+    get_render_pool().warm_up()
+
+
+def _record_first_task(elapsed: float) -> None:
+    """Record the latency of the first task this process completes, split by warm/cold start."""
+    global _first_task_pid
+    with _first_task_lock:
+        if _first_task_pid == os.getpid():
+            return
+        _first_task_pid = os.getpid()
+    kind = "warm" if _warmed_pid == os.getpid() else "cold"
+    metrics.incr(f"worker.first_task.{kind}")
+    metrics.incr(f"worker.first_task.{kind}_seconds", elapsed)
+    logger.info(f"First task in process {os.getpid()} took {elapsed:.2f}s ({kind} start)")
+
+
+def _run(coro_fn, *args):
+    """Run a coroutine function from a task thread in the configured async mode."""
+    if WORKER_ASYNC_MODE == "loop":
+        # Run on the process-wide event loop shared by all task threads
+        return get_async_runner().run(lambda: coro_fn(*args))
+    # Run async function in sync context using async_to_sync
+    return async_to_sync(coro_fn)(*args)
+
+
+def _retry_countdown(retries: int) -> float:
+    """Exponential backoff with jitter for Celery retry number ``retries + 1``."""
+    delay = min(TASK_RETRY_MAX_DELAY, TASK_RETRY_BACKOFF * 2 ** retries)
+    return random.uniform(delay / 2, delay)
 
 
 async def _process_task_async(task_id: int) -> None:
     """
     Async function to process a task.
     
+    Model calls make TASK_INLINE_ATTEMPTS attempts; anything beyond that is
+    a Celery retry, so the worker slot is released while the task waits.
+    
     Args:
         task_id: The task ID to process
     """
+    await process_task(task_id, AsyncSessionLocal, max_retries=TASK_INLINE_ATTEMPTS)
+
+
+async def _record_attempt(task_id: int, attempts: int, error: str) -> None:
+    """Store the attempt count and last error on the task row."""
     async with AsyncSessionLocal() as session:
-        try:
-            # Read task from database
-            result = await session.execute(select(Task).where(Task.id == task_id))
-            task = result.scalar_one_or_none()
-            
-            if not task:
-                logger.error(f"Task {task_id} not found")
-                return
-            
-            logger.info(f"Processing task {task_id}")
-            
-            # Update status to processing
-            task.status = "processing"
-            await session.commit()
-            
-            # Call AI service (async function in async context)
-            logger.info(f"Calling AI service for task {task_id}")
-            report: FullReport = await analyze_essay(
-                text=task.original_text,
-                context=task.context
-            )
-            
-            # Generate PDF
-            logger.info(f"Generating PDF for task {task_id}")
-            pdf_bytes = generate_pdf(report_data=report, original_text=task.original_text)
-            
-            # Save PDF file
-            pdf_filename = f"report_{task_id}.pdf"
-            pdf_path = PDF_STORAGE_DIR / pdf_filename
-            with open(pdf_path, "wb") as f:
-                f.write(pdf_bytes)
-            
-            logger.info(f"PDF saved to {pdf_path}")
-            
-            # Update task in database
-            task.status = "completed"
-            task.report_json = report.model_dump()
-            task.pdf_path = str(pdf_path)
-            await session.commit()
-            
-            logger.info(f"Task {task_id} completed successfully")
-        
-        except Exception as e:
-            logger.error(f"Error processing task {task_id}: {str(e)}", exc_info=True)
-            
-            # Update task status to failed
-            async with AsyncSessionLocal() as error_session:
-                result = await error_session.execute(select(Task).where(Task.id == task_id))
-                task = result.scalar_one_or_none()
-                if task:
-                    task.status = "failed"
-                    await error_session.commit()
-            
-            raise
-
-
-@celery_app.task(name="process_submission")
-def process_submission(task_id: int) -> dict:
+        await session.execute(
+            update(Task).where(Task.id == task_id).values(attempts=attempts, last_error=error[:2000])
+        )
+        await session.commit()
+
+
+async def _give_up(task_id: int, attempts: int, error: str) -> None:
+    """Mark a task failed after its last attempt."""
+    await _record_attempt(task_id, attempts, error)
+    await mark_task_failed(task_id, AsyncSessionLocal, error)
+
+
+@celery_app.task(name="process_submission", bind=True, max_retries=TASK_MAX_RETRIES)
+def process_submission(
+    self,
+    task_id: int,
+    last_error: Optional[str] = None,
+    size_class: str = "standard",
+    enqueued_at: Optional[float] = None,
+) -> dict:
     """
     Celery task to process essay submission.
     
+    Failures are retried through Celery with countdown backoff, carrying the
+    attempt count (``self.request.retries``) and the previous error. Once
+    retries are exhausted, or for errors retrying cannot fix, the task is
+    marked failed and recorded in the dead-letter queue.
+    
     Args:
         task_id: The task ID to process
+        last_error: Error of the previous attempt, if this is a retry
+        size_class: Size class the task was routed by
+        enqueued_at: Time the message became due, for queue wait metrics
     
     Returns:
         dict: Task processing result
     """
+    attempt = self.request.retries + 1
+    if enqueued_at is not None:
+        record_queue_wait(size_class, time.time() - enqueued_at)
     try:
-        logger.info(f"Starting Celery task for task_id: {task_id}")
+        logger.info(f"Starting Celery task for task_id: {task_id} (attempt {attempt}/{self.max_retries + 1})")
+        if last_error:
+            logger.info(f"Previous attempt for task {task_id} failed: {last_error}")
+        start = time.perf_counter()
         
-        # Run async function in sync context using async_to_sync
-        async_to_sync(_process_task_async)(task_id)
+        _run(_process_task_async, task_id)
         
-        return {"status": "success", "task_id": task_id}
+        _record_first_task(time.perf_counter() - start)
+        return {"status": "success", "task_id": task_id, "attempts": attempt}
+    
+    except ProviderUnavailableError as e:
+        # Provider unhealthy or over quota: free the slot and try again later
+        # without using up a retry
+        countdown = max(1, int(e.retry_after))
+        logger.warning(f"Requeuing task {task_id} in {countdown}s: {e}")
+        metrics.incr("worker.requeued")
+        process_submission.apply_async(
+            args=[task_id],
+            kwargs={"last_error": last_error, "size_class": size_class, "enqueued_at": time.time() + countdown},
+            countdown=countdown,
+            retries=self.request.retries,
+            queue=queue_for(size_class),
+        )
+        return {"status": "requeued", "task_id": task_id, "countdown": countdown}
     
     except Exception as e:
-        logger.error(f"Celery task failed for task_id {task_id}: {str(e)}", exc_info=True)
-        return {"status": "failed", "task_id": task_id, "error": str(e)}
+        error = str(e)
+        logger.error(f"Celery task failed for task_id {task_id} (attempt {attempt}): {error}", exc_info=True)
+        
+        if not isinstance(e, PERMANENT_ERRORS) and self.request.retries < self.max_retries:
+            countdown = _retry_countdown(self.request.retries)
+            _run(_record_attempt, task_id, attempt, error)
+            metrics.incr("worker.retries")
+            logger.warning(f"Retrying task {task_id} in {countdown:.0f}s")
+            raise self.retry(
+                kwargs={
+                    "last_error": error[:2000],
+                    "size_class": size_class,
+                    "enqueued_at": time.time() + countdown,
+                },
+                countdown=countdown,
+                queue=queue_for(size_class),
+            )
+        
+        _run(_give_up, task_id, attempt, error)
+        record_dead_letter(task_id, error, attempt, backend="celery")
+        metrics.incr("worker.dead_lettered")
+        return {"status": "failed", "task_id": task_id, "attempts": attempt, "error": error}
+
+
+@celery_app.task(name="process_batch")
+def process_batch(
+    task_ids: list,
+    priorities: Optional[list] = None,
+    size_classes: Optional[list] = None,
+    enqueued_at: Optional[float] = None,
+) -> dict:
+    """
+    Fan a batch submission out into one process_submission per task.
+    
+    The API enqueues a single message per batch; the group is expanded here
+    so the request path costs one broker round trip regardless of size. Each
+    task goes to the queue of its size class.
+    
+    Args:
+        task_ids: Task IDs created by the batch submission
+        priorities: Per-task priorities, defaults to 0
+        size_classes: Per-task size classes, defaults to "standard"
+        enqueued_at: Time the batch was submitted, so queue wait includes the fan-out
+    
+    Returns:
+        dict: Number of tasks enqueued
+    """
+    logger.info(f"Enqueuing batch of {len(task_ids)} tasks")
+    priorities = priorities or [0] * len(task_ids)
+    size_classes = size_classes or ["standard"] * len(task_ids)
+    enqueued_at = enqueued_at or time.time()
+    group(
+        process_submission.signature(
+            (task_id,),
+            {"size_class": size_class, "enqueued_at": enqueued_at},
+            queue=queue_for(size_class),
+            priority=celery_priority(priority),
+        )
+        for task_id, priority, size_class in zip(task_ids, priorities, size_classes)
+    ).apply_async()
+    return {"status": "enqueued", "count": len(task_ids)}
+
+
+@worker_shutdown.connect
+@worker_process_shutdown.connect
+def _drain_event_loop(**kwargs) -> None:
+    """Let in-flight essays finish and close the shared loop on shutdown."""
+    get_async_runner().drain()
+
+
+@worker_process_init.connect
+def _warm_up_process(**kwargs) -> None:
+    """Warm up each prefork child as it starts."""
+    if WORKER_WARMUP:
+        _warm_up()
+
 
+@worker_ready.connect
+def _warm_up_worker(sender=None, **kwargs) -> None:
+    """Warm up the main process when it runs tasks itself (-P threads / solo)."""
+    pool = getattr(sender, "pool", None)
+    if WORKER_WARMUP and type(pool).__module__ in ("celery.concurrency.thread", "celery.concurrency.solo"):
+        _warm_up()
@@ -0,0 +1,5 @@
+"""
+Performance benchmarks for the essay services.
+
+Run from the repository root, e.g. ``python -m benchmarks.render_bench``.
+"""
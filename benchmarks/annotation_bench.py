@@ -0,0 +1,115 @@
+"""
+Annotation microbenchmark: regex rescanning vs. the linear-time engine.
+
+Builds synthetic essays with thousands of sentences (half of them carrying an
+error finding) and times ``app.services.annotation`` against the previous
+``create_annotated_html`` algorithm, which re-searched the growing annotated
+string and rebuilt it by slicing for every finding.
+
+Usage:
+    python -m benchmarks.annotation_bench
+    python -m benchmarks.annotation_bench --sizes 1000 5000 20000 --legacy-max 5000
+"""
+import argparse
+import random
+import re
+import time
+from typing import List, Tuple
+
+from app.schemas import SentenceAnalysis
+from app.services.annotation import locate_error_spans, render_annotated_html
+
+WORDS = (
+    "the student go to school every day and study english with great interest "
+    "because she want to become a teacher who help children learn about world"
+).split()
+
+
+def make_document(num_sentences: int, seed: int = 0) -> Tuple[str, List[SentenceAnalysis]]:
+    """
+    Build a synthetic essay and its sentence analyses.
+
+    Args:
+        num_sentences: Number of sentences in the essay
+        seed: Random seed
+
+    Returns:
+        Tuple of (original text, analysis list)
+    """
+    rng = random.Random(seed)
+    sentences, analyses = [], []
+    for i in range(num_sentences):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(8, 20))]
+        # A unique token keeps sentences distinct, like real essays
+        words.insert(rng.randint(1, len(words)), f"item{i}")
+        sentence = " ".join(words).capitalize() + "."
+        sentences.append(sentence)
+        if i % 2 == 0:
+            analyses.append(SentenceAnalysis(original=sentence, error=rng.choice(words[1:])))
+    paragraphs = [" ".join(sentences[i:i + 6]) for i in range(0, len(sentences), 6)]
+    return "\n\n".join(paragraphs), analyses
+
+
+def legacy_annotate(original_text: str, analysis_list: List[SentenceAnalysis]) -> str:
+    """The previous rescanning implementation, kept here for comparison."""
+    annotated_text = original_text
+    processed = set()
+    for analysis in analysis_list:
+        sentence = analysis.original.strip()
+        error_text = analysis.error
+        if not error_text or not sentence or sentence in processed:
+            continue
+        processed.add(sentence)
+        sentence_match = re.search(re.escape(sentence), annotated_text)
+        if not sentence_match:
+            continue
+        start, end = sentence_match.start(), sentence_match.end()
+        in_text = annotated_text[start:end]
+        error_match = re.search(re.escape(error_text), in_text, re.IGNORECASE)
+        if error_match:
+            annotated = (
+                in_text[:error_match.start()]
+                + f"<span class='error'>{error_text}</span>"
+                + in_text[error_match.end():]
+            )
+            annotated_text = annotated_text[:start] + annotated + annotated_text[end:]
+    return f"<p>{annotated_text}</p>"
+
+
+def linear_annotate(original_text: str, analysis_list: List[SentenceAnalysis]) -> str:
+    return render_annotated_html(original_text, locate_error_spans(original_text, analysis_list))
+
+
+def time_call(func, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark error annotation engines")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000, 20000],
+                        help="Sentence counts to benchmark")
+    parser.add_argument("--legacy-max", type=int, default=5000,
+                        help="Skip the legacy engine above this many sentences")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'sentences':>10} {'chars':>10} {'findings':>9} {'legacy_ms':>11} {'linear_ms':>11} {'speedup':>8}")
+    for size in args.sizes:
+        text, analyses = make_document(size)
+        linear_s = time_call(linear_annotate, text, analyses, repeat=args.repeat)
+        if size <= args.legacy_max:
+            legacy_s = time_call(legacy_annotate, text, analyses, repeat=args.repeat)
+            legacy_col = f"{legacy_s * 1000:11.2f}"
+            speedup_col = f"{legacy_s / linear_s:7.1f}x"
+        else:
+            legacy_col, speedup_col = f"{'skipped':>11}", f"{'-':>8}"
+        print(f"{size:>10} {len(text):>10} {len(analyses):>9} {legacy_col} {linear_s * 1000:11.2f} {speedup_col}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Import-time and RSS budget check for the polisher entry points.
+
+Imports each entry point in a fresh interpreter with ``-X importtime`` and
+reports total import time, peak RSS after import and the heaviest top-level
+packages. The run fails (exit code 1) when an entry point exceeds its time or
+RSS budget, or when the API pulls in a module it must not load at import
+(the LLM stack, WeasyPrint or the Celery worker module).
+
+Usage:
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --repeat 5 --budget app.main=1200 --rss-budget app.main=120
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Import-time budgets in milliseconds and RSS budgets in MiB per entry point
+DEFAULT_BUDGETS_MS = {"app.main": 1500, "app.worker": 3000}
+DEFAULT_RSS_BUDGETS_MB = {"app.main": 120, "app.worker": 200}
+
+# Modules the API must not import at startup
+FORBIDDEN = {
+    "app.main": ["langchain", "langchain_core", "weasyprint", "app.worker", "app.services.ai_service"],
+}
+
+_PROBE = (
+    "import {module}; "
+    "import json, resource, sys; "
+    "print(json.dumps({{'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "
+    "'modules': sorted(sys.modules)}}))"
+)
+
+
+def parse_importtime(stderr: str) -> List[dict]:
+    """
+    Parse ``-X importtime`` output.
+
+    Args:
+        stderr: Interpreter stderr
+
+    Returns:
+        List of {"module", "self_us", "cumulative_us", "depth"}
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append({
+            "module": name.strip(),
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+            "depth": depth,
+        })
+    return rows
+
+
+def measure(module: str) -> dict:
+    """
+    Import ``module`` in a fresh interpreter and collect timings.
+
+    Args:
+        module: Dotted module name
+
+    Returns:
+        dict: total_ms, rss_mb, heaviest top-level imports and loaded modules
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module)],
+        cwd=str(REPO_ROOT),
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+    probe = json.loads(proc.stdout.strip().splitlines()[-1])
+    rows = parse_importtime(proc.stderr)
+    top_level = [r for r in rows if r["depth"] == 0]
+    return {
+        # Includes interpreter startup (site, encodings), i.e. the full cold start
+        "total_ms": sum(r["cumulative_us"] for r in top_level) / 1000,
+        "rss_mb": probe["rss_mb"],
+        "heaviest": sorted(
+            ({"module": r["module"], "ms": r["cumulative_us"] / 1000} for r in rows if r["depth"] <= 1),
+            key=lambda r: r["ms"],
+            reverse=True,
+        )[:8],
+        "modules": probe["modules"],
+    }
+
+
+def _parse_budgets(values: List[str], defaults: Dict[str, float]) -> Dict[str, float]:
+    budgets = dict(defaults)
+    for value in values or []:
+        module, _, limit = value.partition("=")
+        budgets[module] = float(limit)
+    return budgets
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Import-time and RSS budget check")
+    parser.add_argument("modules", nargs="*", default=list(DEFAULT_BUDGETS_MS), help="Entry points to import")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per module (median is used)")
+    parser.add_argument("--budget", action="append", help="Import-time budget, e.g. app.main=1200 (ms)")
+    parser.add_argument("--rss-budget", action="append", help="RSS budget, e.g. app.main=120 (MiB)")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    time_budgets = _parse_budgets(args.budget, DEFAULT_BUDGETS_MS)
+    rss_budgets = _parse_budgets(args.rss_budget, DEFAULT_RSS_BUDGETS_MB)
+    failures = []
+    results = {}
+
+    for module in args.modules:
+        runs = [measure(module) for _ in range(max(1, args.repeat))]
+        total_ms = statistics.median(r["total_ms"] for r in runs)
+        rss_mb = statistics.median(r["rss_mb"] for r in runs)
+        forbidden = [
+            name for name in FORBIDDEN.get(module, [])
+            if any(m == name or m.startswith(name + ".") for m in runs[0]["modules"])
+        ]
+        results[module] = {"total_ms": total_ms, "rss_mb": rss_mb, "heaviest": runs[0]["heaviest"], "forbidden": forbidden}
+
+        print(f"{module}: {total_ms:.0f} ms, {rss_mb:.0f} MiB RSS")
+        for item in runs[0]["heaviest"]:
+            print(f"    {item['ms']:8.1f} ms  {item['module']}")
+
+        if module in time_budgets and total_ms > time_budgets[module]:
+            failures.append(f"{module} import took {total_ms:.0f} ms (budget {time_budgets[module]:.0f} ms)")
+        if module in rss_budgets and rss_mb > rss_budgets[module]:
+            failures.append(f"{module} RSS is {rss_mb:.0f} MiB (budget {rss_budgets[module]:.0f} MiB)")
+        if forbidden:
+            failures.append(f"{module} imports forbidden modules: {', '.join(forbidden)}")
+
+    if args.json:
+        Path(args.json).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
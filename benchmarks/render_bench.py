@@ -0,0 +1,352 @@
+"""
+Render-stage microbenchmark replaying recorded grading reports.
+
+Times every available PDF renderer in isolation from model latency:
+
+- ``puppeteer``: ``zuowen/export-pdf.js`` (needs ``node``, ``npm install`` and ``npm run build``)
+- ``fpdf``: ``zuowen/report.py::build_pdf`` (needs the NotoSansSC font file)
+- ``weasyprint``: ``app/services/pdf_service.generate_pdf``
+
+Fixtures are the recorded ``zuowen/runs/*/qwen_essay_result.json`` files plus
+synthetic reports scaled up from them. Every render runs in a fresh child
+process so wall time, CPU time, peak RSS and output size are measured per
+render. With ``--baseline`` the run fails (exit code 1) when any metric
+regresses past ``--threshold``.
+
+Usage:
+    python -m benchmarks.render_bench --save bench_results/render.json
+    python -m benchmarks.render_bench --baseline bench_results/render.json --threshold 0.15
+"""
+import argparse
+import copy
+import glob
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+ZUOWEN_DIR = REPO_ROOT / "zuowen"
+RUNS_GLOB = str(ZUOWEN_DIR / "runs" / "*" / "qwen_essay_result.json")
+FONT_PATH = Path(os.getenv("RENDER_BENCH_FONT", str(ZUOWEN_DIR / "NotoSansSC-Regular.otf")))
+
+RENDERERS = ["puppeteer", "fpdf", "weasyprint"]
+SCALES = [1, 4, 16]
+METRICS = ["wall_s", "cpu_s", "peak_rss_mb", "output_kb"]
+
+
+# ---------------------------------------------------------------------------
+# Fixtures
+# ---------------------------------------------------------------------------
+
+def scale_report(data: dict, factor: int) -> dict:
+    """
+    Build a synthetic report ``factor`` times larger than a recorded one.
+
+    Args:
+        data: Recorded report (qwen_essay_result.json content)
+        factor: Size multiplier
+
+    Returns:
+        dict: Scaled report with repeated text, errors and reviews
+    """
+    if factor == 1:
+        return data
+    scaled = copy.deepcopy(data)
+    scaled["original_text"] = "\n\n".join([data.get("original_text", "")] * factor)
+    scaled["revised_text"] = "\n\n".join([data.get("revised_text", "")] * factor)
+    errors = []
+    for _ in range(factor):
+        for item in data.get("detailed_errors", []):
+            item = dict(item)
+            item["id"] = len(errors) + 1
+            errors.append(item)
+    scaled["detailed_errors"] = errors
+    scaled["optimizations"] = data.get("optimizations", []) * factor
+    reviews = []
+    for item in data.get("paragraph_reviews", []) * factor:
+        item = dict(item)
+        item["paragraph_index"] = len(reviews) + 1
+        reviews.append(item)
+    scaled["paragraph_reviews"] = reviews
+    return scaled
+
+
+def load_fixtures(pattern: str, scales: List[int], work_dir: Path) -> List[dict]:
+    """
+    Write recorded and synthetic fixtures to ``work_dir``.
+
+    The largest recorded report is used as the seed for synthetic sizes so
+    the scaled fixtures are comparable across runs.
+
+    Returns:
+        list: Fixture descriptors with name, path and size in characters
+    """
+    recorded = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, "r", encoding="utf-8") as f:
+            recorded.append((Path(path).parent.name, json.load(f)))
+    if not recorded:
+        raise FileNotFoundError(f"No recorded reports match {pattern}")
+
+    fixtures = []
+    for name, data in recorded:
+        fixtures.append((f"recorded/{name}", data))
+    _, seed = max(recorded, key=lambda item: len(json.dumps(item[1], ensure_ascii=False)))
+    for factor in scales:
+        if factor > 1:
+            fixtures.append((f"synthetic/x{factor}", scale_report(seed, factor)))
+
+    described = []
+    for i, (name, data) in enumerate(fixtures):
+        path = work_dir / f"fixture_{i}.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        described.append({"name": name, "path": str(path), "chars": len(json.dumps(data, ensure_ascii=False))})
+    return described
+
+
+# ---------------------------------------------------------------------------
+# Renderers (executed inside the child process)
+# ---------------------------------------------------------------------------
+
+def _to_full_report(data: dict):
+    """Map a zuowen grading report onto the polisher's FullReport schema."""
+    from app.schemas import FullReport, SentenceAnalysis
+
+    return FullReport(
+        writing_goal_analysis=data.get("overall_evaluation", {}).get("brief_comment", ""),
+        sentence_analysis=[
+            SentenceAnalysis(
+                original=item.get("original_sentence", ""),
+                error=item.get("type"),
+                correction=item.get("correction"),
+                suggestion=item.get("explanation"),
+            )
+            for item in data.get("detailed_errors", [])
+        ],
+        polished_version=data.get("revised_text", ""),
+    )
+
+
+def _render_fpdf(data: dict, out_path: str) -> None:
+    sys.path.insert(0, str(ZUOWEN_DIR))
+    from report import build_pdf
+
+    build_pdf(data, pdf_path=out_path, font_path=str(FONT_PATH))
+
+
+def _render_weasyprint(data: dict, out_path: str) -> None:
+    from app.services.pdf_service import generate_pdf
+
+    pdf_bytes = generate_pdf(report_data=_to_full_report(data), original_text=data.get("original_text", ""))
+    with open(out_path, "wb") as f:
+        f.write(pdf_bytes)
+
+
+def _child_main(renderer: str, fixture_path: str, out_path: str) -> None:
+    """Render one fixture and print the in-process render timing as JSON."""
+    import resource
+
+    with open(fixture_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    render = {"fpdf": _render_fpdf, "weasyprint": _render_weasyprint}[renderer]
+
+    # Import the renderer stack first so the timed section is the render only
+    if renderer == "weasyprint":
+        import app.services.pdf_service  # noqa: F401
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    render(data, out_path)
+    wall = time.perf_counter() - start
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    print(json.dumps({"render_wall_s": wall, "render_cpu_s": cpu}))
+
+
+# ---------------------------------------------------------------------------
+# Parent-side measurement
+# ---------------------------------------------------------------------------
+
+def renderer_available(renderer: str) -> Optional[str]:
+    """
+    Check whether a renderer can run in this environment.
+
+    Returns:
+        Optional[str]: None if available, otherwise the reason it is skipped
+    """
+    if renderer == "puppeteer":
+        if not shutil.which("node"):
+            return "node not found on PATH"
+        if not (ZUOWEN_DIR / "node_modules" / "puppeteer").exists():
+            return "zuowen/node_modules missing (run npm install)"
+        if not (ZUOWEN_DIR / "dist" / "index.html").exists():
+            return "zuowen/dist missing (run npm run build)"
+        return None
+    if renderer == "fpdf":
+        if not FONT_PATH.exists():
+            return f"font file {FONT_PATH} missing (set RENDER_BENCH_FONT)"
+        probe = "import fpdf"
+    else:
+        probe = "import weasyprint, jinja2"
+    result = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, cwd=REPO_ROOT)
+    if result.returncode != 0:
+        return (result.stderr.strip().splitlines() or ["import failed"])[-1]
+    return None
+
+
+def run_render(renderer: str, fixture: dict, out_path: Path, port: int) -> Dict[str, float]:
+    """
+    Render ``fixture`` once in a child process and collect its resource usage.
+
+    Wall time is measured around the child; CPU time and peak RSS come from
+    ``os.wait4`` for that child (for Puppeteer this includes the Chromium
+    processes Node waits for).
+    """
+    if renderer == "puppeteer":
+        cmd = [
+            "node", "export-pdf.js",
+            f"--json={fixture['path']}", f"--out={out_path}",
+            "--dist=./dist", f"--port={port}",
+        ]
+        cwd = ZUOWEN_DIR
+    else:
+        cmd = [sys.executable, "-m", "benchmarks.render_bench", "--child", renderer, fixture["path"], str(out_path)]
+        cwd = REPO_ROOT
+
+    with tempfile.TemporaryFile("w+") as stdout, tempfile.TemporaryFile("w+") as stderr:
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=cwd, stdout=stdout, stderr=stderr, text=True)
+        _, wait_status, usage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(wait_status)
+        stdout.seek(0)
+        stderr.seek(0)
+        out_text, err_text = stdout.read(), stderr.read()
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"{renderer} failed on {fixture['name']}: {err_text.strip()[-500:]}")
+
+    metrics = {
+        "wall_s": wall,
+        "cpu_s": usage.ru_utime + usage.ru_stime,
+        "peak_rss_mb": usage.ru_maxrss / 1024.0,
+        "output_kb": out_path.stat().st_size / 1024.0,
+    }
+    if renderer != "puppeteer":
+        child = json.loads(out_text.strip().splitlines()[-1])
+        # Exclude interpreter start-up and imports from the render timings
+        metrics["wall_s"] = child["render_wall_s"]
+        metrics["cpu_s"] = child["render_cpu_s"]
+    return metrics
+
+
+def benchmark(renderers: List[str], fixtures: List[dict], repeat: int, work_dir: Path) -> dict:
+    """
+    Run every renderer over every fixture and keep the median of each metric.
+
+    Returns:
+        dict: ``{renderer: {fixture_name: {metric: value}}}`` plus skip reasons
+    """
+    results: Dict[str, dict] = {"renderers": {}, "skipped": {}}
+    port = 4173
+    for renderer in renderers:
+        reason = renderer_available(renderer)
+        if reason:
+            print(f"- {renderer}: skipped ({reason})")
+            results["skipped"][renderer] = reason
+            continue
+        per_fixture = {}
+        for fixture in fixtures:
+            samples = []
+            for i in range(repeat):
+                port += 1
+                out_path = work_dir / f"{renderer}_{len(per_fixture)}_{i}.pdf"
+                samples.append(run_render(renderer, fixture, out_path, port))
+            per_fixture[fixture["name"]] = {
+                "chars": fixture["chars"],
+                **{m: statistics.median(s[m] for s in samples) for m in METRICS if m in samples[0]},
+            }
+            row = per_fixture[fixture["name"]]
+            print(
+                f"- {renderer:<10} {fixture['name']:<32} chars={fixture['chars']:>7} "
+                + " ".join(f"{m}={row[m]:.3f}" for m in METRICS if m in row)
+            )
+        results["renderers"][renderer] = per_fixture
+    return results
+
+
+def find_regressions(baseline: dict, current: dict, threshold: float) -> List[str]:
+    """
+    Compare two benchmark results metric by metric.
+
+    Returns:
+        list: Human-readable descriptions of metrics that regressed past ``threshold``
+    """
+    regressions = []
+    for renderer, fixtures in current["renderers"].items():
+        for name, metrics in fixtures.items():
+            old = baseline.get("renderers", {}).get(renderer, {}).get(name)
+            if not old:
+                continue
+            for metric in METRICS:
+                if metric not in metrics or not old.get(metric):
+                    continue
+                delta = (metrics[metric] - old[metric]) / old[metric]
+                if delta > threshold:
+                    regressions.append(
+                        f"{renderer} {name} {metric}: {old[metric]:.3f} -> {metrics[metric]:.3f} ({delta:+.1%})"
+                    )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="PDF render-stage microbenchmark")
+    parser.add_argument("--child", nargs=3, metavar=("RENDERER", "FIXTURE", "OUT"), help=argparse.SUPPRESS)
+    parser.add_argument("--renderers", default=",".join(RENDERERS), help="Comma-separated renderer list")
+    parser.add_argument("--runs", default=RUNS_GLOB, help="Glob of recorded reports")
+    parser.add_argument("--scales", default=",".join(str(s) for s in SCALES), help="Synthetic size multipliers")
+    parser.add_argument("--repeat", type=int, default=3, help="Renders per fixture (median is kept)")
+    parser.add_argument("--save", help="Write results JSON to this path")
+    parser.add_argument("--baseline", help="Results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed relative regression per metric")
+    args = parser.parse_args(argv)
+
+    if args.child:
+        _child_main(*args.child)
+        return 0
+
+    renderers = [r.strip() for r in args.renderers.split(",") if r.strip()]
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+    with tempfile.TemporaryDirectory(prefix="render_bench_") as tmp:
+        work_dir = Path(tmp)
+        fixtures = load_fixtures(args.runs, scales, work_dir)
+        results = benchmark(renderers, fixtures, args.repeat, work_dir)
+
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Results saved to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = find_regressions(baseline, results, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed past {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"No regressions past {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Cold vs. warm first-task latency of a fresh worker process.
+
+Each run starts a new interpreter that imports the worker's AI and PDF
+modules, optionally runs the same warm-up the Celery worker runs on
+``worker_process_init`` (prompt templates and format instructions, Jinja
+template, stylesheet and a dummy render), and then times the local part of a
+first task: building the prompt for a new context, formatting it and
+rendering the report to PDF. The LLM round trip itself is not included.
+PDF steps are skipped when WeasyPrint cannot be loaded.
+
+Usage:
+    python -m benchmarks.warmup_bench
+    python -m benchmarks.warmup_bench --repeat 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+_CHILD = r"""
+import json, os, sys, tempfile, time
+warm = sys.argv[1] == "warm"
+from app.schemas import FullReport
+from app.services import ai_service
+try:
+    from weasyprint import HTML
+    from app.services import pdf_service
+except Exception:
+    HTML = None
+
+timings = {}
+if warm:
+    start = time.perf_counter()
+    ai_service.warm_up()
+    if HTML is not None:
+        from app.services.render_pool import _init_render_process
+        _init_render_process()
+    timings["warmup_s"] = time.perf_counter() - start
+
+report = FullReport(
+    writing_goal_analysis="Goal",
+    sentence_analysis=[{"original": "She go to school.", "error": "go", "correction": "She goes to school."}],
+    polished_version="She goes to school.",
+)
+start = time.perf_counter()
+prompt = ai_service._build_prompt("Argumentative essay for IELTS")
+prompt.format_messages(original_text="She go to school.")
+timings["prompt_s"] = time.perf_counter() - start
+if HTML is not None:
+    start = time.perf_counter()
+    html = pdf_service.render_report_html(report, "She go to school.")
+    timings["template_s"] = time.perf_counter() - start
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        from app.services.render_pool import _render_to_file
+        _render_to_file(report.model_dump(), "She go to school.", os.path.join(tmp, "r.pdf"), time.time())
+    timings["render_s"] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+
+def run_child(mode: str) -> dict:
+    """
+    Measure one fresh process.
+
+    Args:
+        mode: "cold" or "warm"
+
+    Returns:
+        dict: Step name to seconds
+    """
+    proc = subprocess.run(
+        [sys.executable, "-c", _CHILD, mode],
+        cwd=str(REPO_ROOT),
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{mode} run failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Worker cold vs. warm first-task latency")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh processes per mode (median is used)")
+    args = parser.parse_args()
+
+    for mode in ("cold", "warm"):
+        runs = [run_child(mode) for _ in range(max(1, args.repeat))]
+        steps = {key: statistics.median(r[key] for r in runs) for key in runs[0]}
+        first_task = sum(v for k, v in steps.items() if k != "warmup_s")
+        details = ", ".join(f"{k[:-2]} {v * 1000:.1f} ms" for k, v in steps.items())
+        print(f"{mode:>4}: first task {first_task * 1000:8.1f} ms  ({details})")
+        if "render_s" not in steps:
+            print("      (WeasyPrint unavailable, PDF steps skipped)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,335 @@
+"""
+错误类型 / 档次 / 分项得分的增量统计，用于班级和学校看板。
+
+- 入库 (record_report)：报告完成时解析一次，把 "18分"、"4/5" 等分数字符串转成数字，
+  按 (学校 tenant, 班级 class, 日期 day) 累加到物化的日汇总表，不再每次扫描全部 JSON；
+- 查询 (rollup)：日汇总表以列式 NumPy 数组常驻内存，按版本号增量刷新，
+  按学校/班级/日期任意组合的上卷用 np.unique + np.bincount 向量化完成。
+
+用法:
+    python analytics.py --rebuild                    # 从 runs/ 重建 (无学校/班级信息)
+    python analytics.py --group-by tenant,class
+"""
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from report_fields import parse_score, parse_tier, tier_label
+
+# ==========================================
+# 1. 配置与列定义
+# ==========================================
+INDEX_DB_PATH = os.getenv("ESSAY_INDEX_DB", "essay_index.db")
+UNKNOWN_KEY = "unknown"
+
+SCORE_FIELDS = ["total_score", "relevance", "grammar_vocab", "logic_structure", "content"]
+ERROR_CATEGORIES = ["grammar", "spelling", "structure"]
+TIER_LEVELS = [1, 2, 3, 4, 5]
+GROUP_KEYS = {"tenant": "tenant_id", "class": "class_id", "day": "day"}
+
+# 日汇总表中可累加的数值列 (顺序即列式数组中的列顺序)
+NUMERIC_COLUMNS = (
+    ["reports"]
+    + [f"{f}_sum" for f in SCORE_FIELDS]
+    + [f"{f}_n" for f in SCORE_FIELDS]
+    + [f"tier_{level}" for level in TIER_LEVELS]
+    + ["tier_unknown"]
+    + [f"err_{c}" for c in ERROR_CATEGORIES]
+)
+
+
+def extract_facts(data):
+    """从一份报告中解析出要累加的数值 (与 NUMERIC_COLUMNS 一一对应)。"""
+    overall = data.get("overall_evaluation") or {}
+    breakdown = overall.get("score_breakdown") or {}
+    scores = {"total_score": parse_score(overall.get("total_score"))}
+    for field in SCORE_FIELDS[1:]:
+        scores[field] = parse_score(breakdown.get(field))
+
+    facts = {"reports": 1}
+    for field in SCORE_FIELDS:
+        facts[f"{field}_sum"] = scores[field] or 0.0
+        facts[f"{field}_n"] = 0 if scores[field] is None else 1
+
+    tier = parse_tier(overall.get("tier"))
+    for level in TIER_LEVELS:
+        facts[f"tier_{level}"] = 1 if tier == level else 0
+    facts["tier_unknown"] = 1 if tier is None else 0
+
+    summary = data.get("error_summary") or {}
+    for category in ERROR_CATEGORIES:
+        facts[f"err_{category}"] = len(summary.get(category) or [])
+    return [facts[column] for column in NUMERIC_COLUMNS]
+
+
+class ErrorAnalytics:
+    """物化日汇总表 + 内存列式上卷。"""
+
+    def __init__(self, db_path=INDEX_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._init_schema()
+        # 列式缓存
+        self._version = 0
+        self._positions = {}
+        self._tenant = np.empty(0, dtype=object)
+        self._class = np.empty(0, dtype=object)
+        self._day = np.empty(0, dtype=object)
+        self._values = np.empty((0, len(NUMERIC_COLUMNS)), dtype=np.float64)
+
+    # ---------- 存储 ----------
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        numeric_ddl = ",\n".join(f"{c} REAL NOT NULL DEFAULT 0" for c in NUMERIC_COLUMNS)
+        conn = self._conn()
+        conn.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS analytics_daily (
+                id INTEGER PRIMARY KEY,
+                tenant_id TEXT NOT NULL,
+                class_id TEXT NOT NULL,
+                day TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                {numeric_ddl},
+                UNIQUE (tenant_id, class_id, day)
+            );
+            CREATE INDEX IF NOT EXISTS idx_analytics_daily_version ON analytics_daily(version);
+            CREATE TABLE IF NOT EXISTS analytics_error_types (
+                tenant_id TEXT NOT NULL,
+                class_id TEXT NOT NULL,
+                day TEXT NOT NULL,
+                error_type TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (tenant_id, class_id, day, error_type)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS analytics_ingested (
+                run_id TEXT PRIMARY KEY
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS analytics_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO analytics_version (id, value) VALUES (1, 0);
+            """
+        )
+        conn.commit()
+
+    # ---------- 增量入库 ----------
+    def record_report(self, run_id, data, tenant_id=None, class_id=None, day=None):
+        """
+        报告完成时调用一次，把该报告累加进 (学校, 班级, 日期) 的日汇总。
+
+        同一个 run_id 只会计入一次；返回是否真正写入。
+        """
+        tenant_id = tenant_id or UNKNOWN_KEY
+        class_id = class_id or UNKNOWN_KEY
+        day = day or datetime.now().strftime("%Y-%m-%d")
+        values = extract_facts(data)
+
+        assignments = ", ".join(f"{c} = {c} + excluded.{c}" for c in NUMERIC_COLUMNS)
+        columns = ", ".join(NUMERIC_COLUMNS)
+        placeholders = ", ".join("?" * len(NUMERIC_COLUMNS))
+        conn = self._conn()
+        with conn:
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO analytics_ingested (run_id) VALUES (?)", (run_id,)
+            ).rowcount
+            if not inserted:
+                return False
+            conn.execute("UPDATE analytics_version SET value = value + 1 WHERE id = 1")
+            version = conn.execute("SELECT value FROM analytics_version WHERE id = 1").fetchone()[0]
+            conn.execute(
+                f"INSERT INTO analytics_daily (tenant_id, class_id, day, version, {columns}) "
+                f"VALUES (?, ?, ?, ?, {placeholders}) "
+                f"ON CONFLICT (tenant_id, class_id, day) DO UPDATE SET version = excluded.version, {assignments}",
+                [tenant_id, class_id, day, version] + values,
+            )
+            error_types = {}
+            for item in data.get("detailed_errors") or []:
+                error_type = (item.get("type") or "").strip()
+                if error_type:
+                    error_types[error_type] = error_types.get(error_type, 0) + 1
+            conn.executemany(
+                "INSERT INTO analytics_error_types (tenant_id, class_id, day, error_type, count) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT DO UPDATE SET count = count + excluded.count",
+                [(tenant_id, class_id, day, t, n) for t, n in error_types.items()],
+            )
+        return True
+
+    # ---------- 列式缓存 ----------
+    def _refresh(self):
+        """只拉取版本号比缓存新的日汇总行，原地覆盖或追加到列式数组。"""
+        rows = self._conn().execute(
+            f"SELECT id, tenant_id, class_id, day, version, {', '.join(NUMERIC_COLUMNS)} "
+            f"FROM analytics_daily WHERE version > ? ORDER BY version",
+            (self._version,),
+        ).fetchall()
+        if not rows:
+            return
+        new_tenant, new_class, new_day, new_values = [], [], [], []
+        for row in rows:
+            row_id, tenant_id, class_id, day, version = row[:5]
+            position = self._positions.get(row_id)
+            if position is None:
+                self._positions[row_id] = len(self._tenant) + len(new_tenant)
+                new_tenant.append(tenant_id)
+                new_class.append(class_id)
+                new_day.append(day)
+                new_values.append(row[5:])
+            else:
+                self._values[position] = row[5:]
+            self._version = max(self._version, version)
+        if new_tenant:
+            self._tenant = np.concatenate([self._tenant, np.array(new_tenant, dtype=object)])
+            self._class = np.concatenate([self._class, np.array(new_class, dtype=object)])
+            self._day = np.concatenate([self._day, np.array(new_day, dtype=object)])
+            self._values = np.vstack([self._values, np.array(new_values, dtype=np.float64)])
+
+    def rollup(self, group_by=("tenant",), tenant_id=None, class_id=None, start_day=None, end_day=None):
+        """
+        按 group_by (tenant / class / day 的任意组合) 上卷。
+
+        返回每组的报告数、平均总分与分项得分、档次分布和错误类别计数。
+        """
+        unknown = [g for g in group_by if g not in GROUP_KEYS]
+        if unknown:
+            raise ValueError(f"不支持的分组字段: {unknown}")
+
+        with self._lock:
+            self._refresh()
+            mask = np.ones(len(self._tenant), dtype=bool)
+            if tenant_id:
+                mask &= self._tenant == tenant_id
+            if class_id:
+                mask &= self._class == class_id
+            if start_day:
+                mask &= self._day >= start_day
+            if end_day:
+                mask &= self._day <= end_day
+            key_columns = {"tenant": self._tenant[mask], "class": self._class[mask], "day": self._day[mask]}
+            values = self._values[mask]
+
+        if values.shape[0] == 0:
+            return []
+
+        # 多列分组键 -> 单个整数编码 -> bincount 按列求和
+        codes = np.zeros(values.shape[0], dtype=np.int64)
+        labels = []
+        for key in group_by:
+            uniques, inverse = np.unique(key_columns[key].astype(str), return_inverse=True)
+            codes = codes * len(uniques) + inverse
+            labels.append(uniques)
+        group_codes, group_index = np.unique(codes, return_inverse=True)
+        sums = np.stack(
+            [np.bincount(group_index, weights=values[:, i], minlength=len(group_codes)) for i in range(values.shape[1])],
+            axis=1,
+        )
+
+        col = {name: i for i, name in enumerate(NUMERIC_COLUMNS)}
+        results = []
+        for g, code in enumerate(group_codes):
+            group = {}
+            for key, uniques in reversed(list(zip(group_by, labels))):
+                group[key] = str(uniques[code % len(uniques)])
+                code //= len(uniques)
+            row = sums[g]
+            averages = {}
+            for field in SCORE_FIELDS:
+                n = row[col[f"{field}_n"]]
+                averages[field] = round(float(row[col[f"{field}_sum"]] / n), 2) if n else None
+            results.append({
+                **{key: group[key] for key in group_by},
+                "reports": int(row[col["reports"]]),
+                "average_scores": averages,
+                "tier_distribution": {
+                    **{tier_label(level): int(row[col[f"tier_{level}"]]) for level in TIER_LEVELS},
+                    UNKNOWN_KEY: int(row[col["tier_unknown"]]),
+                },
+                "error_categories": {c: int(row[col[f"err_{c}"]]) for c in ERROR_CATEGORIES},
+            })
+        return results
+
+    def top_error_types(self, tenant_id=None, class_id=None, start_day=None, end_day=None, limit=10):
+        conditions, params = [], []
+        for column, value in (("tenant_id", tenant_id), ("class_id", class_id)):
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if start_day:
+            conditions.append("day >= ?")
+            params.append(start_day)
+        if end_day:
+            conditions.append("day <= ?")
+            params.append(end_day)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._conn().execute(
+            f"SELECT error_type, SUM(count) AS total FROM analytics_error_types {where} "
+            f"GROUP BY error_type ORDER BY total DESC LIMIT ?",
+            params + [limit],
+        ).fetchall()
+        return [{"error_type": t, "count": int(n)} for t, n in rows]
+
+
+_analytics = None
+
+
+def get_analytics():
+    """进程内单例 (列式缓存在进程内复用)。"""
+    global _analytics
+    if _analytics is None:
+        _analytics = ErrorAnalytics()
+    return _analytics
+
+
+def rebuild_from_runs(runs_folder="runs"):
+    """从 runs/ 回填历史报告；目录名前 8 位是日期，历史数据没有学校/班级信息。"""
+    analytics = get_analytics()
+    total = 0
+    for path in sorted(glob.glob(os.path.join(runs_folder, "*", "qwen_essay_result.json"))):
+        run_id = os.path.basename(os.path.dirname(path))
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        try:
+            day = datetime.strptime(run_id[:8], "%Y%m%d").strftime("%Y-%m-%d")
+        except ValueError:
+            day = None
+        if analytics.record_report(run_id, data, day=day):
+            total += 1
+    return total
+
+
+# ==========================================
+# 2. 主程序入口
+# ==========================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批改错误统计看板数据")
+    parser.add_argument("--rebuild", action="store_true", help="从 runs/ 目录回填")
+    parser.add_argument("--group-by", default="tenant", help="分组字段: tenant,class,day 的组合")
+    parser.add_argument("--tenant")
+    parser.add_argument("--class-id")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        print(f"✅ 新增计入 {rebuild_from_runs()} 份报告")
+    start = time.perf_counter()
+    groups = get_analytics().rollup(tuple(args.group_by.split(",")), args.tenant, args.class_id)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"📊 上卷耗时 {elapsed_ms:.3f} ms，共 {len(groups)} 组")
+    print(json.dumps(groups, ensure_ascii=False, indent=2))
@@ -0,0 +1,228 @@
+"""
+作文查重索引：基于 MinHash + LSH 的近似重复检测。
+
+- 每篇批改完成的作文 (generate_pdf_report) 增量写入索引，不需要两两比较；
+- 查询只访问 LSH 分桶命中的候选，单篇查询为亚毫秒级，规模到几十万篇仍然可用；
+- 索引持久化在 SQLite 中，多个 Celery worker 进程可以同时写入。
+
+用法:
+    python dedup_index.py --rebuild                 # 从 runs/ 重建索引
+    python dedup_index.py --query runs/xxx/qwen_essay_result.json
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+# ==========================================
+# 1. 配置
+# ==========================================
+INDEX_DB_PATH = os.getenv("ESSAY_INDEX_DB", "essay_index.db")
+NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "128"))       # MinHash 排列数
+NUM_BANDS = int(os.getenv("DEDUP_BANDS", "32"))          # LSH 分带数 (每带 NUM_PERM/NUM_BANDS 行)
+SHINGLE_SIZE = int(os.getenv("DEDUP_SHINGLE", "3"))      # 词级 n-gram 长度
+SIMILARITY_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.5"))
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def shingles(text, k=SHINGLE_SIZE):
+    """OCR 文本归一化 (小写、只保留单词) 后切成词级 k-gram，返回 32 位哈希数组。"""
+    words = _WORD_RE.findall((text or "").lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    if len(words) < k:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i:i + k]) for i in range(len(words) - k + 1)]
+    # crc32 在不同进程之间稳定 (内置 hash() 会随机化)
+    return np.unique(np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64))
+
+
+class MinHashLSHIndex:
+    """MinHash 签名 + LSH 分桶的增量查重索引。"""
+
+    def __init__(self, db_path=INDEX_DB_PATH, num_perm=NUM_PERM, num_bands=NUM_BANDS, seed=1):
+        if num_perm % num_bands != 0:
+            raise ValueError("num_perm 必须能被 num_bands 整除")
+        self.db_path = db_path
+        self.num_perm = num_perm
+        self.num_bands = num_bands
+        self.rows = num_perm // num_bands
+        # 排列参数 a, b < 2^32，保证 a * h + b 在 uint64 内不溢出
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._local = threading.local()
+        self._init_schema()
+
+    # ---------- 存储 ----------
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS minhash_docs (
+                doc_id TEXT PRIMARY KEY,
+                signature BLOB NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS minhash_buckets (
+                bucket INTEGER NOT NULL,
+                doc_id TEXT NOT NULL,
+                PRIMARY KEY (bucket, doc_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_minhash_buckets_doc ON minhash_buckets(doc_id);
+            """
+        )
+        conn.commit()
+
+    # ---------- MinHash / LSH ----------
+    def signature(self, text):
+        """返回 MinHash 签名；空文本 (如 OCR 失败) 没有 shingle，返回 None。"""
+        hashes = shingles(text)
+        if hashes.size == 0:
+            # 全 _MAX_HASH 的签名会让所有空文本互相“完全重复”，因此不建签名
+            return None
+        # (num_perm, n_shingles) 一次性向量化计算
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME
+        return (permuted & _MAX_HASH).min(axis=1)
+
+    def _bucket_keys(self, signature):
+        bands = signature.reshape(self.num_bands, self.rows)
+        return [(band << 32) | zlib.crc32(bands[band].tobytes()) for band in range(self.num_bands)]
+
+    # ---------- 写入 / 查询 ----------
+    def add(self, doc_id, text, signature=None):
+        """写入 (或覆盖) 一篇作文，返回其签名；空文本不入索引，返回 None。"""
+        if signature is None:
+            signature = self.signature(text)
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM minhash_buckets WHERE doc_id = ?", (doc_id,))
+            if signature is None:
+                conn.execute("DELETE FROM minhash_docs WHERE doc_id = ?", (doc_id,))
+                return None
+            conn.execute(
+                "INSERT OR REPLACE INTO minhash_docs (doc_id, signature, created_at) VALUES (?, ?, ?)",
+                (doc_id, signature.tobytes(), time.time()),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO minhash_buckets (bucket, doc_id) VALUES (?, ?)",
+                [(key, doc_id) for key in self._bucket_keys(signature)],
+            )
+        return signature
+
+    def query(self, text=None, signature=None, threshold=SIMILARITY_THRESHOLD, exclude=None, limit=20):
+        """
+        查找近似重复的作文。
+
+        返回按相似度降序排列的 [{"doc_id": ..., "similarity": ...}]，
+        similarity 为签名估计的 Jaccard 相似度。
+        """
+        if signature is None:
+            signature = self.signature(text or "")
+        if signature is None:
+            return []
+        keys = self._bucket_keys(signature)
+        conn = self._conn()
+        placeholders = ",".join("?" * len(keys))
+        rows = conn.execute(
+            f"SELECT d.doc_id, d.signature FROM minhash_docs d WHERE d.doc_id IN "
+            f"(SELECT DISTINCT doc_id FROM minhash_buckets WHERE bucket IN ({placeholders}))",
+            keys,
+        ).fetchall()
+
+        results = []
+        if rows:
+            ids = [doc_id for doc_id, _ in rows]
+            matrix = np.frombuffer(b"".join(sig for _, sig in rows), dtype=np.uint64).reshape(len(rows), self.num_perm)
+            similarities = (matrix == signature).mean(axis=1)
+            for doc_id, similarity in zip(ids, similarities):
+                if doc_id == exclude or similarity < threshold:
+                    continue
+                results.append({"doc_id": doc_id, "similarity": round(float(similarity), 4)})
+        results.sort(key=lambda item: item["similarity"], reverse=True)
+        return results[:limit]
+
+    def add_and_query(self, doc_id, text, threshold=SIMILARITY_THRESHOLD):
+        """批改完成时调用：先查出已有的近似重复，再把本篇写入索引。"""
+        signature = self.signature(text)
+        if signature is None:
+            self.add(doc_id, text, signature=None)
+            return []
+        duplicates = self.query(signature=signature, threshold=threshold, exclude=doc_id)
+        self.add(doc_id, text, signature=signature)
+        return duplicates
+
+    def get_signature(self, doc_id):
+        row = self._conn().execute("SELECT signature FROM minhash_docs WHERE doc_id = ?", (doc_id,)).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.uint64)
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM minhash_docs").fetchone()[0]
+
+
+_index = None
+
+
+def get_index():
+    """进程内单例，避免每个任务都重新建表和生成排列参数。"""
+    global _index
+    if _index is None:
+        _index = MinHashLSHIndex()
+    return _index
+
+
+def rebuild_from_runs(runs_folder="runs"):
+    index = get_index()
+    total = 0
+    for path in sorted(glob.glob(os.path.join(runs_folder, "*", "qwen_essay_result.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index.add(os.path.basename(os.path.dirname(path)), data.get("original_text", ""))
+        total += 1
+    return total
+
+
+# ==========================================
+# 2. 主程序入口
+# ==========================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="作文查重索引 (MinHash LSH)")
+    parser.add_argument("--rebuild", action="store_true", help="从 runs/ 目录重建索引")
+    parser.add_argument("--query", help="用某份 qwen_essay_result.json 查询近似重复")
+    parser.add_argument("--threshold", type=float, default=SIMILARITY_THRESHOLD)
+    args = parser.parse_args()
+
+    if args.rebuild:
+        n = rebuild_from_runs()
+        print(f"✅ 已索引 {n} 篇作文，索引总数: {get_index().count()}")
+    if args.query:
+        with open(args.query, "r", encoding="utf-8") as f:
+            text = json.load(f).get("original_text", "")
+        start = time.perf_counter()
+        matches = get_index().query(text=text, threshold=args.threshold)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"🔍 查询耗时 {elapsed_ms:.3f} ms，找到 {len(matches)} 篇近似作文")
+        for m in matches:
+            print(f"  {m['doc_id']}: {m['similarity']:.2%}")
@@ -0,0 +1,406 @@
+"""
+开环 (open-loop) 异步压测工具，替代 stress_test.py 的固定线程 + 2 秒轮询。
+
+- 请求按配置的到达率独立发出（泊松或匀速），不会因为服务变慢而自动降速；
+  提交和轮询使用各自的连接池，轮询不会挤占提交的连接；
+- 端到端耗时取服务端写入结果的完成时间戳 (timing.finished_at)，不受轮询间隔
+  量化影响；拿不到或与本机时钟明显不一致时才退回到"轮询发现完成"的时间，
+  并在 CSV 中记下来源和当时的轮询间隔 (即该条记录的误差上限)；
+- 轮询间隔随在途请求数自适应，总轮询速率不超过 --max-poll-rate，同时不超过
+  已观测端到端耗时中位数的 POLL_ERROR_FRACTION；
+- 按阶段统计 p50/p95/p99：提交等连接、提交、排队+调度、JSON 生成、PDF 生成、端到端；
+- 结果写成 CSV（每个请求一行）和 JSON（汇总），可以在不同提交之间对比。
+
+用法:
+    # 1) 启动本地 DashScope 替身，并让 worker 指向它
+    python mock_dashscope.py --port 8900 --latency 8 --jitter 2
+    # 2) 压测
+    python loadgen.py run --rate 2 --duration 60 --image 优秀5-1.jpg --label baseline
+    # 3) 对比两次结果 (超过阈值返回非 0 退出码)
+    python loadgen.py compare bench_results/baseline.json bench_results/candidate.json --threshold 0.10
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import deque
+from datetime import datetime
+
+import httpx
+
+# ==========================================
+# 1. 默认配置
+# ==========================================
+API_BASE = os.getenv("PYTHON_API_URL", "http://127.0.0.1:8000")
+RESULTS_DIR = "bench_results"
+STAGES = ["submit_pool_wait", "submit", "queue_overhead", "json_generation", "pdf_generation", "end_to_end"]
+MIN_POLL_INTERVAL = 0.1
+# 自适应轮询间隔最多为已观测端到端耗时中位数的这个比例
+POLL_ERROR_FRACTION = 0.05
+PERCENTILES = [50, 95, 99]
+
+
+def percentile(values, pct):
+    """线性插值百分位数 (与 numpy.percentile 默认行为一致)。"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ==========================================
+# 2. 单个请求的生命周期
+# ==========================================
+class PollPacer:
+    """
+    按在途请求数计算轮询间隔：在途越多（到达率越高）间隔越长，总轮询速率有上限；
+    但间隔不超过已观测端到端耗时中位数的 POLL_ERROR_FRACTION，保证轮询的量化误差
+    相对阶段耗时始终很小。
+    """
+
+    def __init__(self, fixed_interval=None, max_poll_rate=20.0):
+        self.fixed_interval = fixed_interval
+        self.max_poll_rate = max_poll_rate
+        self.polling = 0
+        self._observed = deque(maxlen=50)
+
+    def observe(self, end_to_end):
+        self._observed.append(end_to_end)
+
+    def interval(self):
+        if self.fixed_interval:
+            return self.fixed_interval
+        interval = self.polling / self.max_poll_rate
+        if self._observed:
+            interval = min(interval, percentile(self._observed, 50) * POLL_ERROR_FRACTION)
+        return max(MIN_POLL_INTERVAL, interval)
+
+
+def _pool_wait_tracer(start, record):
+    """记录从发起请求到拿到连接（新建或复用）的时间，即连接池排队时间。"""
+    async def trace(event, info):
+        if record["submit_pool_wait"] is None and event in (
+            "connection.connect_tcp.started",
+            "http11.send_request_headers.started",
+            "http2.send_request_headers.started",
+        ):
+            record["submit_pool_wait"] = time.perf_counter() - start
+    return trace
+
+
+async def run_one(submit_client, poll_client, pacer, request_num, image_bytes, image_name, prompt, timeout):
+    record = {
+        "request": request_num,
+        "task_id": None,
+        "status": "SUBMIT_FAILED",
+        "error": None,
+        "scheduled_at": time.time(),
+        "completion_source": None,
+        "poll_interval": None,
+    }
+    for stage in STAGES:
+        record[stage] = None
+
+    start = time.perf_counter()
+    try:
+        response = await submit_client.post(
+            "/grade_essay",
+            files={"images": (image_name, image_bytes, "image/jpeg")},
+            data={"prompt": prompt},
+            extensions={"trace": _pool_wait_tracer(start, record)},
+        )
+    except httpx.HTTPError as e:
+        record["error"] = f"submit: {e}"
+        return record
+    submitted = time.perf_counter()
+    pool_wait = record["submit_pool_wait"] or 0.0
+    record["submit_pool_wait"] = pool_wait
+    record["submit"] = submitted - start - pool_wait
+
+    if response.status_code != 202:
+        record["error"] = f"submit status {response.status_code}"
+        return record
+    record["task_id"] = response.json().get("task_id")
+    record["status"] = "PENDING"
+
+    # 轮询结果：只用来发现完成，端到端耗时优先取服务端完成时间戳
+    deadline = submitted + timeout
+    pacer.polling += 1
+    try:
+        return await _poll_result(poll_client, pacer, record, start, deadline)
+    finally:
+        pacer.polling -= 1
+
+
+async def _poll_result(client, pacer, record, start, deadline):
+    while time.perf_counter() < deadline:
+        interval = pacer.interval()
+        await asyncio.sleep(interval)
+        try:
+            result_response = await client.get(f"/result/{record['task_id']}")
+        except httpx.HTTPError as e:
+            record["error"] = f"poll: {e}"
+            continue
+        if result_response.status_code != 200:
+            continue
+        data = result_response.json()
+        status = data.get("status")
+        if status not in ("SUCCESS", "FAILURE"):
+            continue
+
+        # 轮询发现完成时最多已晚了一个轮询间隔
+        record["end_to_end"] = time.perf_counter() - start
+        record["completion_source"] = "poll"
+        record["poll_interval"] = interval
+        result = data.get("result")
+        if status == "SUCCESS" and isinstance(result, dict) and "error" not in result:
+            record["status"] = "SUCCESS"
+            record["error"] = None
+            timing = result.get("timing", {})
+            finished_at = timing.get("finished_at")
+            if finished_at is not None:
+                server_end_to_end = finished_at - record["scheduled_at"]
+                # 超出轮询观测值或为负说明两端时钟不一致，此时仍用轮询值
+                if 0 < server_end_to_end <= record["end_to_end"]:
+                    record["end_to_end"] = server_end_to_end
+                    record["completion_source"] = "server"
+            pacer.observe(record["end_to_end"])
+            record["json_generation"] = timing.get("json_generation")
+            record["pdf_generation"] = timing.get("pdf_generation")
+            if record["json_generation"] is not None and record["pdf_generation"] is not None:
+                record["queue_overhead"] = max(
+                    0.0,
+                    record["end_to_end"] - record["submit_pool_wait"] - record["submit"]
+                    - record["json_generation"] - record["pdf_generation"],
+                )
+        else:
+            record["status"] = "FAILURE"
+            record["error"] = result.get("error") if isinstance(result, dict) else str(result)
+        return record
+
+    record["status"] = "TIMEOUT"
+    return record
+
+
+# ==========================================
+# 3. 开环调度
+# ==========================================
+async def run_load(args):
+    with open(args.image, "rb") as f:
+        image_bytes = f.read()
+    image_name = os.path.basename(args.image)
+    rng = random.Random(args.seed)
+
+    # 提交和轮询分开建连接池：轮询排队不会推迟新的提交，保持到达相互独立
+    submit_limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    poll_limits = httpx.Limits(max_connections=args.poll_connections, max_keepalive_connections=args.poll_connections)
+    pacer = PollPacer(args.poll_interval, args.max_poll_rate)
+    async with httpx.AsyncClient(base_url=args.api, limits=submit_limits, timeout=30.0) as submit_client, \
+            httpx.AsyncClient(base_url=args.api, limits=poll_limits, timeout=30.0) as poll_client:
+        in_flight = []
+        started = time.perf_counter()
+        next_arrival = started
+        request_num = 0
+
+        while True:
+            now = time.perf_counter()
+            if next_arrival - started >= args.duration:
+                break
+            if next_arrival > now:
+                await asyncio.sleep(next_arrival - now)
+            request_num += 1
+            in_flight.append(asyncio.create_task(run_one(
+                submit_client, poll_client, pacer, request_num, image_bytes, image_name,
+                args.prompt, args.timeout,
+            )))
+            # 到达间隔：泊松过程为指数分布，匀速模式为固定间隔
+            if args.arrival == "poisson":
+                next_arrival += rng.expovariate(args.rate)
+            else:
+                next_arrival += 1.0 / args.rate
+
+        print(f"🚀 [LoadGen] 已按 {args.rate}/s 发出 {request_num} 个请求，等待全部完成...")
+        records = await asyncio.gather(*in_flight)
+        wall_time = time.perf_counter() - started
+
+    return list(records), wall_time
+
+
+def summarize(records, wall_time, args):
+    succeeded = [r for r in records if r["status"] == "SUCCESS"]
+    stages = {}
+    for stage in STAGES:
+        values = [r[stage] for r in succeeded if r[stage] is not None]
+        if stage in ("submit_pool_wait", "submit"):
+            values = [r[stage] for r in records if r[stage] is not None]
+        stages[stage] = {
+            "count": len(values),
+            "mean": sum(values) / len(values) if values else None,
+            **{f"p{p}": percentile(values, p) for p in PERCENTILES},
+            "max": max(values) if values else None,
+        }
+
+    status_counts = {}
+    for r in records:
+        status_counts[r["status"]] = status_counts.get(r["status"], 0) + 1
+    completion_sources = {}
+    for r in succeeded:
+        completion_sources[r["completion_source"]] = completion_sources.get(r["completion_source"], 0) + 1
+    intervals = [r["poll_interval"] for r in records if r["poll_interval"] is not None]
+
+    return {
+        "label": args.label,
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "api": args.api,
+            "rate": args.rate,
+            "duration": args.duration,
+            "arrival": args.arrival,
+            "poll_interval": args.poll_interval or "auto",
+            "max_poll_rate": args.max_poll_rate,
+            "image": os.path.basename(args.image),
+        },
+        "requests": len(records),
+        "status_counts": status_counts,
+        # 来源为 poll 的记录，端到端耗时最多偏大一个轮询间隔
+        "completion_sources": completion_sources,
+        "poll_interval": {
+            "mean": sum(intervals) / len(intervals) if intervals else None,
+            "max": max(intervals) if intervals else None,
+        },
+        "wall_time": wall_time,
+        "throughput": len(succeeded) / wall_time if wall_time else 0.0,
+        "stages": stages,
+    }
+
+
+def write_results(records, summary, out_dir, label):
+    os.makedirs(out_dir, exist_ok=True)
+    csv_path = os.path.join(out_dir, f"{label}.csv")
+    json_path = os.path.join(out_dir, f"{label}.json")
+
+    fields = ["request", "task_id", "status", "error", "scheduled_at", "completion_source", "poll_interval"] + STAGES
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(records)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return csv_path, json_path
+
+
+def print_summary(summary):
+    print("\n" + "=" * 30 + " 开环压测报告 " + "=" * 30)
+    print(f"标签: {summary['label']}  提交: {summary['commit']}")
+    print(f"请求数: {summary['requests']}  状态: {summary['status_counts']}")
+    print(f"端到端计时来源: {summary['completion_sources']}  轮询间隔上限: {summary['poll_interval']['max']}")
+    print(f"总耗时: {summary['wall_time']:.2f}s  吞吐: {summary['throughput']:.3f} 篇/秒")
+    print(f"\n{'阶段':<18}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for stage, s in summary["stages"].items():
+        cells = [f"{s[k]:.3f}" if s[k] is not None else "-" for k in ("p50", "p95", "p99", "max")]
+        print(f"{stage:<18}{s['count']:>6}" + "".join(f"{c:>10}" for c in cells))
+    print("=" * 74 + "\n")
+
+
+# ==========================================
+# 4. 结果对比
+# ==========================================
+def compare(baseline_path, candidate_path, threshold):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(candidate_path, "r", encoding="utf-8") as f:
+        candidate = json.load(f)
+
+    print(f"对比: {baseline.get('label')}@{baseline.get('commit')} -> "
+          f"{candidate.get('label')}@{candidate.get('commit')}  (阈值 {threshold:.0%})")
+    regressions = []
+    for stage in STAGES:
+        for p in PERCENTILES:
+            key = f"p{p}"
+            old = baseline["stages"].get(stage, {}).get(key)
+            new = candidate["stages"].get(stage, {}).get(key)
+            if not old or new is None:
+                continue
+            delta = (new - old) / old
+            flag = ""
+            if delta > threshold:
+                flag = "  ⛔️ 回退"
+                regressions.append((stage, key, delta))
+            print(f"  {stage:<18}{key:>4}: {old:8.3f} -> {new:8.3f}  ({delta:+.1%}){flag}")
+
+    if regressions:
+        print(f"\n⛔️ 共 {len(regressions)} 项指标回退超过阈值")
+        return 1
+    print("\n✅ 没有超过阈值的回退")
+    return 0
+
+
+# ==========================================
+# 5. 主程序入口
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="作文批改 API 开环压测")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="执行一次压测")
+    run_parser.add_argument("--api", default=API_BASE)
+    run_parser.add_argument("--image", default="优秀5-1.jpg", help="提交的作文图片")
+    run_parser.add_argument("--prompt", default="这是学生写的作文，请识别图片内容并严格按照 System Prompt 定义的 JSON 格式进行批改。")
+    run_parser.add_argument("--rate", type=float, default=1.0, help="到达率（请求/秒）")
+    run_parser.add_argument("--duration", type=float, default=30.0, help="发压时长（秒）")
+    run_parser.add_argument("--arrival", choices=["poisson", "constant"], default="poisson")
+    run_parser.add_argument("--poll-interval", type=float, default=None,
+                            help="固定的结果轮询间隔（秒）；默认按在途请求数自适应")
+    run_parser.add_argument("--max-poll-rate", type=float, default=20.0,
+                            help="自适应轮询时所有请求合计的最大轮询速率（次/秒）")
+    run_parser.add_argument("--timeout", type=float, default=600.0, help="单个请求最长等待（秒）")
+    run_parser.add_argument("--max-connections", type=int, default=200, help="提交连接池大小")
+    run_parser.add_argument("--poll-connections", type=int, default=20, help="轮询连接池大小")
+    run_parser.add_argument("--seed", type=int, default=None)
+    run_parser.add_argument("--label", default=datetime.now().strftime("%Y%m%d-%H%M%S"))
+    run_parser.add_argument("--out", default=RESULTS_DIR, help="结果输出目录")
+
+    cmp_parser = sub.add_parser("compare", help="对比两次压测的汇总 JSON")
+    cmp_parser.add_argument("baseline")
+    cmp_parser.add_argument("candidate")
+    cmp_parser.add_argument("--threshold", type=float, default=0.10, help="允许的相对回退比例")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        return compare(args.baseline, args.candidate, args.threshold)
+
+    if not os.path.exists(args.image):
+        print(f"⛔️ 错误: 找不到图片 {args.image}")
+        return 2
+    records, wall_time = asyncio.run(run_load(args))
+    summary = summarize(records, wall_time, args)
+    csv_path, json_path = write_results(records, summary, args.out, args.label)
+    print_summary(summary)
+    print(f"💾 结果已保存: {csv_path} / {json_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
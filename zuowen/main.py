@@ -1,14 +1,17 @@
 import os
 import uuid
 import shutil
-from typing import List
+from typing import List, Optional
 import json
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Query
 from fastapi.responses import JSONResponse
 from celery import chain
 from celery.result import AsyncResult
 from tasks import grade_essay_multipage, generate_pdf_report
 from celery_utils import celery_app
+from dedup_index import get_index as get_dedup_index, SIMILARITY_THRESHOLD
+from search_index import get_index as get_search_index, MAX_PAGE_SIZE
+from analytics import get_analytics
 
 app = FastAPI(title="作文批改 API", description="使用 Celery 和 Qwen-VL-Max 进行异步作文批改")
 
@@ -19,7 +22,9 @@ if not os.path.exists(UPLOAD_FOLDER):
 @app.post("/grade_essay", status_code=202, summary="提交批改任务链")
 def submit_grading_task(
     images: List[UploadFile] = File(..., description="作文图片文件列表"), 
-    prompt: str = Form("这是学生写的作文...", description="给模型的提示词")
+    prompt: str = Form("这是学生写的作文...", description="给模型的提示词"),
+    tenant_id: Optional[str] = Form(None, description="学校/机构 ID (用于统计看板)"),
+    class_id: Optional[str] = Form(None, description="班级 ID (用于统计看板)"),
 ):
     if not images:
         raise HTTPException(status_code=400, detail="没有提供任何图片文件。")
@@ -48,7 +53,7 @@ def submit_grading_task(
     
     # 2. 定义第二个任务的签名
     # 注意：这里我们不需要为它的第一个参数传值，Celery会自动将上一个任务的结果传入
-    pdf_task_signature = generate_pdf_report.s()
+    pdf_task_signature = generate_pdf_report.s(meta={"tenant_id": tenant_id, "class_id": class_id})
 
     # 3. 将两个任务链接成一个链条
     task_chain = chain(grading_task_signature, pdf_task_signature)
@@ -78,3 +83,47 @@ def get_task_result(task_id: str):
         response['result'] = str(task_result.info)
 
     return JSONResponse(content=response)
+
+
+@app.get("/similar/{run_id}", summary="查询近似重复的作文")
+def get_similar_essays(run_id: str, threshold: float = SIMILARITY_THRESHOLD, limit: int = 20):
+    index = get_dedup_index()
+    signature = index.get_signature(run_id)
+    if signature is None:
+        raise HTTPException(status_code=404, detail=f"索引中没有找到作文 {run_id}。")
+
+    matches = index.query(signature=signature, threshold=threshold, exclude=run_id, limit=limit)
+    return {"run_id": run_id, "threshold": threshold, "matches": matches}
+
+
+@app.get("/search", summary="检索历史批改报告")
+def search_reports(
+    q: Optional[str] = Query(None, description="关键词：原文/范文/错误句子与解释中的短语"),
+    tier: Optional[str] = Query(None, description="档次，如 第三档"),
+    min_score: Optional[float] = Query(None, description="最低总分"),
+    max_score: Optional[float] = Query(None, description="最高总分"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+):
+    return get_search_index().search(q, tier, min_score, max_score, page, page_size)
+
+
+@app.get("/analytics", summary="按学校/班级/日期上卷的批改统计")
+def get_analytics_rollup(
+    group_by: str = Query("tenant", description="分组字段，tenant/class/day 的逗号组合"),
+    tenant_id: Optional[str] = Query(None),
+    class_id: Optional[str] = Query(None),
+    start_day: Optional[str] = Query(None, description="起始日期 YYYY-MM-DD"),
+    end_day: Optional[str] = Query(None, description="结束日期 YYYY-MM-DD"),
+    top_errors: int = Query(10, ge=0, le=100, description="返回最常见的错误类型数量"),
+):
+    analytics = get_analytics()
+    try:
+        groups = analytics.rollup(tuple(group_by.split(",")), tenant_id, class_id, start_day, end_day)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "groups": groups,
+        "top_error_types": analytics.top_error_types(tenant_id, class_id, start_day, end_day, top_errors),
+    }
@@ -0,0 +1,212 @@
+"""
+本地 DashScope (OpenAI 兼容接口) 替身，用于压测和基准测试。
+
+不调用真实付费 API，两种回复模式:
+
+- replay (默认): 从 runs/*/qwen_essay_result.json 中回放历史批改结果
+- echo: 按提示词中的原文生成一份报告 (原文作为润色版本，每句一条分析)，
+  可被 app/ 润色服务的所有输出结构解析，用于测试其路由、对冲、重试和输出修复
+
+延迟、慢尾、503 错误和截断 JSON 的比例均可配置。
+
+用法:
+    python mock_dashscope.py --port 8900 --latency 8 --jitter 2
+    # 然后让 Celery worker 指向它:
+    DASHSCOPE_BASE_URL=http://127.0.0.1:8900/compatible-mode/v1 \
+        celery -A tasks.celery_app worker --loglevel=info
+
+    # 作为 app/ 的 stub 提供方:
+    python zuowen/mock_dashscope.py --reply echo --port 8901 --latency 1 --slow-rate 0.05 --slow-latency 20
+    LLM_PROVIDERS=stub LLM_STUB_BASE_URL=http://127.0.0.1:8901/v1 uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import glob
+import itertools
+import json
+import os
+import random
+import re
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# ==========================================
+# 1. 配置 (可由环境变量或命令行覆盖)
+# ==========================================
+RUNS_GLOB = os.getenv("MOCK_RUNS_GLOB", os.path.join("runs", "*", "qwen_essay_result.json"))
+LATENCY_SECONDS = float(os.getenv("MOCK_LATENCY", "8.0"))          # 基础延迟
+JITTER_SECONDS = float(os.getenv("MOCK_JITTER", "2.0"))            # 高斯抖动的标准差
+PER_KCHAR_SECONDS = float(os.getenv("MOCK_PER_KCHAR", "0.0"))      # 每 1000 字符输出额外延迟
+ERROR_RATE = float(os.getenv("MOCK_ERROR_RATE", "0.0"))            # 模拟 5xx 的概率
+SLOW_RATE = float(os.getenv("MOCK_SLOW_RATE", "0.0"))              # 慢请求（长尾）的概率
+SLOW_LATENCY_SECONDS = float(os.getenv("MOCK_SLOW_LATENCY", "20.0"))  # 慢请求的延迟
+MALFORMED_RATE = float(os.getenv("MOCK_MALFORMED_RATE", "0.0"))    # 返回截断 JSON 的概率
+REPLY_MODE = os.getenv("MOCK_REPLY", "replay")                     # replay / echo
+
+# echo 模式: app/ 提示词中原文的起止标记
+_TEXT_MARKERS = ("原始文本：\n", "文本片段：\n", "改动的句子：\n")
+_END_MARKERS = ("\n上下文信息：", "\n请严格按照", "\n请只输出")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def load_replay_outputs(pattern=RUNS_GLOB):
+    """读取历史批改结果，作为回放的模型输出 (保持原始 JSON 字符串)。"""
+    outputs = []
+    for path in sorted(glob.glob(pattern)):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ [Mock] 跳过无法读取的结果文件 {path}: {e}")
+            continue
+        outputs.append(json.dumps(data, ensure_ascii=False))
+    if not outputs:
+        raise RuntimeError(f"没有找到可回放的结果文件: {pattern}")
+    print(f"📦 [Mock] 已加载 {len(outputs)} 份历史批改结果用于回放")
+    return outputs
+
+
+def extract_text(prompt):
+    """echo 模式: 取出提示词中的作文原文（或改动的句子）。"""
+    for marker in _TEXT_MARKERS:
+        start = prompt.find(marker)
+        if start >= 0:
+            start += len(marker)
+            ends = [i for i in (prompt.find(m, start) for m in _END_MARKERS) if i >= 0]
+            return prompt[start:min(ends) if ends else len(prompt)].strip()
+    return prompt.strip()
+
+
+def build_echo_reply(prompt):
+    """echo 模式: 生成满足 app/ 所有输出结构的报告。"""
+    text = extract_text(prompt)
+    sentences = [s for line in text.splitlines() for s in _SENTENCE_RE.split(line) if s.strip()]
+    return json.dumps({
+        "writing_goal_analysis": "Stub analysis of the writing goal.",
+        "sentence_analysis": [
+            {"original": s.strip(), "error": None, "correction": None, "suggestion": None}
+            for s in sentences
+        ],
+        "polished_version": text,
+    }, ensure_ascii=False)
+
+
+def _sample_latency(content_length):
+    if SLOW_RATE > 0 and random.random() < SLOW_RATE:
+        _stats["slow"] += 1
+        return SLOW_LATENCY_SECONDS
+    latency = random.gauss(LATENCY_SECONDS, JITTER_SECONDS) if JITTER_SECONDS > 0 else LATENCY_SECONDS
+    latency += PER_KCHAR_SECONDS * content_length / 1000.0
+    return max(0.0, latency)
+
+
+# ==========================================
+# 2. OpenAI 兼容的 chat.completions 接口
+# ==========================================
+app = FastAPI(title="DashScope Mock", description="回放 runs/ 历史结果的 OpenAI 兼容模拟服务")
+_outputs = []
+_cycle = None
+_stats = {"requests": 0, "errors": 0, "slow": 0, "malformed": 0}
+
+
+@app.on_event("startup")
+async def _load_outputs():
+    global _outputs, _cycle
+    if REPLY_MODE == "echo":
+        return
+    if not _outputs:
+        _outputs = load_replay_outputs()
+    _cycle = itertools.cycle(_outputs)
+
+
+async def _chat_completions(request: Request):
+    body = await request.json()
+    _stats["requests"] += 1
+    prompt = "\n".join(
+        m["content"] if isinstance(m.get("content"), str) else ""
+        for m in body.get("messages", [])
+    )
+    content = build_echo_reply(prompt) if REPLY_MODE == "echo" else next(_cycle)
+
+    await asyncio.sleep(_sample_latency(len(content)))
+
+    if ERROR_RATE > 0 and random.random() < ERROR_RATE:
+        _stats["errors"] += 1
+        return JSONResponse(
+            status_code=503,
+            content={"error": {"message": "mock upstream overloaded", "type": "server_error"}},
+        )
+
+    if MALFORMED_RATE > 0 and random.random() < MALFORMED_RATE:
+        # 模拟生成被截断
+        _stats["malformed"] += 1
+        content = content[: max(1, int(len(content) * 0.8))]
+
+    return {
+        "id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "qwen-vl-max"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": len(prompt) // 4,
+            "completion_tokens": len(content) // 2,
+            "total_tokens": len(content) // 2,
+        },
+    }
+
+
+# 同时兼容 base_url=.../v1 和 DashScope 的 .../compatible-mode/v1
+app.add_api_route("/v1/chat/completions", _chat_completions, methods=["POST"])
+app.add_api_route("/compatible-mode/v1/chat/completions", _chat_completions, methods=["POST"])
+
+
+@app.get("/stats")
+def get_stats():
+    return {**_stats, "reply_mode": REPLY_MODE, "replay_outputs": len(_outputs)}
+
+
+# ==========================================
+# 3. 主程序入口
+# ==========================================
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="本地 DashScope 替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--runs", default=RUNS_GLOB, help="回放结果文件的 glob")
+    parser.add_argument("--latency", type=float, default=LATENCY_SECONDS, help="基础延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=JITTER_SECONDS, help="延迟抖动标准差（秒）")
+    parser.add_argument("--per-kchar", type=float, default=PER_KCHAR_SECONDS, help="每 1000 字符输出的额外延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE, help="返回 503 的概率 (0~1)")
+    parser.add_argument("--slow-rate", type=float, default=SLOW_RATE, help="慢请求的概率 (0~1)")
+    parser.add_argument("--slow-latency", type=float, default=SLOW_LATENCY_SECONDS, help="慢请求的延迟（秒）")
+    parser.add_argument("--malformed-rate", type=float, default=MALFORMED_RATE, help="返回截断 JSON 的概率 (0~1)")
+    parser.add_argument("--reply", choices=("replay", "echo"), default=REPLY_MODE, help="回复模式")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子，便于复现")
+    args = parser.parse_args()
+
+    LATENCY_SECONDS = args.latency
+    JITTER_SECONDS = args.jitter
+    PER_KCHAR_SECONDS = args.per_kchar
+    ERROR_RATE = args.error_rate
+    SLOW_RATE = args.slow_rate
+    SLOW_LATENCY_SECONDS = args.slow_latency
+    MALFORMED_RATE = args.malformed_rate
+    REPLY_MODE = args.reply
+    if args.seed is not None:
+        random.seed(args.seed)
+    if REPLY_MODE == "replay":
+        _outputs = load_replay_outputs(args.runs)
+
+    uvicorn.run(app, host=args.host, port=args.port)
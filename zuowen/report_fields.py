@@ -0,0 +1,44 @@
+"""
+批改结果 JSON 字段的解析工具 (供查重、检索、统计等索引共用)。
+"""
+import re
+
+_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def parse_score(value):
+    """
+    把模型输出的分数字符串转成数字。
+
+    模型输出格式不统一："18分"、"15/25"、"4/5"、"15" 或直接是数字，
+    统一取第一个数字 (分子)；无法解析时返回 None。
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER_RE.search(str(value))
+    return float(match.group()) if match else None
+
+
+_TIER_NUMERALS = {"一": 1, "二": 2, "三": 3, "四": 4, "五": 5}
+_TIER_RE = re.compile(r"第\s*([一二三四五1-5])\s*档")
+
+
+def parse_tier(value):
+    """把 "第三档" / "第3档" 解析为 1~5 的档次数字 (第五档最好)；无法解析时返回 None。"""
+    if not value:
+        return None
+    match = _TIER_RE.search(str(value))
+    if not match:
+        return None
+    level = match.group(1)
+    return _TIER_NUMERALS.get(level) or int(level)
+
+
+_TIER_LABELS = {level: f"第{numeral}档" for numeral, level in _TIER_NUMERALS.items()}
+
+
+def tier_label(level):
+    """parse_tier 的逆运算：把 1~5 转回报告中的写法，如 3 -> "第三档"。"""
+    return _TIER_LABELS.get(level, f"第{level}档")
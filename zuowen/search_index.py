@@ -0,0 +1,230 @@
+"""
+历史批改报告全文检索索引 (SQLite FTS5)。
+
+- 覆盖原文、范文、逐句错误 (原句/修正/类型/解释)；
+- 档次、总分作为结构化列，可以和全文条件组合过滤；
+- 每份报告在 generate_pdf_report 完成时增量写入，不需要再逐个打开 runs/ 下的 JSON。
+
+用法:
+    python search_index.py --rebuild                # 从 runs/ 重建索引
+    python search_index.py --query "subject verb" --tier 第三档
+"""
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from report_fields import parse_score
+
+# ==========================================
+# 1. 配置
+# ==========================================
+INDEX_DB_PATH = os.getenv("ESSAY_INDEX_DB", "essay_index.db")
+MAX_PAGE_SIZE = 100
+# trigram 分词同时支持英文短语和中文子串；少于 3 个字符的词无法走索引
+MIN_TOKEN_CHARS = 3
+
+
+def _errors_text(data):
+    """把逐句错误展开成一段可检索文本。"""
+    parts = []
+    for item in data.get("detailed_errors", []) or []:
+        for key in ("type", "original_sentence", "correction", "explanation"):
+            value = item.get(key)
+            if value:
+                parts.append(str(value))
+    for items in (data.get("error_summary") or {}).values():
+        parts.extend(str(item) for item in items or [])
+    return "\n".join(parts)
+
+
+def _fts_query(q):
+    """把用户输入转成 FTS5 查询：每个词作为带引号的短语，多个词之间为 AND。"""
+    terms = [t.replace('"', '""') for t in q.split() if t]
+    return " AND ".join(f'"{t}"' for t in terms)
+
+
+class ReportSearchIndex:
+    """批改报告的 FTS5 全文索引 + 档次/总分结构化列。"""
+
+    def __init__(self, db_path=INDEX_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._init_schema()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS report_meta (
+                rowid INTEGER PRIMARY KEY,
+                run_id TEXT NOT NULL UNIQUE,
+                tier TEXT,
+                total_score REAL,
+                brief_comment TEXT,
+                indexed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_report_meta_tier ON report_meta(tier);
+            CREATE INDEX IF NOT EXISTS idx_report_meta_score ON report_meta(total_score);
+            CREATE VIRTUAL TABLE IF NOT EXISTS report_fts USING fts5(
+                original_text, revised_text, errors,
+                tokenize='trigram'
+            );
+            """
+        )
+        conn.commit()
+
+    def add_report(self, run_id, data):
+        """写入 (或覆盖) 一份报告；report_fts 与 report_meta 共用 rowid。"""
+        overall = data.get("overall_evaluation") or {}
+        conn = self._conn()
+        with conn:
+            row = conn.execute("SELECT rowid FROM report_meta WHERE run_id = ?", (run_id,)).fetchone()
+            if row:
+                conn.execute("DELETE FROM report_fts WHERE rowid = ?", (row[0],))
+                conn.execute("DELETE FROM report_meta WHERE rowid = ?", (row[0],))
+            cursor = conn.execute(
+                "INSERT INTO report_meta (run_id, tier, total_score, brief_comment, indexed_at) VALUES (?, ?, ?, ?, ?)",
+                (
+                    run_id,
+                    overall.get("tier"),
+                    parse_score(overall.get("total_score")),
+                    overall.get("brief_comment"),
+                    time.time(),
+                ),
+            )
+            conn.execute(
+                "INSERT INTO report_fts (rowid, original_text, revised_text, errors) VALUES (?, ?, ?, ?)",
+                (
+                    cursor.lastrowid,
+                    data.get("original_text", ""),
+                    data.get("revised_text", ""),
+                    _errors_text(data),
+                ),
+            )
+
+    def search(self, q=None, tier=None, min_score=None, max_score=None, page=1, page_size=20):
+        """
+        分页检索。
+
+        q 为空时只按结构化条件过滤 (按总分降序)；否则按 bm25 相关度排序并返回命中片段。
+        返回 {"total": ..., "page": ..., "page_size": ..., "items": [...]}。
+        """
+        page = max(1, int(page))
+        page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+        conditions, params = [], []
+        if tier:
+            conditions.append("m.tier = ?")
+            params.append(tier)
+        if min_score is not None:
+            conditions.append("m.total_score >= ?")
+            params.append(min_score)
+        if max_score is not None:
+            conditions.append("m.total_score <= ?")
+            params.append(max_score)
+
+        terms = (q or "").split()
+        if terms and all(len(t) >= MIN_TOKEN_CHARS for t in terms):
+            source = "report_fts f JOIN report_meta m ON m.rowid = f.rowid"
+            conditions.insert(0, "report_fts MATCH ?")
+            params.insert(0, _fts_query(q))
+            snippet = "snippet(report_fts, -1, '[', ']', '…', 16)"
+            order = "bm25(report_fts)"
+        elif terms:
+            # 过短的词 (如两个汉字的“时态”) 走 LIKE 扫描，结果一致但没有索引加速
+            source = "report_fts f JOIN report_meta m ON m.rowid = f.rowid"
+            for t in terms:
+                conditions.append("(f.original_text LIKE ? OR f.revised_text LIKE ? OR f.errors LIKE ?)")
+                params.extend([f"%{t}%"] * 3)
+            snippet = "NULL"
+            order = "m.total_score DESC"
+        else:
+            source = "report_meta m"
+            snippet = "NULL"
+            order = "m.total_score DESC"
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        conn = self._conn()
+        total = conn.execute(f"SELECT COUNT(*) FROM {source} {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT m.run_id, m.tier, m.total_score, m.brief_comment, {snippet} "
+            f"FROM {source} {where} ORDER BY {order} LIMIT ? OFFSET ?",
+            params + [page_size, (page - 1) * page_size],
+        ).fetchall()
+        return {
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "items": [
+                {
+                    "run_id": run_id,
+                    "tier": tier_value,
+                    "total_score": score,
+                    "brief_comment": comment,
+                    "snippet": snip,
+                }
+                for run_id, tier_value, score, comment, snip in rows
+            ],
+        }
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM report_meta").fetchone()[0]
+
+
+_index = None
+
+
+def get_index():
+    """进程内单例。"""
+    global _index
+    if _index is None:
+        _index = ReportSearchIndex()
+    return _index
+
+
+def rebuild_from_runs(runs_folder="runs"):
+    index = get_index()
+    total = 0
+    for path in sorted(glob.glob(os.path.join(runs_folder, "*", "qwen_essay_result.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index.add_report(os.path.basename(os.path.dirname(path)), data)
+        total += 1
+    return total
+
+
+# ==========================================
+# 2. 主程序入口
+# ==========================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批改报告全文检索 (SQLite FTS5)")
+    parser.add_argument("--rebuild", action="store_true", help="从 runs/ 目录重建索引")
+    parser.add_argument("--query", help="检索关键词")
+    parser.add_argument("--tier", help="按档次过滤，如 第三档")
+    parser.add_argument("--min-score", type=float)
+    parser.add_argument("--max-score", type=float)
+    parser.add_argument("--page", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.rebuild:
+        n = rebuild_from_runs()
+        print(f"✅ 已索引 {n} 份报告，索引总数: {get_index().count()}")
+    if args.query or args.tier or args.min_score is not None or args.max_score is not None:
+        start = time.perf_counter()
+        result = get_index().search(args.query, args.tier, args.min_score, args.max_score, args.page)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"🔍 查询耗时 {elapsed_ms:.3f} ms，共 {result['total']} 条")
+        for item in result["items"]:
+            print(f"  {item['run_id']} {item['tier']} {item['total_score']}  {item['snippet'] or ''}")
@@ -8,6 +8,9 @@ import dirtyjson
 from datetime import datetime
 from openai import OpenAI
 from celery_utils import celery_app
+from dedup_index import get_index as get_dedup_index
+from search_index import get_index as get_search_index
+from analytics import get_analytics
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -19,9 +22,12 @@ api_key = os.getenv("DASHSCOPE_API_KEY")
 if not api_key:
     raise ValueError("错误：找不到 API Key。...")
 
+# 压测时可指向本地替身服务 (mock_dashscope.py)，避免调用真实付费 API
+DASHSCOPE_BASE_URL = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+
 client = OpenAI(
     api_key=api_key,
-    base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+    base_url=DASHSCOPE_BASE_URL,
     timeout=120.0,
     max_retries=3,
 )
@@ -162,7 +168,7 @@ def grade_essay_multipage(image_path_list, prompt_text):
         return {"error": str(e)}
 
 @celery_app.task
-def generate_pdf_report(previous_result):
+def generate_pdf_report(previous_result, meta=None):
     if 'error' in previous_result:
         return previous_result
 
@@ -202,13 +208,19 @@ def generate_pdf_report(previous_result):
         pdf_generation_time = time.time() - start_time
         print(f"✅ [PDF Task] PDF 和 JSON 已保存至: {run_dir}")
 
+        # 3. 增量更新索引 (查重、全文检索、统计看板)，失败不影响本次批改结果
+        index_result = index_report(run_dir, data, meta)
+
         return {
             "json_path": json_path,
             "pdf_path": pdf_path,
+            **index_result,
             "timing": {
                 "json_generation": previous_result['timing']['json_generation'],
                 "pdf_generation": pdf_generation_time,
-                "total": previous_result['timing']['json_generation'] + pdf_generation_time
+                "total": previous_result['timing']['json_generation'] + pdf_generation_time,
+                # 任务链完成的服务端时间戳，压测用它计算端到端耗时，不受轮询间隔影响
+                "finished_at": time.time(),
             }
         }
 
@@ -222,6 +234,28 @@ def generate_pdf_report(previous_result):
         return {"error": f"PDF generation failed: {e}"} 
 
 
+def index_report(run_dir, data, meta=None):
+    """报告完成后增量写入索引；索引出错只打印警告，不让已完成的批改失败。"""
+    run_id = os.path.basename(run_dir)
+    meta = meta or {}
+    result = {"near_duplicates": []}
+    try:
+        result["near_duplicates"] = get_dedup_index().add_and_query(run_id, data.get("original_text", ""))
+        if result["near_duplicates"]:
+            print(f"🔍 [Index] {run_id} 发现 {len(result['near_duplicates'])} 篇近似作文")
+    except Exception as e:
+        print(f"⚠️ [Index] 查重索引更新失败: {e}")
+    try:
+        get_search_index().add_report(run_id, data)
+    except Exception as e:
+        print(f"⚠️ [Index] 全文检索索引更新失败: {e}")
+    try:
+        get_analytics().record_report(run_id, data, tenant_id=meta.get("tenant_id"), class_id=meta.get("class_id"))
+    except Exception as e:
+        print(f"⚠️ [Index] 统计汇总更新失败: {e}")
+    return result
+
+
 def encode_image(image_path):
     if not os.path.exists(image_path):
         return None